@@ -9,7 +9,9 @@ from types import GenericAlias
 from typing import Annotated, get_origin
 
 from ai_providers.chatglm.comfyUI_api import ComfyUIApi
+from function.func_city import resolve_city
 from function.func_news import News
+from function.func_weather import Weather
 from zhdate import ZhDate
 
 _TOOL_HOOKS = {}
@@ -106,6 +108,11 @@ def get_weather(
     if not isinstance(city_name, str):
         raise TypeError("City name must be a string")
 
+    # 国内城市（含拼音别名）走城市索引和天气接口，找不到时再查 wttr.in（支持国外城市）
+    resolved = resolve_city(city_name)
+    if resolved:
+        return Weather(resolved[1]).get_weather()
+
     key_selection = {
         "current_condition": ["temp_C", "FeelsLikeC", "humidity", "weatherDesc", "observation_time"],
     }
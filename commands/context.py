@@ -16,6 +16,8 @@ class MessageContext:
     robot_wxid: str            # 机器人自身的 wxid
     robot: Any = None          # Robot 实例，用于访问其方法和属性
     logger: Any = None         # 日志记录器
+    contact_cache: Any = None  # 群昵称/群成员缓存 (ContactCache)，为空时直接调用 wcf
+    msg_data: Optional[Dict[str, Any]] = None  # 消息XML解析结果 (XmlProcessor.parse_message)，每条消息只解析一次
 
     # 预处理字段
     text: str = ""             # 预处理后的纯文本消息 (去@, 去空格)
@@ -33,7 +35,10 @@ class MessageContext:
             return {}
         if self._room_members is None:
             try:
-                self._room_members = self.wcf.get_chatroom_members(self.msg.roomid)
+                if self.contact_cache:
+                    self._room_members = self.contact_cache.get_members(self.msg.roomid)
+                else:
+                    self._room_members = self.wcf.get_chatroom_members(self.msg.roomid)
             except Exception as e:
                 if self.logger:
                     self.logger.error(f"获取群 {self.msg.roomid} 成员失败: {e}")
@@ -47,7 +52,10 @@ class MessageContext:
         if self.is_group:
             try:
                 # 尝试获取群昵称
-                alias = self.wcf.get_alias_in_chatroom(self.msg.sender, self.msg.roomid)
+                if self.contact_cache:
+                    alias = self.contact_cache.get_alias(self.msg.sender, self.msg.roomid)
+                else:
+                    alias = self.wcf.get_alias_in_chatroom(self.msg.sender, self.msg.roomid)
                 if alias and alias.strip():
                     return alias
             except Exception as e:
@@ -68,7 +76,7 @@ class MessageContext:
         发送文本消息
         :param content: 消息内容
         :param at_list: 要@的用户列表，多个用逗号分隔
-        :return: 是否发送成功
+        :return: 是否成功加入发送队列（实际发送由机器人的发送线程异步完成）
         """
         if self.robot and hasattr(self.robot, "sendTextMsg"):
             receiver = self.get_receiver()
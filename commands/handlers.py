@@ -4,7 +4,8 @@ from typing import Optional, Match, Dict, Any
 import json # 确保已导入json
 from datetime import datetime # 确保已导入datetime
 import os # 导入os模块用于文件路径操作
-from function.func_duel import DuelRankSystem 
+from function.func_duel import get_rank_system, DUEL_QUEUED, DUEL_REJECTED
+from function.func_reminder_parser import parse_reminder
 
 # 导入AI模型
 from ai_providers.ai_deepseek import DeepSeek
@@ -112,7 +113,7 @@ def handle_duel(ctx: 'MessageContext', match: Optional[Match]) -> bool:
 
     # --- 新增：决斗资格检查 (包括分数和 Boss 战) ---
     try:
-        rank_system = DuelRankSystem(group_id)
+        rank_system = get_rank_system(group_id)
         # 获取双方玩家数据和分数
         challenger_data = rank_system.get_player_data(challenger_name)
         opponent_data = rank_system.get_player_data(opponent_name)
@@ -173,9 +174,13 @@ def handle_duel(ctx: 'MessageContext', match: Optional[Match]) -> bool:
     # 使用决斗管理器启动决斗 (只有通过所有检查才会执行到这里)
     if ctx.robot and hasattr(ctx.robot, "duel_manager"):
         duel_manager = ctx.robot.duel_manager
-        # 注意：start_duel_thread 现在只会在资格检查通过后被调用
-        if not duel_manager.start_duel_thread(challenger_name, opponent_name, group_id, True):
-            ctx.send_text("⚠️ 目前有其他决斗正在进行中，请稍后再试！")
+        # 注意：request_duel 现在只会在资格检查通过后被调用
+        status, ahead = duel_manager.request_duel(challenger_name, opponent_name, group_id, True)
+        if status == DUEL_QUEUED:
+            waiting = f"，本群前面还有 {ahead} 场" if ahead else ""
+            ctx.send_text(f"⏳ 决斗场正忙，{challenger_name} 与 {opponent_name} 的决斗已排队{waiting}，轮到时会自动开始")
+        elif status == DUEL_REJECTED:
+            ctx.send_text("⚠️ 本群排队的决斗太多了，请稍后再试！")
         # 决斗管理器内部会发送消息，所以这里不需要额外发送
         
         # 尝试触发馈赠
@@ -301,10 +306,10 @@ def handle_check_equipment(ctx: 'MessageContext', match: Optional[Match]) -> boo
         return True
     
     try:
-        from function.func_duel import DuelRankSystem
+        from function.func_duel import get_rank_system
         
         player_name = ctx.sender_name
-        rank_system = DuelRankSystem(ctx.msg.roomid)
+        rank_system = get_rank_system(ctx.msg.roomid)
         player_data = rank_system.get_player_data(player_name)
         
         if not player_data:
@@ -432,7 +437,8 @@ def handle_summary(ctx: 'MessageContext', match: Optional[Match]) -> bool:
         
         # 使用MessageSummary生成总结
         if ctx.robot and hasattr(ctx.robot, "message_summary") and hasattr(ctx.robot, "chat"):
-            summary = ctx.robot.message_summary.summarize_messages(chat_id, ctx.robot.chat)
+            chat_model = getattr(ctx, 'chat', None) or ctx.robot.chat
+            summary = ctx.robot.message_summary.summarize_messages(chat_id, chat_model)
             
             # 发送总结
             ctx.send_text(summary)
@@ -580,19 +586,22 @@ def handle_chengyu(ctx: 'MessageContext', match: Optional[Match]) -> bool:
     text = match.group(2)  # 成语文本
     
     try:
-        from function.func_chengyu import cy
+        from function.func_chengyu import cy, chengyu_game
         
         if flag == "#":  # 接龙
-            if cy.isChengyu(text):
-                rsp = cy.getNext(text)
-                if rsp:
-                    ctx.send_text(rsp)
-                    
-                    # 尝试触发馈赠
-                    if ctx.is_group and hasattr(ctx.robot, "goblin_gift_manager"):
-                        ctx.robot.goblin_gift_manager.try_trigger(ctx.msg)
-                    
-                    return True
+            if text.strip() in ("结束接龙", "结束"):
+                rsp = chengyu_game.end(ctx.get_receiver())
+                ctx.send_text(rsp or "当前没有进行中的成语接龙")
+                return True
+            rsp = chengyu_game.play(ctx.get_receiver(), ctx.sender_name, text)
+            if rsp:
+                ctx.send_text(rsp)
+                
+                # 尝试触发馈赠
+                if ctx.is_group and hasattr(ctx.robot, "goblin_gift_manager"):
+                    ctx.robot.goblin_gift_manager.try_trigger(ctx.msg)
+                
+                return True
         elif flag in ["?", "？"]:  # 查词
             if cy.isChengyu(text):
                 rsp = cy.getMeaning(text)
@@ -635,9 +644,9 @@ def handle_chitchat(ctx: 'MessageContext', match: Optional[Match]) -> bool:
     if ctx.robot and hasattr(ctx.robot, "xml_processor"):
         # 创建格式化的聊天内容（带有引用消息等）
         # 原始代码中是从xml_processor获取的
+        msg_data = ctx.msg_data if ctx.msg_data is not None else ctx.robot.xml_processor.parse_message(ctx.msg, ctx.is_group)
         if ctx.is_group:
             # 处理群聊消息
-            msg_data = ctx.robot.xml_processor.extract_quoted_message(ctx.msg)
             q_with_info = ctx.robot.xml_processor.format_message_for_ai(msg_data, sender_name)
             # 打印详细的消息数据，用于调试
             if ctx.logger:
@@ -645,7 +654,6 @@ def handle_chitchat(ctx: 'MessageContext', match: Optional[Match]) -> bool:
                 ctx.logger.info(f"【调试】提取的卡片信息: {msg_data}")
         else:
             # 处理私聊消息
-            msg_data = ctx.robot.xml_processor.extract_private_quoted_message(ctx.msg)
             q_with_info = ctx.robot.xml_processor.format_message_for_ai(msg_data, sender_name)
             # 打印详细的消息数据，用于调试
             if ctx.logger:
@@ -826,12 +834,8 @@ def handle_perplexity_ask(ctx: 'MessageContext', match: Optional[Match]) -> bool
             try:
                 # 格式化消息，与 handle_chitchat 保持一致
                 if ctx.robot and hasattr(ctx.robot, "xml_processor"):
-                    if ctx.is_group:
-                        msg_data = ctx.robot.xml_processor.extract_quoted_message(ctx.msg)
-                        q_with_info = ctx.robot.xml_processor.format_message_for_ai(msg_data, ctx.sender_name)
-                    else:
-                        msg_data = ctx.robot.xml_processor.extract_private_quoted_message(ctx.msg)
-                        q_with_info = ctx.robot.xml_processor.format_message_for_ai(msg_data, ctx.sender_name)
+                    msg_data = ctx.msg_data if ctx.msg_data is not None else ctx.robot.xml_processor.parse_message(ctx.msg, ctx.is_group)
+                    q_with_info = ctx.robot.xml_processor.format_message_for_ai(msg_data, ctx.sender_name)
                     
                     if not q_with_info:
                         import time
@@ -901,31 +905,35 @@ def handle_reminder(ctx: 'MessageContext', match: Optional[Match]) -> bool:
     current_dt_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     formatted_prompt = sys_prompt.format(current_datetime=current_dt_str)
 
-    # 4. 调用AI模型并解析
+    # 4. 先用规则解析常见说法，解析不了再调用AI模型
     q_for_ai = f"请解析以下用户提醒:\n{raw_text}"
-    data = None
+    data = parse_reminder(raw_text)
     try:
-        # 检查AI模型
-        if not hasattr(ctx, 'chat') or not ctx.chat:
-            raise ValueError("当前上下文中没有可用的AI模型")
-            
-        # 获取AI回答
         at_list = ctx.msg.sender if ctx.is_group else ""
-        ai_response = ctx.chat.get_answer(q_for_ai, ctx.get_receiver(), system_prompt_override=formatted_prompt)
-        
-        # 尝试提取和解析JSON
-        json_str = None
-        json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
+        if data is not None:
+            if ctx.logger:
+                ctx.logger.info(f"规则解析提醒命中，跳过AI: {raw_text}")
         else:
-            json_str = ai_response
+            # 检查AI模型
+            if not hasattr(ctx, 'chat') or not ctx.chat:
+                raise ValueError("当前上下文中没有可用的AI模型")
+                
+            # 获取AI回答
+            ai_response = ctx.chat.get_answer(q_for_ai, ctx.get_receiver(), system_prompt_override=formatted_prompt)
             
-        try:
-            data = json.loads(json_str)
-        except:
-            ctx.send_text("❌ 无法解析AI的回复为有效的JSON格式", at_list)
-            return True
+            # 尝试提取和解析JSON
+            json_str = None
+            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
+            if json_match:
+                json_str = json_match.group(0)
+            else:
+                json_str = ai_response
+                
+            try:
+                data = json.loads(json_str)
+            except:
+                ctx.send_text("❌ 无法解析AI的回复为有效的JSON格式", at_list)
+                return True
             
         # 验证数据
         if not data.get("type") or not data.get("time") or not data.get("content"):
@@ -1145,45 +1153,20 @@ def handle_weather(ctx: 'MessageContext', match: Optional[Match]) -> bool:
     if ctx.logger:
         ctx.logger.info(f"天气查询指令匹配: 城市={city_name}")
 
-    # --- 加载城市代码 ---
-    city_codes: Dict[str, str] = {}
-    city_code_path = os.path.join(os.path.dirname(__file__), '..', 'function', 'main_city.json') # 确保路径正确
-    try:
-        with open(city_code_path, 'r', encoding='utf-8') as f:
-            city_codes = json.load(f)
-    except FileNotFoundError:
-        if ctx.logger:
-            ctx.logger.error(f"城市代码文件未找到: {city_code_path}")
-        ctx.send_text("⚠️ 抱歉，天气功能所需的城市列表文件丢失了。")
-        return True
-    except json.JSONDecodeError:
-        if ctx.logger:
-            ctx.logger.error(f"无法解析城市代码文件: {city_code_path}")
-        ctx.send_text("⚠️ 抱歉，天气功能的城市列表文件格式错误。")
+    # --- 解析城市代码（城市索引在进程内只构建一次） ---
+    from function.func_city import get_city_resolver
+    resolver = get_city_resolver()
+    if resolver.error:
+        ctx.send_text("⚠️ 抱歉，天气功能所需的城市列表加载失败了。")
         return True
-    except Exception as e:
-         if ctx.logger:
-            ctx.logger.error(f"加载城市代码时发生未知错误: {e}", exc_info=True)
-         ctx.send_text("⚠️ 抱歉，加载城市代码时发生错误。")
-         return True
-    # --- 城市代码加载完毕 ---
-
-    city_code = city_codes.get(city_name)
 
-    if not city_code:
-        # 尝试模糊匹配 (可选，如果需要)
-        found = False
-        for name, code in city_codes.items():
-            if city_name in name: # 如果输入的名字是城市全名的一部分
-                city_code = code
-                city_name = name # 使用找到的完整城市名
-                if ctx.logger:
-                    ctx.logger.info(f"城市 '{match.group(1).strip()}' 未精确匹配，使用模糊匹配结果: {city_name} ({city_code})")
-                found = True
-                break
-        if not found:
-            ctx.send_text(f"😕 找不到城市 '{city_name}' 的天气信息，请检查城市名称是否正确。")
-            return True
+    resolved = resolver.resolve(city_name)
+    if not resolved:
+        ctx.send_text(f"😕 找不到城市 '{city_name}' 的天气信息，请检查城市名称是否正确。")
+        return True
+    if resolved[0] != city_name and ctx.logger:
+        ctx.logger.info(f"城市 '{city_name}' 未精确匹配，使用模糊匹配结果: {resolved[0]} ({resolved[1]})")
+    city_name, city_code = resolved
 
     # 获取天气信息
     try:
@@ -1214,45 +1197,20 @@ def handle_weather_forecast(ctx: 'MessageContext', match: Optional[Match]) -> bo
     if ctx.logger:
         ctx.logger.info(f"天气预报查询指令匹配: 城市={city_name}")
 
-    # --- 加载城市代码 ---
-    city_codes: Dict[str, str] = {}
-    city_code_path = os.path.join(os.path.dirname(__file__), '..', 'function', 'main_city.json') # 确保路径正确
-    try:
-        with open(city_code_path, 'r', encoding='utf-8') as f:
-            city_codes = json.load(f)
-    except FileNotFoundError:
-        if ctx.logger:
-            ctx.logger.error(f"城市代码文件未找到: {city_code_path}")
-        ctx.send_text("⚠️ 抱歉，天气功能所需的城市列表文件丢失了。")
-        return True
-    except json.JSONDecodeError:
-        if ctx.logger:
-            ctx.logger.error(f"无法解析城市代码文件: {city_code_path}")
-        ctx.send_text("⚠️ 抱歉，天气功能的城市列表文件格式错误。")
+    # --- 解析城市代码（城市索引在进程内只构建一次） ---
+    from function.func_city import get_city_resolver
+    resolver = get_city_resolver()
+    if resolver.error:
+        ctx.send_text("⚠️ 抱歉，天气功能所需的城市列表加载失败了。")
         return True
-    except Exception as e:
-         if ctx.logger:
-            ctx.logger.error(f"加载城市代码时发生未知错误: {e}", exc_info=True)
-         ctx.send_text("⚠️ 抱歉，加载城市代码时发生错误。")
-         return True
-    # --- 城市代码加载完毕 ---
-
-    city_code = city_codes.get(city_name)
 
-    if not city_code:
-        # 尝试模糊匹配 (可选，如果需要)
-        found = False
-        for name, code in city_codes.items():
-            if city_name in name: # 如果输入的名字是城市全名的一部分
-                city_code = code
-                city_name = name # 使用找到的完整城市名
-                if ctx.logger:
-                    ctx.logger.info(f"城市 '{match.group(1).strip()}' 未精确匹配，使用模糊匹配结果: {city_name} ({city_code})")
-                found = True
-                break
-        if not found:
-            ctx.send_text(f"😕 找不到城市 '{city_name}' 的天气信息，请检查城市名称是否正确。")
-            return True
+    resolved = resolver.resolve(city_name)
+    if not resolved:
+        ctx.send_text(f"😕 找不到城市 '{city_name}' 的天气信息，请检查城市名称是否正确。")
+        return True
+    if resolved[0] != city_name and ctx.logger:
+        ctx.logger.info(f"城市 '{city_name}' 未精确匹配，使用模糊匹配结果: {resolved[0]} ({resolved[1]})")
+    city_name, city_code = resolved
 
     # 获取天气信息 (包含预报)
     try:
@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from typing import Any, Collection
+
+from constants import MsgType
+
+# 分流动作
+ACTION_SKIP = "skip"                      # 无需处理
+ACTION_FRIEND_REQUEST = "friend_request"  # 好友请求
+ACTION_SYSTEM = "system"                  # 系统消息（入群欢迎、新好友）
+ACTION_FULL = "full"                      # 完整流程：模型选择、预处理、命令路由
+
+# 需要完整处理的消息类型：文本和App消息（引用、卡片）
+_CONTENT_TYPES = (MsgType.TEXT, MsgType.APP)
+
+
+@dataclass
+class MessageTriage:
+    """
+    消息分流结果，决定一条消息需要经过哪些处理阶段
+    """
+    action: str                   # 分流动作，见 ACTION_* 常量
+    record_history: bool = False  # 是否需要写入消息历史（供总结使用）
+    reason: str = ""              # 分流原因，便于调试
+
+
+def triage_message(msg: Any, enabled_groups: Collection[str]) -> MessageTriage:
+    """
+    在进入消息历史、模型选择、预处理之前对消息做廉价分流，
+    只读取 WxMsg 的本地字段，不发起任何 wcf 调用
+    :param msg: 原始 WxMsg 对象
+    :param enabled_groups: 允许响应的群 roomid 集合
+    :return: MessageTriage
+    """
+    msg_type = msg.type
+    is_group = msg.from_group()
+
+    if msg_type == MsgType.FRIEND_REQUEST:
+        return MessageTriage(ACTION_FRIEND_REQUEST, reason="好友请求")
+
+    if msg_type == MsgType.SYSTEM:
+        return MessageTriage(ACTION_SYSTEM, reason="系统消息")
+
+    if msg_type not in _CONTENT_TYPES:
+        return MessageTriage(ACTION_SKIP, reason=f"不处理的消息类型 {msg_type}")
+
+    if is_group:
+        if msg.roomid not in enabled_groups:
+            return MessageTriage(ACTION_SKIP, reason=f"群 {msg.roomid} 未启用")
+        return MessageTriage(ACTION_FULL, record_history=not msg.from_self(), reason="群聊消息")
+
+    if msg.sender.startswith("gh_"):
+        return MessageTriage(ACTION_SKIP, reason="公众号消息")
+
+    return MessageTriage(ACTION_FULL, reason="私聊消息")
@@ -45,7 +45,15 @@ class Config(object):
         self.ZhiPu = yconfig.get("zhipu", {})
         self.DEEPSEEK = yconfig.get("deepseek", {})
         self.PERPLEXITY = yconfig.get("perplexity", {})
+        self.GOBLIN_GIFT = yconfig.get("goblin_gift", {})
         self.COGVIEW = yconfig.get("cogview", {})
         self.ALIYUN_IMAGE = yconfig.get("aliyun_image", {})
         self.GEMINI_IMAGE = yconfig.get("gemini_image", {})
         self.SEND_RATE_LIMIT = yconfig.get("send_rate_limit", 0)
+        self.SEND_RATE_LIMIT_PER_GROUP = yconfig.get("send_rate_limit_per_group", 0)
+        self.SEND_RATE_LIMIT_PER_USER = yconfig.get("send_rate_limit_per_user", 0)
+        self.MESSAGE_WORKERS = yconfig.get("message_workers", 4)
+        self.JOB_WORKERS = yconfig.get("job_workers", 4)
+        self.MESSAGE_CACHE_MB = yconfig.get("message_cache_mb", 16)
+        self.DUEL_MAX_CONCURRENT = yconfig.get("duel_max_concurrent", 5)
+        self.DUEL_QUEUE_SIZE = yconfig.get("duel_queue_size", 3)
@@ -27,3 +27,18 @@ class ChatType(IntEnum):
     @staticmethod
     def help_hint() -> str:
         return str({member.value: member.name for member in ChatType}).replace('{', '').replace('}', '')
+
+
+@unique
+class MsgType(IntEnum):
+    """微信消息类型（WxMsg.type）"""
+    TEXT = 1  # 文本
+    IMAGE = 3  # 图片
+    VOICE = 34  # 语音
+    FRIEND_REQUEST = 37  # 好友请求
+    CARD = 42  # 名片
+    VIDEO = 43  # 视频
+    EMOJI = 47  # 表情
+    LOCATION = 48  # 位置
+    APP = 49  # App消息（引用、卡片、文件等）
+    SYSTEM = 10000  # 系统消息（入群、加好友提示等）
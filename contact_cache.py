@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Set, Tuple
+
+# 获取模块级 logger
+logger = logging.getLogger(__name__)
+
+# 群成员列表在缓存中的 wxid 占位
+_MEMBERS = "__members__"
+
+
+class ContactCache(object):
+    """群昵称 / 群成员缓存
+    以 (roomid, wxid) 为键缓存 get_alias_in_chatroom 的结果，以 (roomid, _MEMBERS) 缓存 get_chatroom_members，
+    条目在 TTL 后过期，总条目数超过上限时按 LRU 淘汰。线程安全，可在各消息工作线程之间共享。
+    """
+
+    def __init__(self, wcf: Any, ttl: float = 600, max_size: int = 5000) -> None:
+        """
+        :param wcf: Wcf 实例
+        :param ttl: 条目有效期（秒）
+        :param max_size: 最大缓存条目数
+        """
+        self.wcf = wcf
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._room_keys: Dict[str, Set[Tuple[str, str]]] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: Tuple[str, str]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _put(self, key: Tuple[str, str], value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._room_keys.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        """删除条目（调用方需持有锁）"""
+        self._entries.pop(key, None)
+        keys = self._room_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._room_keys[key[0]]
+
+    def get_alias(self, wxid: str, roomid: str) -> str:
+        """
+        获取成员在群里的昵称（带缓存），获取失败时返回空字符串
+        :param wxid: 成员 wxid
+        :param roomid: 群 id
+        """
+        key = (roomid, wxid)
+        alias = self._get(key)
+        if alias is not None:
+            return alias
+        alias = self.wcf.get_alias_in_chatroom(wxid, roomid)
+        # 空结果不缓存（可能是刚入群，稍后再查）
+        if alias:
+            self._put(key, alias)
+        return alias or ""
+
+    def get_members(self, roomid: str) -> Dict[str, str]:
+        """
+        获取群成员列表 {wxid: 昵称}（带缓存）
+        :param roomid: 群 id
+        :return: 缓存内容的副本，调用方修改不会影响缓存
+        """
+        key = (roomid, _MEMBERS)
+        members = self._get(key)
+        if members is not None:
+            return dict(members)
+        members = self.wcf.get_chatroom_members(roomid) or {}
+        if members:
+            self._put(key, members)
+        return dict(members)
+
+    def invalidate_room(self, roomid: str) -> None:
+        """使某个群的所有缓存失效（如有新成员入群）"""
+        with self._lock:
+            for key in list(self._room_keys.get(roomid, ())):
+                self._remove(key)
+        logger.debug(f"已清除群 {roomid} 的昵称缓存")
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._room_keys.clear()
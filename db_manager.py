@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# 获取模块级 logger
+logger = logging.getLogger(__name__)
+
+# 默认的共享数据库文件（消息历史、提醒、决斗排位共用）
+DEFAULT_DB_PATH = "data/message_history.db"
+
+
+class DBManager(object):
+    """SQLite 连接管理器
+    每个线程持有一个长连接（线程本地），开启 WAL 模式并调优 pragma：
+    读操作直接在本线程连接上执行，不加锁，WAL 下不会被写操作阻塞；
+    写操作通过 transaction() 在进程内串行，使用 BEGIN IMMEDIATE 一次性拿到写锁，避免忙等和死锁。
+    长连接配合 sqlite3 的语句缓存（cached_statements），相同 SQL 的预编译语句会被复用。
+    """
+
+    def __init__(self, db_path: str, timeout: float = 10, cache_size_kb: int = 8192,
+                 mmap_size: int = 64 * 1024 * 1024, cached_statements: int = 256) -> None:
+        """
+        :param db_path: 数据库文件路径
+        :param timeout: 等待其他进程释放锁的超时时间（秒）
+        :param cache_size_kb: 每个连接的页缓存大小（KB）
+        :param mmap_size: 内存映射读取的最大字节数
+        :param cached_statements: 每个连接缓存的预编译语句数量
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+            logger.info(f"创建数据库目录: {db_dir}")
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接（首次调用时创建）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            # isolation_level=None：由 transaction() 显式控制事务，读操作不会隐式开启事务
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                                   isolation_level=None, cached_statements=self.cached_statements)
+            conn.row_factory = sqlite3.Row  # 查询结果既可以按下标也可以按列名访问
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下 NORMAL 已能保证一致性，减少 fsync
+            conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        except sqlite3.Error as e:
+            logger.error(f"无法连接到 SQLite 数据库 '{self.db_path}': {e}", exc_info=True)
+            raise
+        with self._connections_lock:
+            self._connections.append(conn)
+        logger.debug(f"线程 {threading.current_thread().name} 已连接到数据库 {self.db_path}")
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """只读操作使用的连接，不加锁"""
+        yield self.connection()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：进程内串行，正常退出时提交，出现异常时回滚；支持嵌套（内层并入外层事务）"""
+        with self._write_lock:
+            conn = self.connection()
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            else:
+                if conn.in_transaction:
+                    conn.execute("COMMIT")
+
+    def close_all(self) -> None:
+        """关闭所有线程创建的连接（程序退出时调用）"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"关闭数据库连接时出错: {e}")
+        self._local = threading.local()
+        logger.info(f"已关闭数据库 {self.db_path} 的 {len(connections)} 个连接")
+
+
+_managers: Dict[str, DBManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_db(db_path: str = DEFAULT_DB_PATH) -> DBManager:
+    """获取指定数据库文件的共享连接管理器（同一文件只创建一个）"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = DBManager(db_path)
+            _managers[key] = manager
+        return manager
+
+
+def close_all_dbs() -> None:
+    """关闭所有连接管理器的连接"""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.close_all()
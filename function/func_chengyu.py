@@ -1,82 +1,273 @@
 # -*- coding: utf-8 -*-
 
 import os
+import csv
+import pickle
+import time
 import random
 import logging
-
-import pandas as pd
+from collections import OrderedDict
+from threading import Lock
+from typing import Container, Dict, List, Optional, Set, Tuple
 
 # 获取模块级 logger
 logger = logging.getLogger(__name__)
 
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(ROOT, "chengyu.csv")
+INDEX_PATH = os.path.join(ROOT, "chengyu.idx.pkl")
+INDEX_VERSION = 1
+
+
+def build_index(csv_path: str = CSV_PATH) -> Dict:
+    """从成语 CSV（制表符分隔，列: chengyu, pingyin, jieshi, chuchu, lizi）构建索引
+
+    索引内容：
+        cys:  成语 -> (拼音, 解释, 出处, 例子)
+        zis:  首字 -> 成语元组
+        yins: 首字拼音 -> 成语元组
+    """
+    cys: Dict[str, Tuple[str, str, str, str]] = {}
+    zis: Dict[str, list] = {}
+    yins: Dict[str, list] = {}
+    with open(csv_path, encoding="utf-8", newline="") as fp:
+        for row in csv.DictReader(fp, delimiter="\t"):
+            chengyu = (row.get("chengyu") or "").strip()
+            pingyin = (row.get("pingyin") or "").strip()
+            if not chengyu or not pingyin or chengyu in cys:
+                continue
+            cys[chengyu] = (pingyin, row.get("jieshi") or "", row.get("chuchu") or "", row.get("lizi") or "")
+            zis.setdefault(chengyu[0], []).append(chengyu)
+            yins.setdefault(pingyin.split(" ")[0], []).append(chengyu)
+    return {
+        "version": INDEX_VERSION,
+        "cys": cys,
+        "zis": {k: tuple(v) for k, v in zis.items()},
+        "yins": {k: tuple(v) for k, v in yins.items()},
+    }
+
+
+def load_index(csv_path: str = CSV_PATH, index_path: str = INDEX_PATH) -> Dict:
+    """加载预构建的索引文件；不存在、版本不符或 CSV 更新过时重新构建并写回"""
+    try:
+        if os.path.getmtime(index_path) >= os.path.getmtime(csv_path):
+            with open(index_path, "rb") as fp:
+                index = pickle.load(fp)
+            if index.get("version") == INDEX_VERSION:
+                return index
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.debug(f"成语索引不可用，重新构建: {e}")
+
+    index = build_index(csv_path)
+    try:
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(index, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logger.warning(f"写入成语索引失败: {e}")
+    logger.info(f"已构建成语索引，共 {len(index['cys'])} 条")
+    return index
+
 
 class Chengyu(object):
-    def __init__(self) -> None:
-        root = os.path.dirname(os.path.abspath(__file__))
-        self.df = pd.read_csv(f"{root}/chengyu.csv", delimiter="\t")
-        self.cys, self.zis, self.yins = self._build_data()
+    """成语查询与接龙
+
+    第一次调用时才加载预构建的索引（见 load_index），之后查询都是字典 O(1) 查找，运行时不依赖 pandas。
+    """
 
-    def _build_data(self):
-        df = self.df.copy()
-        df["shouzi"] = df["chengyu"].apply(lambda x: x[0])
-        df["mozi"] = df["chengyu"].apply(lambda x: x[-1])
+    def __init__(self, csv_path: str = CSV_PATH, index_path: str = INDEX_PATH) -> None:
+        self.csv_path = csv_path
+        self.index_path = index_path
+        self._index: Optional[Dict] = None
+        self._lock = Lock()
 
-        df["shouyin"] = df["pingyin"].apply(lambda x: x.split(" ")[0])
-        df["moyin"] = df["pingyin"].apply(lambda x: x.split(" ")[-1])
+    def _load(self) -> Dict:
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    try:
+                        self._index = load_index(self.csv_path, self.index_path)
+                    except OSError as e:
+                        logger.error(f"加载成语数据失败: {e}")
+                        self._index = {"version": INDEX_VERSION, "cys": {}, "zis": {}, "yins": {}}
+                index = self._index
+        return index
 
-        cys = dict(zip(df["chengyu"], df["moyin"]))
-        zis = df.groupby("shouzi").agg({"chengyu": set})["chengyu"].to_dict()
-        yins = df.groupby("shouyin").agg({"chengyu": set})["chengyu"].to_dict()
+    @property
+    def cys(self) -> Dict[str, Tuple[str, str, str, str]]:
+        return self._load()["cys"]
 
-        return cys, zis, yins
+    @property
+    def zis(self) -> Dict[str, Tuple[str, ...]]:
+        return self._load()["zis"]
+
+    @property
+    def yins(self) -> Dict[str, Tuple[str, ...]]:
+        return self._load()["yins"]
 
     def isChengyu(self, cy: str) -> bool:
-        return self.cys.get(cy, None) is not None
+        return cy in self.cys
+
+    def getPinyin(self, cy: str) -> Optional[str]:
+        res = self.cys.get(cy)
+        return res[0] if res else None
+
+    @staticmethod
+    def _choice(candidates: Tuple[str, ...], exclude: Container[str], tries: int = 8) -> Optional[str]:
+        """从候选中随机选一个不在 exclude 中的成语，不复制候选列表
+
+        先随机试几次（exclude 是集合时每次 O(1)），候选大多已被用过时才退化为一次线性筛选。
+        """
+        if not candidates:
+            return None
+        for _ in range(tries):
+            answer = random.choice(candidates)
+            if answer not in exclude:
+                return answer
+        remaining = [c for c in candidates if c not in exclude]
+        return random.choice(remaining) if remaining else None
 
-    def getNext(self, cy: str, tongyin: bool = True) -> str:
+    def getNext(self, cy: str, tongyin: bool = True, used: Optional[Set[str]] = None) -> str:
         """获取下一个成语
             cy: 当前成语
             tongyin: 是否允许同音字
+            used: 已经用过、不能再出现的成语
         """
-        zi = cy[-1]
-        ansers = list(self.zis.get(zi, {}))
-        try:
-            ansers.remove(cy)  # 移除当前成语
-        except Exception as e:
-            pass  # Just ignore...
-
-        if ansers:
-            return random.choice(ansers)
+        index = self._load()
+        exclude = used if used is not None else set()
+        if cy not in exclude:
+            exclude = exclude | {cy}
+        answer = self._choice(index["zis"].get(cy[-1], ()), exclude)
+        if answer:
+            return answer
 
         # 如果找不到同字，允许同音
-        if tongyin:
-            yin = self.cys.get(cy)
-            ansers = list(self.yins.get(yin, {}))
-
-        try:
-            ansers.remove(cy)  # 移除当前成语
-        except Exception as e:
-            pass  # Just ignore...
-
-        if ansers:
-            return random.choice(ansers)
+        if tongyin and cy in index["cys"]:
+            yin = index["cys"][cy][0].split(" ")[-1]
+            return self._choice(index["yins"].get(yin, ()), exclude)
 
         return None
 
+    def canFollow(self, prev: str, cy: str, tongyin: bool = True) -> bool:
+        """cy 能否接在 prev 后面（首字等于末字，或允许同音时首字拼音等于末字拼音）"""
+        if cy[0] == prev[-1]:
+            return True
+        if not tongyin:
+            return False
+        prev_yin, yin = self.getPinyin(prev), self.getPinyin(cy)
+        return bool(prev_yin and yin) and yin.split(" ")[0] == prev_yin.split(" ")[-1]
+
     def getMeaning(self, cy: str) -> str:
-        ress = self.df[self.df["chengyu"] == cy].to_dict(orient="records")
-        if ress:
-            res = ress[0]
-            rsp = res["chengyu"] + "\n" + res["pingyin"] + "\n" + res["jieshi"]
-            if res["chuchu"] and res["chuchu"] != "无":
-                rsp += "\n出处：" + res["chuchu"]
-            if res["lizi"] and res["lizi"] != "无":
-                rsp += "\n例子：" + res["lizi"]
+        res = self.cys.get(cy)
+        if res:
+            pingyin, jieshi, chuchu, lizi = res
+            rsp = cy + "\n" + pingyin + "\n" + jieshi
+            if chuchu and chuchu != "无":
+                rsp += "\n出处：" + chuchu
+            if lizi and lizi != "无":
+                rsp += "\n例子：" + lizi
             return rsp
         return None
 
 
+class ChengyuSession(object):
+    """一局成语接龙"""
+
+    def __init__(self) -> None:
+        self.chain: List[str] = []
+        self.used: Set[str] = set()
+        self.scores: Dict[str, int] = {}
+        self.last_active = time.time()
+
+    def add(self, chengyu: str) -> None:
+        self.chain.append(chengyu)
+        self.used.add(chengyu)
+
+    def summary(self) -> str:
+        lines = [f"🏁 接龙结束，本局共接了 {len(self.chain)} 个成语"]
+        ranking = sorted(self.scores.items(), key=lambda item: item[1], reverse=True)
+        for i, (player, score) in enumerate(ranking[:10]):
+            lines.append(f"{i + 1}. {player}: {score}分")
+        return "\n".join(lines)
+
+
+class ChengyuGame(object):
+    """按群/私聊维护的成语接龙会话
+
+    每个会话记录接龙链、已用成语集合和玩家得分：接上一个成语得 1 分，接得机器人接不下去再得 STUMP_BONUS 分并结束本局。
+    已用成语不能重复；超过 ttl 秒没人接的会话在下次访问时清理（按最近活跃排序，每次只检查最旧的几个）。
+    """
+
+    STUMP_BONUS = 3
+
+    def __init__(self, chengyu: Chengyu, ttl: float = 600, max_sessions: int = 1000) -> None:
+        """
+        :param chengyu: 成语数据
+        :param ttl: 会话空闲多久后过期（秒）
+        :param max_sessions: 最多同时保留的会话数，超出时淘汰最久未活跃的
+        """
+        self.chengyu = chengyu
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChengyuSession]" = OrderedDict()
+        self._lock = Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_active < self.ttl:
+                break
+            del self._sessions[session_id]
+            logger.info(f"成语接龙会话 {session_id} 已过期，共接了 {len(session.chain)} 个成语")
+
+    def play(self, session_id: str, player: str, chengyu: str) -> Optional[str]:
+        """玩家出一个成语
+
+        :param session_id: 会话ID（群ID或私聊wxid）
+        :param player: 玩家昵称
+        :param chengyu: 玩家给出的成语
+        :return: 回复内容；不是成语时返回 None
+        """
+        if not self.chengyu.isChengyu(chengyu):
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChengyuSession()
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+                prev = session.chain[-1]
+                if chengyu in session.used:
+                    return f"「{chengyu}」本局已经用过了，换一个吧～ 请接「{prev[-1]}」"
+                if not self.chengyu.canFollow(prev, chengyu):
+                    return f"「{chengyu}」接不上哦，请接「{prev[-1]}」({self.chengyu.getPinyin(prev).split(' ')[-1]}) 开头的成语"
+                session.scores[player] = session.scores.get(player, 0) + 1
+            session.last_active = now
+            session.add(chengyu)
+
+            answer = self.chengyu.getNext(chengyu, used=session.used)
+            if not answer:
+                session.scores[player] = session.scores.get(player, 0) + self.STUMP_BONUS
+                del self._sessions[session_id]
+                return f"🎉 {player} 把我难住了！额外 +{self.STUMP_BONUS} 分\n{session.summary()}"
+            session.add(answer)
+            return f"{answer}\n（第 {len(session.chain)} 个，请接「{answer[-1]}」）"
+
+    def end(self, session_id: str) -> Optional[str]:
+        """结束会话并返回本局总结，没有进行中的会话时返回 None"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        return session.summary() if session else None
+
+
 cy = Chengyu()
+chengyu_game = ChengyuGame(cy)
 
 if __name__ == "__main__":
     # 设置测试用的日志配置
@@ -84,6 +275,6 @@ if __name__ == "__main__":
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(name)s - %(message)s'
     )
-    
+
     answer = cy.getNext("便宜行事")
     logger.info(answer)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # pypinyin 不可用时不建立拼音别名
+    lazy_pinyin = None
+
+# 获取模块级 logger
+logger = logging.getLogger(__name__)
+
+CITY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main_city.json")
+
+
+class CityResolver(object):
+    """城市名 -> 天气城市代码 解析器
+
+    main_city.json 只在构建时读取一次，预先建立以下索引，查询都是字典查找：
+        精确：城市名，以及去掉 市/区/县 等后缀后的名字、拼音别名（安装了 pypinyin 时，如 beijing）
+        前缀：城市名的每个前缀 -> 最短的匹配城市
+        子串：城市名的每个子串 -> 最短的匹配城市
+    """
+
+    SUFFIXES = ("自治州", "地区", "市", "区", "县", "省", "盟", "旗")
+
+    def __init__(self, city_file: str = CITY_FILE) -> None:
+        self.city_file = city_file
+        self.codes: Dict[str, str] = {}
+        self.error: Optional[str] = None  # 城市文件加载失败的原因
+        self._exact: Dict[str, str] = {}
+        self._prefix: Dict[str, str] = {}
+        self._substring: Dict[str, str] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.city_file, "r", encoding="utf-8") as f:
+                self.codes = json.load(f)
+        except FileNotFoundError:
+            self.error = "城市代码文件未找到"
+            logger.error(f"城市代码文件未找到: {self.city_file}")
+            return
+        except json.JSONDecodeError as e:
+            self.error = "城市代码文件格式错误"
+            logger.error(f"无法解析城市代码文件 {self.city_file}: {e}")
+            return
+
+        # 短的名字优先（"朝阳" 优先于 "朝阳县"），长度相同时保持文件中的顺序
+        for name in sorted(self.codes, key=len):
+            self._exact.setdefault(name, name)
+            stripped = self._strip_suffix(name)
+            if stripped != name:
+                self._exact.setdefault(stripped, name)
+            if lazy_pinyin is not None:
+                self._exact.setdefault("".join(lazy_pinyin(name)).lower(), name)
+            for i in range(len(name)):
+                for j in range(i + 1, len(name) + 1):
+                    part = name[i:j]
+                    self._substring.setdefault(part, name)
+                    if i == 0:
+                        self._prefix.setdefault(part, name)
+        logger.info(f"城市索引已建立，共 {len(self.codes)} 个城市")
+
+    @classmethod
+    def _strip_suffix(cls, name: str) -> str:
+        for suffix in cls.SUFFIXES:
+            if len(name) > len(suffix) + 1 and name.endswith(suffix):
+                return name[:-len(suffix)]
+        return name
+
+    def resolve(self, query: str) -> Optional[Tuple[str, str]]:
+        """解析城市名
+        :param query: 用户输入的城市名，如 "北京"、"北京市"、"beijing"、"浦东"
+        :return: (城市全名, 城市代码)，找不到时返回 None
+        """
+        query = (query or "").strip()
+        if not query:
+            return None
+        name = (self._exact.get(query)
+                or self._exact.get(self._strip_suffix(query))
+                or self._exact.get(query.replace(" ", "").lower())
+                or self._prefix.get(query)
+                or self._substring.get(query))
+        if name is None:
+            return None
+        return name, self.codes[name]
+
+
+_resolver: Optional[CityResolver] = None
+_resolver_lock = Lock()
+
+
+def get_city_resolver() -> CityResolver:
+    """获取共享的城市解析器（进程内只构建一次）"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = CityResolver()
+    return _resolver
+
+
+def resolve_city(query: str) -> Optional[Tuple[str, str]]:
+    """解析城市名，返回 (城市全名, 城市代码)，找不到时返回 None"""
+    return get_city_resolver().resolve(query)
+
+
+if __name__ == "__main__":
+    # 设置测试用的日志配置
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+    )
+
+    for q in ["北京", "北京市", "beijing", "万州", "门峡"]:
+        logger.info(f"{q} -> {resolve_city(q)}")
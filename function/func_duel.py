@@ -4,20 +4,147 @@ import time
 import json
 import os
 import sqlite3
-from typing import List, Dict, Tuple, Optional, Any
-from threading import Thread, Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import bisect
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from threading import Condition, Lock, RLock, Thread
+
+from db_manager import DEFAULT_DB_PATH, get_db
 
 # 获取 Logger 实例
 logger_duel = logging.getLogger("DuelRankSystem")
 
+# --- 决斗规则参数（决斗逻辑和 func_duel_sim 平衡模拟器共用） ---
+DEFENSE_SUCCESS_RATE = 0.3          # 防御成功率
+DEFENSE_POWER = 20                  # 防御魔法固定计入的魔法分数
+FIRST_STRIKE_BASE_PROB = 0.5        # 挑战者基础先手概率
+FIRST_STRIKE_RANK_BONUS = 0.3       # 挑战者排名越靠后，先手概率最多再增加的部分
+ELDER_WAND_MULTIPLIER = 5           # 老魔杖胜利积分倍数
+CLOAK_WIN_POINTS = 30               # 隐身衣直接获胜的积分变化
+BOSS_NAME = "泡泡"
+BOSS_WIN_CHANCE = 0.1               # Boss战胜率
+BOSS_WIN_POINTS = 300               # 战胜Boss获得的积分
+BOSS_LOSS_POINTS = 100              # 输给Boss扣除的积分
+SNEAK_BASE_PROB = 0.3               # 偷袭基础成功率
+SNEAK_RANK_BONUS = 0.4              # 偷袭者排名更低时最多增加的成功率
+SNEAK_MIN_STEAL, SNEAK_MAX_STEAL = 10, 50  # 偷袭随机偷取积分范围
+SNEAK_STEAL_DIFF_RATIO = 0.1        # 偷取分数差的比例（与随机值取较大者）
+SNEAK_ITEM_PROB_PER_ITEM = 0.01     # 目标每有一件道具，偷道具概率增加的部分
+
+def _to_player_data(row: Dict) -> Dict:
+    """把 duel_players 的一行转换为带 items 字典的玩家数据"""
+    player_data = dict(row)
+    player_data["items"] = {
+        "elder_wand": player_data.pop("elder_wand", 0),
+        "magic_stone": player_data.pop("magic_stone", 0),
+        "invisibility_cloak": player_data.pop("invisibility_cloak", 0)
+    }
+    return player_data
+
+class DuelLeaderboard:
+    """单个群的内存排行榜（duel_players 的写穿缓存）
+    
+    首次访问时从数据库加载该群的全部玩家，之后由 DuelRankSystem 在每次写事务提交后更新受影响的玩家。
+    玩家按 (-score, name) 保存在有序列表中：排名 = 分数比自己高的人数 + 1，用二分查找 O(log n) 得到；
+    前 N 名直接取列表前 N 项。
+    """
+    
+    def __init__(self, loader):
+        """
+        Args:
+            loader: 无参函数，返回该群所有玩家的数据库行
+        """
+        self._loader = loader
+        self._players: Dict[str, Dict] = {}  # player_name -> 数据库行（dict）
+        self._order: List[Tuple[int, str]] = []  # (-score, player_name) 升序，即分数从高到低
+        self._loaded = False
+        self._lock = Lock()
+        # 写事务 + 缓存更新需要整体串行，避免两个写者提交顺序和更新缓存顺序不一致
+        self.write_lock = RLock()
+    
+    def _ensure_loaded(self) -> None:
+        """按需从数据库加载（调用方需持有 _lock）"""
+        if self._loaded:
+            return
+        rows = [dict(row) for row in self._loader()]
+        self._players = {row["player_name"]: row for row in rows}
+        self._order = sorted((-row["score"], row["player_name"]) for row in rows)
+        self._loaded = True
+    
+    def get(self, player_name: str) -> Optional[Dict]:
+        """获取玩家数据（副本），不存在时返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._players.get(player_name)
+            return dict(row) if row is not None else None
+    
+    def rank_of(self, player_name: str) -> Optional[int]:
+        """获取玩家排名（同分同名次），不存在时返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._players.get(player_name)
+            if row is None:
+                return None
+            return bisect.bisect_left(self._order, (-row["score"], "")) + 1
+    
+    def top(self, n: int) -> List[Dict]:
+        """获取分数最高的 n 名玩家数据（副本）"""
+        with self._lock:
+            self._ensure_loaded()
+            return [dict(self._players[name]) for _, name in self._order[:max(0, n)]]
+    
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._players)
+    
+    def update(self, rows: Dict[str, Optional[Dict]]) -> None:
+        """
+        写入玩家的最新数据
+        
+        Args:
+            rows: {player_name: 数据库行}，行为 None 表示该玩家已不存在
+        """
+        with self._lock:
+            if not self._loaded:
+                # 还没加载过，下次访问时会从数据库读到最新数据
+                return
+            for player_name, row in rows.items():
+                old = self._players.pop(player_name, None)
+                if old is not None:
+                    key = (-old["score"], player_name)
+                    index = bisect.bisect_left(self._order, key)
+                    if index < len(self._order) and self._order[index] == key:
+                        del self._order[index]
+                if row is not None:
+                    row = dict(row)
+                    self._players[player_name] = row
+                    bisect.insort(self._order, (-row["score"], player_name))
+    
+    def invalidate(self) -> None:
+        """丢弃缓存，下次访问时重新从数据库加载"""
+        with self._lock:
+            self._players = {}
+            self._order = []
+            self._loaded = False
+
+# (数据库文件, 群id) -> 排行榜缓存，同一个群的所有 DuelRankSystem 实例共享
+_leaderboards: Dict[Tuple[str, str], DuelLeaderboard] = {}
+_leaderboards_lock = Lock()
+
+# 已完成建表检查的数据库文件（每个进程只检查一次）
+_schema_ready = set()
+_schema_lock = Lock()
+
 # 排位积分系统
 class DuelRankSystem:
-    # 使用线程锁确保数据库操作的线程安全
-    _db_lock = Lock()
-    
-    def __init__(self, group_id=None, db_path="data/message_history.db"):
+    def __init__(self, group_id=None, db_path=DEFAULT_DB_PATH):
         """
-        初始化排位系统
+        初始化排位系统（业务代码请使用 get_rank_system 获取共享实例）
         
         Args:
             group_id: 群组ID
@@ -29,17 +156,52 @@ class DuelRankSystem:
             
         self.group_id = group_id
         self.db_path = db_path
-        self._init_db()  # 初始化数据库
+        self.db = get_db(db_path)  # 共享的线程本地连接池（WAL 模式）
+        self._ensure_schema()  # 每个数据库文件只建表一次
+        self.leaderboard = self._get_leaderboard()
     
-    def _get_db_conn(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
-            conn.row_factory = sqlite3.Row  # 让查询结果可以像字典一样访问列
-            return conn
-        except sqlite3.Error as e:
-            logger_duel.error(f"无法连接到 SQLite 数据库 '{self.db_path}': {e}", exc_info=True)
-            raise  # 连接失败是严重问题，直接抛出异常
+    def _get_leaderboard(self) -> DuelLeaderboard:
+        """获取本群共享的排行榜缓存"""
+        key = (os.path.abspath(self.db_path), self.group_id)
+        with _leaderboards_lock:
+            board = _leaderboards.get(key)
+            if board is None:
+                board = DuelLeaderboard(self._load_players)
+                _leaderboards[key] = board
+            return board
+    
+    def _load_players(self) -> List[sqlite3.Row]:
+        """从数据库读取本群所有玩家（排行榜缓存加载用）"""
+        with self.db.read() as conn:
+            return conn.execute("SELECT * FROM duel_players WHERE group_id = ?", (self.group_id,)).fetchall()
+    
+    @contextmanager
+    def _write(self, *player_names: str):
+        """写事务：提交后把受影响玩家的最新数据写入排行榜缓存
+        
+        Args:
+            player_names: 本次事务会修改的玩家名称
+        """
+        with self.leaderboard.write_lock:
+            with self.db.transaction() as conn:
+                yield conn
+                rows = {}
+                for player_name in player_names:
+                    rows[player_name] = conn.execute(
+                        "SELECT * FROM duel_players WHERE group_id = ? AND player_name = ?",
+                        (self.group_id, player_name)
+                    ).fetchone()
+            self.leaderboard.update(rows)
+    
+    def _ensure_schema(self) -> None:
+        """确保表结构已创建，同一数据库文件在进程内只执行一次 DDL"""
+        key = os.path.abspath(self.db_path)
+        if key in _schema_ready:
+            return
+        with _schema_lock:
+            if key not in _schema_ready:
+                self._init_db()
+                _schema_ready.add(key)
     
     def _init_db(self):
         """初始化数据库，创建表（如果不存在）"""
@@ -62,12 +224,10 @@ class DuelRankSystem:
         # 移除了相关索引的创建语句
 
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(sql_create_players)
-                    # 移除了执行创建 duel_history 表和索引的命令
-                    conn.commit()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql_create_players)
+                # 移除了执行创建 duel_history 表和索引的命令
             logger_duel.info("数据库表 'duel_players' 检查/创建 完成。")
         except sqlite3.Error as e:
             logger_duel.error(f"创建/检查数据库表失败: {e}", exc_info=True)
@@ -76,63 +236,59 @@ class DuelRankSystem:
     def get_player_data(self, player_name: str) -> Dict:
         """获取玩家数据，如果不存在则创建"""
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    # 查询玩家数据
-                    sql_query = """
-                    SELECT * FROM duel_players 
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_query, (self.group_id, player_name))
-                    result = cursor.fetchone()
+            # 优先从排行榜缓存读取
+            cached = self.leaderboard.get(player_name)
+            if cached is not None:
+                return _to_player_data(cached)
+            
+            with self._write(player_name) as conn:
+                cursor = conn.cursor()
+                # 查询玩家数据（可能在读缓存之后被其他线程创建）
+                sql_query = """
+                SELECT * FROM duel_players 
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_query, (self.group_id, player_name))
+                result = cursor.fetchone()
                     
-                    if result:
-                        # 将 sqlite3.Row 转换为字典
-                        player_data = dict(result)
-                        # 构造特殊的 items 字典
-                        player_data["items"] = {
-                            "elder_wand": player_data.pop("elder_wand", 0),
-                            "magic_stone": player_data.pop("magic_stone", 0),
-                            "invisibility_cloak": player_data.pop("invisibility_cloak", 0)
-                        }
-                        return player_data
-                    else:
-                        # 玩家不存在，创建新玩家
-                        default_data = {
-                            "score": 1000,
-                            "wins": 0,
-                            "losses": 0,
-                            "total_matches": 0,
-                            "items": {
-                                "elder_wand": 0,
-                                "magic_stone": 0,
-                                "invisibility_cloak": 0
-                            }
+                if result:
+                    # 将 sqlite3.Row 转换为字典，并构造特殊的 items 字典
+                    return _to_player_data(result)
+                else:
+                    # 玩家不存在，创建新玩家
+                    default_data = {
+                        "score": 1000,
+                        "wins": 0,
+                        "losses": 0,
+                        "total_matches": 0,
+                        "items": {
+                            "elder_wand": 0,
+                            "magic_stone": 0,
+                            "invisibility_cloak": 0
                         }
+                    }
                         
-                        # 插入新玩家数据
-                        sql_insert = """
-                        INSERT INTO duel_players
-                        (group_id, player_name, score, wins, losses, total_matches,
-                         elder_wand, magic_stone, invisibility_cloak, last_updated)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-                        """
-                        cursor.execute(sql_insert, (
-                            self.group_id,
-                            player_name,
-                            default_data["score"],
-                            default_data["wins"],
-                            default_data["losses"],
-                            default_data["total_matches"],
-                            default_data["items"]["elder_wand"],
-                            default_data["items"]["magic_stone"],
-                            default_data["items"]["invisibility_cloak"]
-                        ))
-                        conn.commit()
+                    # 插入新玩家数据
+                    sql_insert = """
+                    INSERT INTO duel_players
+                    (group_id, player_name, score, wins, losses, total_matches,
+                     elder_wand, magic_stone, invisibility_cloak, last_updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                    """
+                    cursor.execute(sql_insert, (
+                        self.group_id,
+                        player_name,
+                        default_data["score"],
+                        default_data["wins"],
+                        default_data["losses"],
+                        default_data["total_matches"],
+                        default_data["items"]["elder_wand"],
+                        default_data["items"]["magic_stone"],
+                        default_data["items"]["invisibility_cloak"]
+                    ))
                         
-                        logger_duel.info(f"创建了新玩家: {player_name} 在群组 {self.group_id}")
-                        return default_data
+                    logger_duel.info(f"创建了新玩家: {player_name} 在群组 {self.group_id}")
+                    return default_data
         
         except sqlite3.Error as e:
             logger_duel.error(f"获取玩家数据失败: {e}", exc_info=True)
@@ -179,38 +335,36 @@ class DuelRankSystem:
         points = int(base_points * (hp_percent_bonus))  # 血量越多，积分越高
         
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
+            with self._write(winner, loser) as conn:
+                cursor = conn.cursor()
                     
-                    # 更新胜利者数据
-                    sql_update_winner = """
-                    UPDATE duel_players SET 
-                    score = score + ?,
-                    wins = wins + 1,
-                    total_matches = total_matches + 1,
-                    last_updated = datetime('now')
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_winner, (points, self.group_id, winner))
+                # 更新胜利者数据
+                sql_update_winner = """
+                UPDATE duel_players SET 
+                score = score + ?,
+                wins = wins + 1,
+                total_matches = total_matches + 1,
+                last_updated = datetime('now')
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_update_winner, (points, self.group_id, winner))
                     
-                    # 更新失败者数据
-                    sql_update_loser = """
-                    UPDATE duel_players SET 
-                    score = MAX(1, score - ?),
-                    losses = losses + 1,
-                    total_matches = total_matches + 1,
-                    last_updated = datetime('now')
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_loser, (points, self.group_id, loser))
+                # 更新失败者数据
+                sql_update_loser = """
+                UPDATE duel_players SET 
+                score = MAX(1, score - ?),
+                losses = losses + 1,
+                total_matches = total_matches + 1,
+                last_updated = datetime('now')
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_update_loser, (points, self.group_id, loser))
                     
-                    # 移除了记录对战历史的代码
+                # 移除了记录对战历史的代码
                     
-                    conn.commit()
-                    logger_duel.info(f"{winner} 击败 {loser}，获得 {points} 积分")
+                logger_duel.info(f"{winner} 击败 {loser}，获得 {points} 积分")
                     
-                    return (points, points)  # 返回胜者得分和败者失分（相同）
+                return (points, points)  # 返回胜者得分和败者失分（相同）
                     
         except sqlite3.Error as e:
             logger_duel.error(f"更新积分失败: {e}", exc_info=True)
@@ -226,42 +380,23 @@ class DuelRankSystem:
             List[Dict]: 排行榜数据
         """
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    sql_query = """
-                    SELECT player_name, score, wins, losses, total_matches,
-                           elder_wand, magic_stone, invisibility_cloak
-                    FROM duel_players
-                    WHERE group_id = ?
-                    ORDER BY score DESC
-                    LIMIT ?
-                    """
-                    cursor.execute(sql_query, (self.group_id, top_n))
-                    results = cursor.fetchall()
-                    
-                    # 转换结果为字典列表，格式与原JSON格式相同
-                    ranked_players = []
-                    for row in results:
-                        player_dict = dict(row)
-                        player_name = player_dict.pop("player_name")
-                        
-                        # 构造与原格式相同的字典
-                        player = {
-                            "name": player_name,
-                            "score": player_dict["score"],
-                            "wins": player_dict["wins"],
-                            "losses": player_dict["losses"],
-                            "total_matches": player_dict["total_matches"],
-                            "items": {
-                                "elder_wand": player_dict["elder_wand"],
-                                "magic_stone": player_dict["magic_stone"],
-                                "invisibility_cloak": player_dict["invisibility_cloak"]
-                            }
-                        }
-                        ranked_players.append(player)
-                    
-                    return ranked_players
+            # 直接从内存排行榜取前 top_n 名
+            ranked_players = []
+            for row in self.leaderboard.top(top_n):
+                # 构造与原JSON格式相同的字典
+                ranked_players.append({
+                    "name": row["player_name"],
+                    "score": row["score"],
+                    "wins": row["wins"],
+                    "losses": row["losses"],
+                    "total_matches": row["total_matches"],
+                    "items": {
+                        "elder_wand": row["elder_wand"],
+                        "magic_stone": row["magic_stone"],
+                        "invisibility_cloak": row["invisibility_cloak"]
+                    }
+                })
+            return ranked_players
                     
         except sqlite3.Error as e:
             logger_duel.error(f"获取排行榜失败: {e}", exc_info=True)
@@ -280,33 +415,68 @@ class DuelRankSystem:
         player_data = self.get_player_data(player_name)
         
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    
-                    # 查询排行榜中有哪些分数比该玩家高
-                    sql_rank = """
-                    SELECT COUNT(*) + 1 as rank
-                    FROM duel_players
-                    WHERE group_id = ? AND score > (
-                        SELECT score FROM duel_players
-                        WHERE group_id = ? AND player_name = ?
-                    )
-                    """
-                    cursor.execute(sql_rank, (self.group_id, self.group_id, player_name))
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        rank = result["rank"]
-                        return rank, player_data
-                    else:
-                        # 找不到玩家排名，可能是新玩家
-                        return None, player_data
+            # 排名 = 分数比该玩家高的人数 + 1，由内存排行榜二分查找得到
+            # 找不到玩家排名时（例如创建失败）返回 None
+            return self.leaderboard.rank_of(player_name), player_data
                         
         except sqlite3.Error as e:
             logger_duel.error(f"获取玩家排名失败: {e}", exc_info=True)
             return None, player_data  # 出错时返回None作为排名
     
+    def get_player_count(self) -> int:
+        """获取本群玩家总数"""
+        try:
+            return len(self.leaderboard)
+        except sqlite3.Error as e:
+            logger_duel.error(f"获取玩家总数失败: {e}", exc_info=True)
+            return 0
+
+    def add_scores(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        """批量原子加分，玩家不存在时按默认初始积分创建
+
+        每个玩家只执行一条 upsert 语句（score = MAX(1, score + ?)），所有玩家在同一个事务中提交，积分最低为 1。
+
+        Args:
+            deltas: {玩家名称: 积分增量}，增量可为负
+
+        Returns:
+            Dict[str, int]: {玩家名称: 更新后的积分}，失败时返回空字典
+        """
+        if not deltas:
+            return {}
+        sql_upsert = """
+        INSERT INTO duel_players (group_id, player_name, score, last_updated)
+        VALUES (?, ?, MAX(1, 1000 + ?), datetime('now'))
+        ON CONFLICT(group_id, player_name) DO UPDATE SET
+            score = MAX(1, score + ?),
+            last_updated = excluded.last_updated
+        """
+        try:
+            with self._write(*deltas) as conn:
+                conn.executemany(sql_upsert, [
+                    (self.group_id, player_name, delta, delta)
+                    for player_name, delta in deltas.items()
+                ])
+            return {
+                player_name: self.leaderboard.get(player_name)["score"]
+                for player_name in deltas
+            }
+        except sqlite3.Error as e:
+            logger_duel.error(f"批量更新积分失败: {e}", exc_info=True)
+            return {}
+
+    def add_score(self, player_name: str, delta: int) -> Optional[int]:
+        """原子加分，玩家不存在时按默认初始积分创建
+
+        Args:
+            player_name: 玩家名称
+            delta: 积分增量，可为负
+
+        Returns:
+            Optional[int]: 更新后的积分，失败时返回 None
+        """
+        return self.add_scores({player_name: delta}).get(player_name)
+
     def change_player_name(self, old_name: str, new_name: str) -> bool:
         """更改玩家名称
         
@@ -318,47 +488,39 @@ class DuelRankSystem:
             bool: 是否成功更改
         """
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    
-                    # 开启事务
-                    conn.execute("BEGIN TRANSACTION")
+            with self._write(old_name, new_name) as conn:
+                cursor = conn.cursor()
                     
-                    # 检查旧名称是否存在
-                    sql_check_old = """
-                    SELECT COUNT(*) as count FROM duel_players
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_check_old, (self.group_id, old_name))
-                    if cursor.fetchone()["count"] == 0:
-                        conn.rollback()
-                        return False
+                # 检查旧名称是否存在
+                sql_check_old = """
+                SELECT COUNT(*) as count FROM duel_players
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_check_old, (self.group_id, old_name))
+                if cursor.fetchone()["count"] == 0:
+                    return False
                     
-                    # 检查新名称是否已存在
-                    sql_check_new = """
-                    SELECT COUNT(*) as count FROM duel_players
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_check_new, (self.group_id, new_name))
-                    if cursor.fetchone()["count"] > 0:
-                        conn.rollback()
-                        return False
+                # 检查新名称是否已存在
+                sql_check_new = """
+                SELECT COUNT(*) as count FROM duel_players
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_check_new, (self.group_id, new_name))
+                if cursor.fetchone()["count"] > 0:
+                    return False
                     
-                    # 更新玩家表
-                    sql_update_player = """
-                    UPDATE duel_players SET player_name = ?
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_player, (new_name, self.group_id, old_name))
+                # 更新玩家表
+                sql_update_player = """
+                UPDATE duel_players SET player_name = ?
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_update_player, (new_name, self.group_id, old_name))
                     
-                    # 移除了更新历史记录表中的胜者和败者名称的代码
+                # 移除了更新历史记录表中的胜者和败者名称的代码
                     
-                    # 提交事务
-                    conn.commit()
-                    logger_duel.info(f"成功将玩家 {old_name} 改名为 {new_name}")
+                logger_duel.info(f"成功将玩家 {old_name} 改名为 {new_name}")
                     
-                    return True
+                return True
                     
         except sqlite3.Error as e:
             logger_duel.error(f"更改玩家名称失败: {e}", exc_info=True)
@@ -383,43 +545,118 @@ class DuelRankSystem:
         points = magic_power
         
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
+            with self._write(winner, loser) as conn:
+                cursor = conn.cursor()
                     
-                    # 更新胜利者数据
-                    sql_update_winner = """
-                    UPDATE duel_players SET 
-                    score = score + ?,
-                    wins = wins + 1,
-                    total_matches = total_matches + 1,
-                    last_updated = datetime('now')
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_winner, (points, self.group_id, winner))
+                # 更新胜利者数据
+                sql_update_winner = """
+                UPDATE duel_players SET 
+                score = score + ?,
+                wins = wins + 1,
+                total_matches = total_matches + 1,
+                last_updated = datetime('now')
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_update_winner, (points, self.group_id, winner))
                     
-                    # 更新失败者数据
-                    sql_update_loser = """
-                    UPDATE duel_players SET 
-                    score = MAX(1, score - ?),
-                    losses = losses + 1,
-                    total_matches = total_matches + 1,
-                    last_updated = datetime('now')
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_loser, (points, self.group_id, loser))
+                # 更新失败者数据
+                sql_update_loser = """
+                UPDATE duel_players SET 
+                score = MAX(1, score - ?),
+                losses = losses + 1,
+                total_matches = total_matches + 1,
+                last_updated = datetime('now')
+                WHERE group_id = ? AND player_name = ?
+                """
+                cursor.execute(sql_update_loser, (points, self.group_id, loser))
                     
-                    # 移除了记录对战历史的代码
+                # 移除了记录对战历史的代码
                     
-                    conn.commit()
-                    logger_duel.info(f"{winner} 使用魔法击败 {loser}，获得 {points} 积分")
+                logger_duel.info(f"{winner} 使用魔法击败 {loser}，获得 {points} 积分")
                     
-                    return (points, points)  # 返回胜者得分和败者失分（相同）
+                return (points, points)  # 返回胜者得分和败者失分（相同）
                     
         except sqlite3.Error as e:
             logger_duel.error(f"根据魔法分数更新积分失败: {e}", exc_info=True)
             return (0, 0)  # 出错时返回0分
     
+    def settle_duel(self, winner: str, loser: str,
+                    decide: Callable[[Dict, Dict], Tuple[int, int, Optional[str], Optional[str]]]) -> Optional[Dict]:
+        """在一个事务内结算一场决斗：读取双方数据、按规则计算积分和道具消耗、写回并返回结算后的数据和排名
+        
+        Args:
+            winner: 胜利者名称
+            loser: 失败者名称
+            decide: 结算规则，参数为双方当前数据 (winner_data, loser_data)，
+                    返回 (胜利者获得积分, 失败者失去积分, 胜利者消耗的道具, 失败者消耗的道具)，道具为 None 表示不消耗
+            
+        Returns:
+            Optional[Dict]: 结算结果，包含 winner/loser（结算后的玩家数据）、winner_rank/loser_rank、
+                            winner_points/loser_points、winner_item/loser_item；数据库出错时返回 None
+        """
+        sql_insert = """
+        INSERT OR IGNORE INTO duel_players (group_id, player_name, last_updated)
+        VALUES (?, ?, datetime('now'))
+        """
+        sql_query = "SELECT * FROM duel_players WHERE group_id = ? AND player_name = ?"
+        # 注意：loser_points 是正数，表示要扣除的分数，失败者最低保留1分
+        sql_update_winner = """
+        UPDATE duel_players SET 
+        score = score + ?,
+        wins = wins + 1,
+        total_matches = total_matches + 1,
+        last_updated = datetime('now')
+        WHERE group_id = ? AND player_name = ?
+        """
+        sql_update_loser = """
+        UPDATE duel_players SET 
+        score = MAX(1, score - ?),
+        losses = losses + 1,
+        total_matches = total_matches + 1,
+        last_updated = datetime('now')
+        WHERE group_id = ? AND player_name = ?
+        """
+        
+        try:
+            # 持有排行榜写锁到读出排名为止，保证返回的排名就是本次结算后的排名
+            with self.leaderboard.write_lock:
+                with self._write(winner, loser) as conn:
+                    # 确保双方都存在，并读取当前数据
+                    conn.execute(sql_insert, (self.group_id, winner))
+                    conn.execute(sql_insert, (self.group_id, loser))
+                    winner_data = _to_player_data(conn.execute(sql_query, (self.group_id, winner)).fetchone())
+                    loser_data = _to_player_data(conn.execute(sql_query, (self.group_id, loser)).fetchone())
+                    
+                    winner_points, loser_points, winner_item, loser_item = decide(winner_data, loser_data)
+                    
+                    conn.execute(sql_update_winner, (winner_points, self.group_id, winner))
+                    conn.execute(sql_update_loser, (loser_points, self.group_id, loser))
+                    # 道具名来自固定的三种道具，可以安全地拼接到 SQL 中
+                    for player_name, item in ((winner, winner_item), (loser, loser_item)):
+                        if item in ITEM_NAME_MAP:
+                            conn.execute(f"UPDATE duel_players SET {item} = MAX(0, {item} - 1) WHERE group_id = ? AND player_name = ?",
+                                         (self.group_id, player_name))
+                            logger_duel.info(f"消耗了 {player_name} 的{ITEM_NAME_MAP[item]}")
+                
+                settlement = {
+                    "winner": _to_player_data(self.leaderboard.get(winner)),
+                    "loser": _to_player_data(self.leaderboard.get(loser)),
+                    "winner_rank": self.leaderboard.rank_of(winner),
+                    "loser_rank": self.leaderboard.rank_of(loser),
+                    "winner_points": winner_points,
+                    "loser_points": loser_points,
+                    "winner_item": winner_item,
+                    "loser_item": loser_item,
+                }
+            
+            logger_duel.info(f"{winner} 在决斗中击败 {loser}，胜者积分 +{winner_points}，败者积分 -{loser_points}，"
+                             f"使用道具: {winner_item or '无'} / {loser_item or '无'}")
+            return settlement
+        
+        except sqlite3.Error as e:
+            logger_duel.error(f"结算决斗失败: {e}", exc_info=True)
+            return None
+    
     def record_duel_result(self, winner: str, loser: str, winner_points: int, loser_points: int, total_magic_power: int, used_item: Optional[str] = None) -> Tuple[int, int]:
         """记录决斗结果，更新玩家数据和历史记录
         
@@ -435,67 +672,35 @@ class DuelRankSystem:
         Returns:
             Tuple[int, int]: (胜利者实际获得积分, 失败者实际失去积分)
         """
-        # 获取玩家数据 (确保玩家存在)
-        self.get_player_data(winner)
-        self.get_player_data(loser)
-        
-        # 注意：loser_points 是正数，表示要扣除的分数
-        
-        try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    
-                    # 更新胜利者数据
-                    sql_update_winner = """
-                    UPDATE duel_players SET 
-                    score = score + ?,
-                    wins = wins + 1,
-                    total_matches = total_matches + 1,
-                    last_updated = datetime('now')
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_winner, (winner_points, self.group_id, winner))
-                    
-                    # 更新失败者数据
-                    sql_update_loser = """
-                    UPDATE duel_players SET 
-                    score = MAX(1, score - ?),
-                    losses = losses + 1,
-                    total_matches = total_matches + 1,
-                    last_updated = datetime('now')
-                    WHERE group_id = ? AND player_name = ?
-                    """
-                    cursor.execute(sql_update_loser, (loser_points, self.group_id, loser))
+        # 老魔杖和隐身衣由胜利者使用，魔法石由失败者使用
+        winner_item = used_item if used_item in ("elder_wand", "invisibility_cloak") else None
+        loser_item = used_item if used_item == "magic_stone" else None
+        settlement = self.settle_duel(winner, loser, lambda w, l: (winner_points, loser_points, winner_item, loser_item))
+        if settlement is None:
+            return (0, 0)  # 出错时返回0分
+        return (winner_points, loser_points)  # 返回实际积分变化
 
-                    # --- 改进处理道具消耗逻辑 ---
-                    if used_item == "elder_wand":
-                        # 老魔杖是胜利者使用的
-                        cursor.execute("UPDATE duel_players SET elder_wand = MAX(0, elder_wand - 1) WHERE group_id = ? AND player_name = ?", (self.group_id, winner))
-                        logger_duel.info(f"消耗了 {winner} 的老魔杖 (剩余数量将被更新)")
-                    elif used_item == "magic_stone":
-                        # 魔法石是失败者使用的
-                        cursor.execute("UPDATE duel_players SET magic_stone = MAX(0, magic_stone - 1) WHERE group_id = ? AND player_name = ?", (self.group_id, loser))
-                        logger_duel.info(f"消耗了 {loser} 的魔法石 (剩余数量将被更新)")
-                    elif used_item == "invisibility_cloak":
-                        # 隐身衣由胜利者使用
-                        cursor.execute("UPDATE duel_players SET invisibility_cloak = MAX(0, invisibility_cloak - 1) WHERE group_id = ? AND player_name = ?", (self.group_id, winner))
-                        logger_duel.info(f"消耗了 {winner} 的隐身衣 (剩余数量将被更新)")
-                    # --------------------------
+_rank_systems: Dict[Tuple[str, str], DuelRankSystem] = {}
+_rank_systems_lock = Lock()
 
-                    # 移除了记录对战历史的代码
-                    
-                    conn.commit()
-                    logger_duel.info(f"{winner} 在决斗中击败 {loser}，胜者积分 +{winner_points}，败者积分 -{loser_points}，使用道具: {used_item or '无'}")
-                    
-                    return (winner_points, loser_points)  # 返回实际积分变化
-                    
-        except sqlite3.Error as e:
-            logger_duel.error(f"记录决斗结果失败: {e}", exc_info=True)
-            return (0, 0)  # 出错时返回0分
-        except Exception as e:
-            logger_duel.error(f"记录决斗结果时发生未知错误: {e}", exc_info=True)
-            return (0, 0)  # 出错时返回0分
+def get_rank_system(group_id: str, db_path: str = DEFAULT_DB_PATH) -> DuelRankSystem:
+    """获取本群共享的排位系统实例（同一群只创建一个）
+    
+    Args:
+        group_id: 群组ID，必须提供
+        db_path: 数据库文件路径
+    """
+    if not group_id:
+        raise ValueError("决斗功能只支持群聊")
+    key = (os.path.abspath(db_path), group_id)
+    rank_system = _rank_systems.get(key)
+    if rank_system is None:
+        with _rank_systems_lock:
+            rank_system = _rank_systems.get(key)
+            if rank_system is None:
+                rank_system = DuelRankSystem(group_id, db_path)
+                _rank_systems[key] = rank_system
+    return rank_system
 
 class HarryPotterDuel:
     """决斗功能"""
@@ -529,17 +734,17 @@ class HarryPotterDuel:
         self.group_id = group_id  # 记录群组ID
         
         # 检测是否为Boss战（对手是AI"泡泡"）
-        self.is_boss_fight = (player2 == "泡泡")
+        self.is_boss_fight = (player2 == BOSS_NAME)
         
         # Boss战特殊设置
         if self.is_boss_fight:
-            # Boss战胜率极低，设为10%
-            self.player_win_chance = 0.1
+            # Boss战胜率极低
+            self.player_win_chance = BOSS_WIN_CHANCE
             # 添加Boss战提示信息
             self.steps.append("⚔️ Boss战开始 ⚔️\n挑战强大的魔法师泡泡！")
             
         # 设置防御成功率
-        self.defense_success_rate = 0.3
+        self.defense_success_rate = DEFENSE_SUCCESS_RATE
         
         # 咒语列表（名称、威力、权重）- 权重越小越稀有
         self.spells = [
@@ -616,7 +821,7 @@ class HarryPotterDuel:
     def start_duel(self):
         """开始决斗，返回决斗过程的步骤列表"""
         # 创建积分系统实例，整个方法中重用
-        rank_system = DuelRankSystem(self.group_id)
+        rank_system = get_rank_system(self.group_id)
         
         # --- 修改：提前获取双方玩家数据 ---
         player1_data = rank_system.get_player_data(self.player1["name"])
@@ -659,72 +864,58 @@ class HarryPotterDuel:
                 item_names = {"elder_wand": "老魔杖", "magic_stone": "魔法石", "invisibility_cloak": "隐身衣"}
                 
                 try:
-                    with rank_system._db_lock:
-                        with rank_system._get_db_conn() as conn:
-                            cursor = conn.cursor()
+                    with rank_system._write(winner["name"]) as conn:
+                        cursor = conn.cursor()
+                            
+                        # 获取当前玩家的道具数量
+                        sql_query = """
+                        SELECT elder_wand, magic_stone, invisibility_cloak
+                        FROM duel_players
+                        WHERE group_id = ? AND player_name = ?
+                        """
+                        cursor.execute(sql_query, (self.group_id, winner["name"]))
+                        result = cursor.fetchone()
                             
-                            # 获取当前玩家的道具数量
-                            sql_query = """
-                            SELECT elder_wand, magic_stone, invisibility_cloak
-                            FROM duel_players
+                        if result:
+                            # 更新玩家数据，增加道具
+                            sql_update = """
+                            UPDATE duel_players SET
+                            elder_wand = elder_wand + 1,
+                            magic_stone = magic_stone + 1,
+                            invisibility_cloak = invisibility_cloak + 1,
+                            score = score + ?,
+                            wins = wins + 1,
+                            total_matches = total_matches + 1,
+                            last_updated = datetime('now')
                             WHERE group_id = ? AND player_name = ?
                             """
-                            cursor.execute(sql_query, (self.group_id, winner["name"]))
-                            result = cursor.fetchone()
-                            
-                            if result:
-                                # 更新玩家数据，增加道具
-                                sql_update = """
-                                UPDATE duel_players SET
-                                elder_wand = elder_wand + 1,
-                                magic_stone = magic_stone + 1,
-                                invisibility_cloak = invisibility_cloak + 1,
-                                score = score + ?,
-                                wins = wins + 1,
-                                total_matches = total_matches + 1,
-                                last_updated = datetime('now')
-                                WHERE group_id = ? AND player_name = ?
-                                """
-                                winner_points = 300  # 胜利积分固定为500分
-                                cursor.execute(sql_update, (winner_points, self.group_id, winner["name"]))
-                                
-                                # 移除了记录对战历史的代码
-                                
-                                conn.commit()
-                                
-                                # 查询更新后玩家排名
-                                sql_rank = """
-                                SELECT COUNT(*) + 1 as rank
-                                FROM duel_players
-                                WHERE group_id = ? AND score > (
-                                    SELECT score FROM duel_players
-                                    WHERE group_id = ? AND player_name = ?
-                                )
-                                """
-                                cursor.execute(sql_rank, (self.group_id, self.group_id, winner["name"]))
-                                rank_result = cursor.fetchone()
-                                rank = rank_result["rank"] if rank_result else None
-                                
-                                rank_text = f"第{rank}名" if rank else "暂无排名"
-                                
-                                # 添加获得装备的信息
-                                result = (
-                                    f"🏆 {winner['name']} 以不可思议的实力击败了强大的Boss泡泡！\n\n"
-                                    f"获得了三件死亡圣器！\n"
-                                    f" 🪄   💎   🧥 \n\n"
-                                    f"积分: +{winner_points}分 ({rank_text})"
-                                )
-                                
-                                self.steps.append(result)
-                                return self.steps
-                            else:
-                                # 玩家不存在，这种情况理论上不可能发生，但为安全添加
-                                logger_duel.error(f"Boss战获胜但找不到玩家 {winner['name']} 数据")
+                            winner_points = BOSS_WIN_POINTS  # 胜利积分固定
+                            cursor.execute(sql_update, (winner_points, self.group_id, winner["name"]))
+                            # 移除了记录对战历史的代码
+                        else:
+                            # 玩家不存在，这种情况理论上不可能发生，但为安全添加
+                            logger_duel.error(f"Boss战获胜但找不到玩家 {winner['name']} 数据")
                 except sqlite3.Error as e:
                     logger_duel.error(f"处理Boss战胜利时出错: {e}", exc_info=True)
                     self.steps.append(f"⚠️ 处理战利品时遇到问题: {e}")
                     return self.steps
                 
+                if result:
+                    # 写入提交后排行榜缓存已更新，直接取排名，不再做关联子查询
+                    rank = rank_system.leaderboard.rank_of(winner["name"])
+                    rank_text = f"第{rank}名" if rank else "暂无排名"
+                    
+                    # 添加获得装备的信息
+                    victory_text = (
+                        f"🏆 {winner['name']} 以不可思议的实力击败了强大的Boss泡泡！\n\n"
+                        f"获得了三件死亡圣器！\n"
+                        f" 🪄   💎   🧥 \n\n"
+                        f"积分: +{winner_points}分 ({rank_text})"
+                    )
+                    
+                    self.steps.append(victory_text)
+                    return self.steps
+                
             else:  # 玩家输了
                 winner, loser = self.player2, self.player1
                 
@@ -737,30 +928,28 @@ class HarryPotterDuel:
                 self.steps.append(random.choice(defeat_end))
                 
                 try:
-                    with rank_system._db_lock:
-                        with rank_system._get_db_conn() as conn:
-                            cursor = conn.cursor()
+                    with rank_system._write(loser["name"]) as conn:
+                        cursor = conn.cursor()
                             
-                            # 更新失败者数据
-                            sql_update = """
-                            UPDATE duel_players SET
-                            score = MAX(1, score - 100),
-                            losses = losses + 1,
-                            total_matches = total_matches + 1,
-                            last_updated = datetime('now')
-                            WHERE group_id = ? AND player_name = ?
-                            """
-                            cursor.execute(sql_update, (self.group_id, loser["name"]))
+                        # 更新失败者数据
+                        sql_update = """
+                        UPDATE duel_players SET
+                        score = MAX(1, score - ?),
+                        losses = losses + 1,
+                        total_matches = total_matches + 1,
+                        last_updated = datetime('now')
+                        WHERE group_id = ? AND player_name = ?
+                        """
+                        cursor.execute(sql_update, (BOSS_LOSS_POINTS, self.group_id, loser["name"]))
                             
-                            # 移除了记录对战历史的代码
+                        # 移除了记录对战历史的代码
                             
-                            conn.commit()
                 except sqlite3.Error as e:
                     logger_duel.error(f"处理Boss战失败时出错: {e}", exc_info=True)
                 
                 result = (
                     f"💀 {loser['name']} 不敌强大的Boss泡泡！\n\n"
-                    f"积分: -100分\n"
+                    f"积分: -{BOSS_LOSS_POINTS}分\n"
                     f"再接再厉，下次挑战吧！"
                 )
                 
@@ -773,16 +962,16 @@ class HarryPotterDuel:
 
         if p1_cloak and not p2_cloak: # 只有 Player1 有隐身衣
             winner, loser = self.player1, self.player2
-            winner_points = 30
-            loser_points = 30
+            winner_points = CLOAK_WIN_POINTS
+            loser_points = CLOAK_WIN_POINTS
             used_item = "invisibility_cloak"
             self.steps.append(f"🧥 {winner['name']} 开局使用了隐身衣，潜行偷袭，直接获胜！")
             # 直接调用记录结果函数处理数据库和返回消息
             return self._handle_direct_win(rank_system, winner, loser, winner_points, loser_points, used_item, player1_data)
         elif not p1_cloak and p2_cloak: # 只有 Player2 有隐身衣
             winner, loser = self.player2, self.player1
-            winner_points = 30
-            loser_points = 30
+            winner_points = CLOAK_WIN_POINTS
+            loser_points = CLOAK_WIN_POINTS
             used_item = "invisibility_cloak"
             self.steps.append(f"🧥 {winner['name']} 开局使用了隐身衣，潜行偷袭，直接获胜！")
             # 直接调用记录结果函数处理数据库和返回消息
@@ -800,16 +989,15 @@ class HarryPotterDuel:
             challenger_rank, _ = rank_system.get_player_rank(challenger)
             
             # 获取总玩家数
-            all_players = rank_system.get_rank_list(9999)  # 获取所有玩家
-            total_players = len(all_players)
+            total_players = rank_system.get_player_count()
             
             # 计算先手概率：基础概率50% + (排名/总人数)*30%
             # 如果没有排名或总玩家数为0，则使用基础概率50%
             if challenger_rank is not None and total_players > 0:
                 # 排名越大（越靠后），先手优势越大
-                first_attack_prob = 0.5 + (challenger_rank / total_players) * 0.3
+                first_attack_prob = FIRST_STRIKE_BASE_PROB + (challenger_rank / total_players) * FIRST_STRIKE_RANK_BONUS
             else:
-                first_attack_prob = 0.5  # 默认概率
+                first_attack_prob = FIRST_STRIKE_BASE_PROB  # 默认概率
                 
             current_attacker = "player1" if random.random() < first_attack_prob else "player2"
         else:
@@ -818,16 +1006,15 @@ class HarryPotterDuel:
             challenger_rank, _ = rank_system.get_player_rank(challenger)
             
             # 获取总玩家数
-            all_players = rank_system.get_rank_list(9999)  # 获取所有玩家
-            total_players = len(all_players)
+            total_players = rank_system.get_player_count()
             
             # 计算先手概率：基础概率50% + (排名/总人数)*30%
             # 如果没有排名或总玩家数为0，则使用基础概率50%
             if challenger_rank is not None and total_players > 0:
                 # 排名越大（越靠后），先手优势越大
-                first_attack_prob = 0.5 + (challenger_rank / total_players) * 0.3
+                first_attack_prob = FIRST_STRIKE_BASE_PROB + (challenger_rank / total_players) * FIRST_STRIKE_RANK_BONUS
             else:
-                first_attack_prob = 0.5  # 默认概率
+                first_attack_prob = FIRST_STRIKE_BASE_PROB  # 默认概率
                 
             current_attacker = "player2" if random.random() < first_attack_prob else "player1"
         
@@ -881,7 +1068,7 @@ class HarryPotterDuel:
             # 记录防御使用的魔法分数
             for defense_spell in self.defense_spells:
                 if defense_spell["name"] == defense["name"]:
-                    total_magic_power += 20  # 防御魔法固定20分
+                    total_magic_power += DEFENSE_POWER  # 防御魔法固定分数
                     break
                         
             # 转折描述与反击描述组合
@@ -936,65 +1123,47 @@ class HarryPotterDuel:
                 self.player1["hp"] = 0
                 winner, loser = self.player2, self.player1
         
-        # --- 修改：获取胜利者和失败者的最新数据 ---
-        # 在决斗结束后，重新获取双方数据以确保道具数量是当前的
-        winner_data = rank_system.get_player_data(winner["name"])
-        loser_data = rank_system.get_player_data(loser["name"])
-        # ---------------------------------------
+        # --- 道具效果处理逻辑：在结算事务中读取双方最新的道具数量 ---
+        def decide(winner_data, loser_data):
+            winner_points = total_magic_power # 基础胜利积分
+            loser_points = total_magic_power  # 基础失败扣分
+            used_item_winner = None # 记录胜利者使用的道具
+            used_item_loser = None  # 记录失败者使用的道具
+            # 检查失败者是否有魔法石 - 失败不扣分
+            if loser_data["items"].get("magic_stone", 0) > 0:
+                used_item_loser = "magic_stone"
+                loser_points = 0  # 不扣分
+            # 检查胜利者是否有老魔杖 - 胜利积分×5 (独立于魔法石判断)
+            if winner_data["items"].get("elder_wand", 0) > 0:
+                used_item_winner = "elder_wand"
+                winner_points *= ELDER_WAND_MULTIPLIER
+            return winner_points, loser_points, used_item_winner, used_item_loser
         
-        # --- 修改：道具效果处理逻辑 ---
-        used_item_winner = None # 记录胜利者使用的道具
-        used_item_loser = None  # 记录失败者使用的道具
-        winner_points = total_magic_power # 基础胜利积分
-        loser_points = total_magic_power  # 基础失败扣分
+        # 一个事务完成读取、积分更新、道具消耗和排名查询
+        settlement = rank_system.settle_duel(winner["name"], loser["name"], decide)
+        if settlement is None:
+            self.steps.append("⚠️ 保存决斗结果时发生错误，本场积分未记录")
+            winner_points, loser_points, used_item_winner, used_item_loser = total_magic_power, total_magic_power, None, None
+            rank = None
+            updated_winner_data, updated_loser_data = {"items": {}}, {"items": {}}
+        else:
+            winner_points, loser_points = settlement["winner_points"], settlement["loser_points"]
+            used_item_winner, used_item_loser = settlement["winner_item"], settlement["loser_item"]
+            rank = settlement["winner_rank"]
+            updated_winner_data, updated_loser_data = settlement["winner"], settlement["loser"]
+            logger_duel.info(f"数据库更新成功: 胜者 {winner['name']} +{winner_points}, 败者 {loser['name']} -{loser_points}")
         
-        # 检查失败者是否有魔法石 - 失败不扣分
-        if loser_data["items"].get("magic_stone", 0) > 0:
+        if used_item_loser == "magic_stone":
             self.steps.append(f"💎 {loser['name']} 使用了魔法石，虽然失败但是痊愈了！")
-            used_item_loser = "magic_stone"
-            loser_points = 0  # 不扣分
-        
-        # 检查胜利者是否有老魔杖 - 胜利积分×5 (独立于魔法石判断)
-        if winner_data["items"].get("elder_wand", 0) > 0:
+        if used_item_winner == "elder_wand":
             # 如果失败者没用魔法石，才显示胜利加成信息（避免信息重复）
             if used_item_loser != "magic_stone":
                 self.steps.append(f"🪄 {winner['name']} 使用了老魔杖，魔法威力增加了五倍！")
             else: # 如果失败者用了魔法石，补充说明胜利者也用了老魔杖
                  self.steps.append(f"🪄 同时，{winner['name']} 使用了老魔杖，得分加倍！")
-            used_item_winner = "elder_wand"
-            winner_points *= 5 # 积分乘以5
         
-        # --- 整合使用的道具信息 ---
-        # 注意：record_duel_result 目前只支持记录一个 used_item
-        # 为了兼容，优先记录影响积分计算的道具
-        final_used_item = used_item_winner or used_item_loser # 优先记录胜利者道具，其次失败者道具
-        # --------------------------
-        
-        # 使用 record_duel_result 方法记录结果并更新数据库
-        try:
-            # 调用新的记录结果方法，它会处理积分更新、道具消耗和历史记录
-            # **注意：需要修改 record_duel_result 来正确处理道具消耗**
-            actual_winner_points, actual_loser_points = rank_system.record_duel_result(
-                winner=winner["name"],
-                loser=loser["name"],
-                winner_points=winner_points,
-                loser_points=loser_points, # 传递可能为0的扣分值
-                total_magic_power=total_magic_power,
-                used_item=final_used_item # 传递最终决定的使用道具
-            )
-            logger_duel.info(f"数据库更新成功: 胜者 {winner['name']} +{actual_winner_points}, 败者 {loser['name']} -{actual_loser_points}")
-        except Exception as e:
-            logger_duel.error(f"调用 record_duel_result 时发生错误: {e}", exc_info=True)
-            self.steps.append(f"⚠️ 保存决斗结果时发生错误: {e}")
-        
-        # 获取胜利者当前排名
-        rank, _ = rank_system.get_player_rank(winner["name"])
         rank_text = f"第{rank}名" if rank else "暂无排名"
         
-        # 重新获取玩家数据以显示正确的道具数量 (在调用 record_duel_result 后获取)
-        updated_winner_data = rank_system.get_player_data(winner["name"])
-        updated_loser_data = rank_system.get_player_data(loser["name"])
-        
         # 选择胜利描述
         victory_desc = random.choice(self.victory_descriptions)
         
@@ -1019,34 +1188,22 @@ class HarryPotterDuel:
     # --- 新增：处理隐身衣直接获胜的辅助方法 ---
     def _handle_direct_win(self, rank_system, winner, loser, winner_points, loser_points, used_item, winner_original_data):
         """处理因隐身衣直接获胜的情况，更新数据库并格式化消息"""
-        try:
-            # 直接调用 record_duel_result 来处理数据库更新
-            # 注意：这里 total_magic_power 为 0，因为没有进行魔法对决
-            rank_system.record_duel_result(
-                winner=winner["name"],
-                loser=loser["name"],
-                winner_points=winner_points,
-                loser_points=loser_points,
-                total_magic_power=0, # 隐身衣获胜没有魔法力计算
-                used_item=used_item
-            )
-            logger_duel.info(f"{winner['name']} 使用隐身衣击败 {loser['name']}，积分 +{winner_points}")
-
-            # 重新获取更新后的玩家数据以显示剩余道具
-            updated_winner_data = rank_system.get_player_data(winner["name"])
-
-        except sqlite3.Error as e:
-            logger_duel.error(f"处理隐身衣胜利时数据库出错: {e}", exc_info=True)
-            self.steps.append(f"⚠️ 处理隐身衣胜利时遇到数据库问题: {e}")
+        # 注意：这里没有进行魔法对决，积分和道具消耗固定
+        settlement = rank_system.settle_duel(
+            winner["name"], loser["name"],
+            lambda w, l: (winner_points, loser_points, used_item, None)
+        )
+        if settlement is None:
+            self.steps.append("⚠️ 处理隐身衣胜利时遇到数据库问题，本场积分未记录")
             # 数据库出错时，仍使用原始数据显示结果，避免程序崩溃
             updated_winner_data = winner_original_data
-        except Exception as e: # 捕获其他可能的异常
-             logger_duel.error(f"处理隐身衣胜利时发生未知错误: {e}", exc_info=True)
-             self.steps.append(f"⚠️ 处理隐身衣胜利时发生内部错误: {e}")
-             updated_winner_data = winner_original_data
+            rank = None
+        else:
+            logger_duel.info(f"{winner['name']} 使用隐身衣击败 {loser['name']}，积分 +{winner_points}")
+            # 结算后的玩家数据，用于显示剩余道具
+            updated_winner_data = settlement["winner"]
+            rank = settlement["winner_rank"]
 
-        # 获取胜利者当前排名
-        rank, _ = rank_system.get_player_rank(winner["name"])
         rank_text = f"第{rank}名" if rank else "暂无排名"
 
         # 添加结果
@@ -1096,7 +1253,7 @@ def get_rank_list(top_n: int = 10, group_id=None) -> str:
         return "❌ 决斗排行榜功能只支持群聊"
         
     try:
-        rank_system = DuelRankSystem(group_id)
+        rank_system = get_rank_system(group_id)
         ranks = rank_system.get_rank_list(top_n)
         
         if not ranks:
@@ -1125,7 +1282,7 @@ def get_player_stats(player_name: str, group_id=None) -> str:
         return "❌ 决斗战绩查询功能只支持群聊"
         
     try:
-        rank_system = DuelRankSystem(group_id)
+        rank_system = get_rank_system(group_id)
         rank, player_data = rank_system.get_player_rank(player_name)
         
         win_rate = int((player_data["wins"] / player_data["total_matches"]) * 100) if player_data["total_matches"] > 0 else 0
@@ -1161,7 +1318,7 @@ def change_player_name(old_name: str, new_name: str, group_id=None) -> str:
         return "❌ 更改玩家名称功能只支持群聊"
         
     try:
-        rank_system = DuelRankSystem(group_id)
+        rank_system = get_rank_system(group_id)
         result = rank_system.change_player_name(old_name, new_name)
         
         if result:
@@ -1172,69 +1329,207 @@ def change_player_name(old_name: str, new_name: str, group_id=None) -> str:
         logging.error(f"更改玩家名称失败: {e}")
         return f"❌ 更改玩家名称失败: {e}"
 
+def add_score(group_id: str, player_name: str, delta: int) -> Optional[int]:
+    """给本群玩家原子加分（不存在则创建）
+
+    Args:
+        group_id: 群组ID，必须提供
+        player_name: 玩家名称
+        delta: 积分增量，可为负
+
+    Returns:
+        Optional[int]: 更新后的积分，失败时返回 None
+    """
+    return get_rank_system(group_id).add_score(player_name, delta)
+
+# DuelManager.request_duel 的返回状态
+DUEL_STARTED = "started"    # 已开始
+DUEL_QUEUED = "queued"      # 已进入排队
+DUEL_REJECTED = "rejected"  # 队列已满，被拒绝
+
 class DuelManager:
-    """决斗管理器，处理决斗线程和消息发送"""
+    """决斗管理器，处理决斗调度和消息发送
     
-    def __init__(self, message_sender_func):
+    每个群同一时间只进行一场决斗，不同群的决斗可以同时进行，总并发数不超过 max_concurrent。
+    群内已有决斗或达到全局并发上限时，新的决斗进入该群的等待队列（最多 max_queue_per_group 场），
+    有决斗结束时按排队先后启动等待中的决斗。
+    
+    决斗过程在开始时一次性生成，由单个解说线程按 (到期时间, 序号, 群id) 小顶堆逐步发送，
+    不再为每场决斗占用一个 sleep 线程。下一步在上一步真正发出后再等待 step_interval 秒，
+    发送队列因限流推迟时解说节奏随之放慢，不会把消息堆积在发送队列里。
+    """
+    
+    def __init__(self, message_sender_func, max_concurrent: int = 5, max_queue_per_group: int = 3,
+                 step_interval: float = 1.5):
         """
         初始化决斗管理器
         
         Args:
-            message_sender_func: 消息发送函数，接收(message, receiver)两个参数
+            message_sender_func: 消息发送函数，接收(message, receiver)两个参数；返回 Future 时以其完成时间作为节奏基准
+            max_concurrent: 全局最多同时进行的决斗数
+            max_queue_per_group: 每个群最多排队等待的决斗数
+            step_interval: 决斗每步之间的间隔（秒）
         """
         self.message_sender = message_sender_func
-        self._duel_thread = None
-        self._duel_lock = Lock()
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_per_group = max(0, max_queue_per_group)
+        self.step_interval = step_interval
+        self._active: Dict[str, Optional[deque]] = {}  # group_id -> 剩余的决斗步骤（None 表示正在生成）
+        self._waiting: "OrderedDict[str, deque]" = OrderedDict()  # group_id -> 等待中的决斗参数，按首次排队先后排序
+        self._timeline: List[Tuple[float, int, str]] = []  # (到期时间, 序号, group_id)
+        self._seq = itertools.count()
+        self._duel_lock = Condition()
+        self._stopping = False
+        self._narrator: Optional[Thread] = None
         self.LOG = logging.getLogger("DuelManager")
     
-    def send_duel_message(self, msg: str, receiver: str) -> None:
+    def send_duel_message(self, msg: str, receiver: str):
         """发送决斗消息
         
         Args:
             msg: 消息内容
             receiver: 接收者ID（通常是群ID）
+            
+        Returns:
+            消息发送函数的返回值，发送失败时为 None
         """
         try:
             self.LOG.info(f"发送决斗消息 To {receiver}: {msg[:20]}...")
-            self.message_sender(msg, receiver)
+            return self.message_sender(msg, receiver)
         except Exception as e:
             self.LOG.error(f"发送决斗消息失败: {e}")
+            return None
+    
+    def _launch(self, challenger_name, opponent_name, receiver, is_group) -> None:
+        """生成决斗过程并交给解说线程（本群的名额已由调用方预留，不持有锁调用）"""
+        if not is_group:
+            # 确保只在群聊中运行决斗
+            duel_steps = ["❌ 决斗功能只支持群聊"]
+        else:
+            try:
+                # 传递群组ID参数，challenger_name是发起者
+                duel_steps = start_duel(challenger_name, opponent_name, receiver, True)
+            except Exception as e:
+                self.LOG.error(f"决斗过程中发生错误: {e}")
+                duel_steps = [f"决斗过程中发生错误: {e}"]
+        
+        with self._duel_lock:
+            self._active[receiver] = deque(duel_steps)
+            self._schedule_locked(receiver, 0)
+            self._ensure_narrator_locked()
+    
+    def _launch_waiting(self) -> None:
+        """按排队先后启动可以开始的决斗"""
+        ready = []
+        with self._duel_lock:
+            for group_id in list(self._waiting.keys()):
+                if len(self._active) >= self.max_concurrent:
+                    break
+                if group_id in self._active:
+                    continue
+                queue = self._waiting[group_id]
+                args = queue.popleft()
+                if not queue:
+                    del self._waiting[group_id]
+                self._active[group_id] = None
+                ready.append(args)
+        for args in ready:
+            self._launch(*args)
+    
+    def _schedule_locked(self, group_id: str, delay: float) -> None:
+        """安排本群 delay 秒后发送下一步（调用方需持有 _duel_lock）"""
+        heapq.heappush(self._timeline, (time.monotonic() + delay, next(self._seq), group_id))
+        self._duel_lock.notify()
+    
+    def _schedule(self, group_id: str, delay: float) -> None:
+        with self._duel_lock:
+            self._schedule_locked(group_id, delay)
+    
+    def _ensure_narrator_locked(self) -> None:
+        """按需启动解说线程（调用方需持有 _duel_lock）"""
+        if self._narrator is None or not self._narrator.is_alive():
+            self._stopping = False
+            self._narrator = Thread(target=self._narrate_loop, name="DuelNarrator", daemon=True)
+            self._narrator.start()
     
-    def run_duel(self, challenger_name, opponent_name, receiver, is_group=False):
-        """在单独线程中运行决斗
+    def _next_due(self) -> Optional[str]:
+        """等待并取出下一个到期的群；停止时返回 None"""
+        with self._duel_lock:
+            while not self._stopping:
+                if not self._timeline:
+                    self._duel_lock.wait()
+                    continue
+                due, _, group_id = self._timeline[0]
+                now = time.monotonic()
+                if due > now:
+                    self._duel_lock.wait(due - now)
+                    continue
+                heapq.heappop(self._timeline)
+                return group_id
+            return None
+    
+    def _narrate_loop(self) -> None:
+        """解说线程：按时间线逐步发送所有进行中决斗的下一步"""
+        while True:
+            group_id = self._next_due()
+            if group_id is None:
+                return
+            
+            with self._duel_lock:
+                steps = self._active.get(group_id)
+                step = steps.popleft() if steps else None
+            
+            if step is None:
+                # 最后一步已发出并过了间隔，释放本群名额并启动排队中的决斗
+                with self._duel_lock:
+                    self._active.pop(group_id, None)
+                self.LOG.info(f"群 {group_id} 的决斗已结束")
+                self._launch_waiting()
+                continue
+            
+            result = self.send_duel_message(step, group_id)
+            if isinstance(result, Future):
+                # 等消息真正发出（可能被限流推迟）后再开始计时
+                result.add_done_callback(lambda _, g=group_id: self._schedule(g, self.step_interval))
+            else:
+                self._schedule(group_id, self.step_interval)
+    
+    def request_duel(self, challenger_name, opponent_name, receiver, is_group=False) -> Tuple[str, int]:
+        """请求一场决斗：能开始则立即开始，否则进入本群的等待队列
         
         Args:
             challenger_name: 挑战者名称
             opponent_name: 对手名称
             receiver: 消息接收者(群id)
             is_group: 是否是群聊
+            
+        Returns:
+            Tuple[str, int]: (DUEL_STARTED/DUEL_QUEUED/DUEL_REJECTED, 排队时前面还有几场本群的决斗)
         """
-        try:
-            # 确保只在群聊中运行决斗
-            if not is_group:
-                self.send_duel_message("❌ 决斗功能只支持群聊", receiver)
-                return
+        with self._duel_lock:
+            queue = self._waiting.get(receiver)
+            can_start = receiver not in self._active and not queue and len(self._active) < self.max_concurrent
+            if can_start:
+                # 先预留名额，在锁外生成决斗过程
+                self._active[receiver] = None
+            else:
+                queued = len(queue) if queue else 0
+                if queued >= self.max_queue_per_group:
+                    return DUEL_REJECTED, queued
                 
-            # 开始决斗
-            # 传递群组ID参数
-            group_id = receiver
-            duel_steps = start_duel(challenger_name, opponent_name, group_id, True)  # challenger_name是发起者
-            
-            # 逐步发送决斗过程
-            for step in duel_steps:
-                self.send_duel_message(step, receiver)
-                time.sleep(1.5)  # 每步之间添加适当延迟
-        except Exception as e:
-            self.LOG.error(f"决斗过程中发生错误: {e}")
-            self.send_duel_message(f"决斗过程中发生错误: {e}", receiver)
-        finally:
-            # 释放决斗线程
-            with self._duel_lock:
-                self._duel_thread = None
-            self.LOG.info("决斗线程已结束并销毁")
+                if queue is None:
+                    queue = self._waiting[receiver] = deque()
+                queue.append((challenger_name, opponent_name, receiver, is_group))
+                # 前面的场次 = 本群正在进行的一场 + 本群排在前面的
+                ahead = queued + (1 if receiver in self._active else 0)
+                self.LOG.info(f"群 {receiver} 的决斗进入排队，前面还有 {ahead} 场")
+                return DUEL_QUEUED, ahead
+        
+        self._launch(challenger_name, opponent_name, receiver, is_group)
+        return DUEL_STARTED, 0
     
     def start_duel_thread(self, challenger_name, opponent_name, receiver, is_group=False):
-        """启动决斗线程
+        """启动决斗（兼容旧接口，排队也视为成功）
         
         Args:
             challenger_name: 挑战者名称
@@ -1243,28 +1538,56 @@ class DuelManager:
             is_group: 是否是群聊
             
         Returns:
-            bool: 是否成功启动决斗线程
+            bool: 决斗是否已开始或已进入排队
         """
-        with self._duel_lock:
-            if self._duel_thread is not None and self._duel_thread.is_alive():
-                return False
-            
-            self._duel_thread = Thread(
-                target=self.run_duel,
-                args=(challenger_name, opponent_name, receiver, is_group),
-                daemon=True
-            )
-            self._duel_thread.start()
-            return True
+        status, _ = self.request_duel(challenger_name, opponent_name, receiver, is_group)
+        return status != DUEL_REJECTED
     
-    def is_duel_running(self):
+    def is_duel_running(self, group_id: Optional[str] = None):
         """检查是否有决斗正在进行
         
+        Args:
+            group_id: 群组ID，为空时检查所有群
+            
         Returns:
             bool: 是否有决斗正在进行
         """
         with self._duel_lock:
-            return self._duel_thread is not None and self._duel_thread.is_alive()
+            if group_id is not None:
+                return group_id in self._active
+            return bool(self._active)
+    
+    def get_duel_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各群正在进行和排队中的决斗数
+        
+        Returns:
+            Dict[str, Dict[str, int]]: {group_id: {"active": 0或1, "queued": 排队数}}
+        """
+        with self._duel_lock:
+            stats = {}
+            for group_id in set(self._active) | set(self._waiting):
+                stats[group_id] = {
+                    "active": 1 if group_id in self._active else 0,
+                    "queued": len(self._waiting.get(group_id, ())),
+                }
+            return stats
+    
+    def stop(self, timeout: float = 5) -> None:
+        """停止解说线程，未发完的决斗步骤和排队中的决斗会被丢弃"""
+        with self._duel_lock:
+            self._stopping = True
+            self._duel_lock.notify()
+            narrator = self._narrator
+        if narrator is not None:
+            narrator.join(timeout)
+        with self._duel_lock:
+            dropped = len(self._active) + sum(len(q) for q in self._waiting.values())
+            self._active.clear()
+            self._waiting.clear()
+            self._timeline.clear()
+            self._narrator = None
+        if dropped:
+            self.LOG.warning(f"决斗管理器已停止，丢弃了 {dropped} 场未完成的决斗")
 
 # --- 新增：偷袭成功/失败的随机句子 ---
 SNEAK_ATTACK_SUCCESS_MESSAGES = [
@@ -1322,220 +1645,186 @@ def attempt_sneak_attack(attacker_name: str, target_name: str, group_id: str) ->
         return "❌ 偷袭功能也只支持群聊哦。"
 
     try:
-        rank_system = DuelRankSystem(group_id)
+        rank_system = get_rank_system(group_id)
 
-        # 检查玩家是否存在
-        with rank_system._db_lock:
-            with rank_system._get_db_conn() as conn:
-                cursor = conn.cursor()
-                
-                # 检查偷袭者是否存在
-                cursor.execute(
-                    "SELECT COUNT(*) as count FROM duel_players WHERE group_id = ? AND player_name = ?",
-                    (group_id, attacker_name)
-                )
-                if cursor.fetchone()["count"] == 0:
-                    return f"❌ 偷袭发起者 {attacker_name} 还没有决斗记录。"
-                
-                # 检查目标是否存在
-                cursor.execute(
-                    "SELECT COUNT(*) as count FROM duel_players WHERE group_id = ? AND player_name = ?",
-                    (group_id, target_name)
-                )
-                if cursor.fetchone()["count"] == 0:
-                    return f"❌ 目标 {target_name} 还没有决斗记录。"
-                
-                # 获取偷袭者排名
-                cursor.execute("""
-                SELECT COUNT(*) + 1 as rank FROM duel_players 
-                WHERE group_id = ? AND score > (
-                    SELECT score FROM duel_players 
-                    WHERE group_id = ? AND player_name = ?
-                )""", (group_id, group_id, attacker_name))
-                attacker_rank_result = cursor.fetchone()
-                attacker_rank = attacker_rank_result["rank"] if attacker_rank_result else None
-                
-                # 获取目标排名
-                cursor.execute("""
-                SELECT COUNT(*) + 1 as rank FROM duel_players 
-                WHERE group_id = ? AND score > (
-                    SELECT score FROM duel_players 
-                    WHERE group_id = ? AND player_name = ?
-                )""", (group_id, group_id, target_name))
-                target_rank_result = cursor.fetchone()
-                target_rank = target_rank_result["rank"] if target_rank_result else None
+        # 检查玩家是否存在（排行榜缓存即为数据库中已提交的数据）
+        if rank_system.leaderboard.get(attacker_name) is None:
+            return f"❌ 偷袭发起者 {attacker_name} 还没有决斗记录。"
+        if rank_system.leaderboard.get(target_name) is None:
+            return f"❌ 目标 {target_name} 还没有决斗记录。"
+
+        with rank_system._write(attacker_name, target_name) as conn:
+            cursor = conn.cursor()
                 
-                # 获取总玩家数
-                cursor.execute("SELECT COUNT(*) as count FROM duel_players WHERE group_id = ?", (group_id,))
-                total_players = cursor.fetchone()["count"]
+            # 获取双方排名和总玩家数
+            attacker_rank = rank_system.leaderboard.rank_of(attacker_name)
+            target_rank = rank_system.leaderboard.rank_of(target_name)
+            total_players = len(rank_system.leaderboard)
                 
-                # 计算成功率
-                success_prob = 0.3  # 基础成功率 30%
+            # 计算成功率
+            success_prob = SNEAK_BASE_PROB  # 基础成功率
                 
-                # 计算概率加成（仅当双方都有排名且总人数大于0时）
-                if attacker_rank is not None and target_rank is not None and total_players > 0:
-                    if attacker_rank > target_rank:  # 偷袭者排名更低
-                        rank_difference = attacker_rank - target_rank
-                        # 排名差值影响概率，最多增加 40%
-                        success_prob += min((rank_difference / total_players) * 0.4, 0.4)
-                    # else: 偷袭者排名更高或相同，使用基础概率 30%
+            # 计算概率加成（仅当双方都有排名且总人数大于0时）
+            if attacker_rank is not None and target_rank is not None and total_players > 0:
+                if attacker_rank > target_rank:  # 偷袭者排名更低
+                    rank_difference = attacker_rank - target_rank
+                    # 排名差值影响概率，最多增加 40%
+                    success_prob += min((rank_difference / total_players) * SNEAK_RANK_BONUS, SNEAK_RANK_BONUS)
+                # else: 偷袭者排名更高或相同，使用基础概率 30%
 
-                # 确保概率在 0 到 1 之间
-                success_prob = max(0, min(1, success_prob))
+            # 确保概率在 0 到 1 之间
+            success_prob = max(0, min(1, success_prob))
 
-                # 格式化概率显示为0-100%的百分比
-                prob_percent = success_prob * 100
-                logger_duel.info(f"偷袭计算: {attacker_name}({attacker_rank}) vs {target_name}({target_rank}), 总人数: {total_players}, 成功率: {prob_percent:.1f}%")
+            # 格式化概率显示为0-100%的百分比
+            prob_percent = success_prob * 100
+            logger_duel.info(f"偷袭计算: {attacker_name}({attacker_rank}) vs {target_name}({target_rank}), 总人数: {total_players}, 成功率: {prob_percent:.1f}%")
 
-                roll_successful = random.random() < success_prob
-                points_exchanged_successfully = False  # 标记是否成功转移了分数
+            roll_successful = random.random() < success_prob
+            points_exchanged_successfully = False  # 标记是否成功转移了分数
 
-                # 决定偷袭是否成功
-                if roll_successful:
-                    # --- 偷袭概率判定成功，尝试计算分数转移 ---
-                    # 获取分数差
-                    cursor.execute("""
-                    SELECT t1.score as attacker_score, t2.score as target_score
-                    FROM duel_players t1, duel_players t2
-                    WHERE t1.group_id = ? AND t1.player_name = ? 
-                      AND t2.group_id = ? AND t2.player_name = ?
-                    """, (group_id, attacker_name, group_id, target_name))
-                    result = cursor.fetchone()
-                    # 添加检查，以防万一查询不到结果
-                    if not result:
-                        logger_duel.error(f"偷袭成功后查询分数失败: {attacker_name} vs {target_name}")
-                        return "❌ 处理偷袭时发生内部错误：无法获取玩家分数。"
+            # 决定偷袭是否成功
+            if roll_successful:
+                # --- 偷袭概率判定成功，尝试计算分数转移 ---
+                # 获取分数差
+                cursor.execute("""
+                SELECT t1.score as attacker_score, t2.score as target_score
+                FROM duel_players t1, duel_players t2
+                WHERE t1.group_id = ? AND t1.player_name = ? 
+                  AND t2.group_id = ? AND t2.player_name = ?
+                """, (group_id, attacker_name, group_id, target_name))
+                result = cursor.fetchone()
+                # 添加检查，以防万一查询不到结果
+                if not result:
+                    logger_duel.error(f"偷袭成功后查询分数失败: {attacker_name} vs {target_name}")
+                    return "❌ 处理偷袭时发生内部错误：无法获取玩家分数。"
                         
-                    attacker_score = result["attacker_score"]
-                    target_score = result["target_score"]
+                attacker_score = result["attacker_score"]
+                target_score = result["target_score"]
                     
-                    # 1. 计算潜在偷取分数
-                    score_difference = abs(attacker_score - target_score)
-                    potential_points_stolen = max(random.randint(10, 50), int(score_difference * 0.1))  # 偷取(10-50)或分数差的10%，取最大值
+                # 1. 计算潜在偷取分数
+                score_difference = abs(attacker_score - target_score)
+                potential_points_stolen = max(random.randint(SNEAK_MIN_STEAL, SNEAK_MAX_STEAL), int(score_difference * SNEAK_STEAL_DIFF_RATIO))  # 偷取(10-50)或分数差的10%，取最大值
 
-                    # 2. 计算目标实际能损失的最大分数 (最低保留1分)
-                    max_points_target_can_lose = max(0, target_score - 1)
+                # 2. 计算目标实际能损失的最大分数 (最低保留1分)
+                max_points_target_can_lose = max(0, target_score - 1)
 
-                    # 3. 确定实际交换的分数
-                    actual_points_exchanged = min(potential_points_stolen, max_points_target_can_lose)
+                # 3. 确定实际交换的分数
+                actual_points_exchanged = min(potential_points_stolen, max_points_target_can_lose)
 
-                    # 只有实际交换分数大于0时才更新数据库和记录历史
-                    if actual_points_exchanged > 0:
-                        # 更新分数 (零和交换)
-                        cursor.execute(
-                            "UPDATE duel_players SET score = score + ? WHERE group_id = ? AND player_name = ?",
-                            (actual_points_exchanged, group_id, attacker_name)
-                        )
-                        cursor.execute(
-                            "UPDATE duel_players SET score = score - ? WHERE group_id = ? AND player_name = ?",
-                            (actual_points_exchanged, group_id, target_name)
-                        )
+                # 只有实际交换分数大于0时才更新数据库和记录历史
+                if actual_points_exchanged > 0:
+                    # 更新分数 (零和交换)
+                    cursor.execute(
+                        "UPDATE duel_players SET score = score + ? WHERE group_id = ? AND player_name = ?",
+                        (actual_points_exchanged, group_id, attacker_name)
+                    )
+                    cursor.execute(
+                        "UPDATE duel_players SET score = score - ? WHERE group_id = ? AND player_name = ?",
+                        (actual_points_exchanged, group_id, target_name)
+                    )
                         
-                        # 移除了记录到历史记录的代码
+                    # 移除了记录到历史记录的代码
                         
-                        # 提交事务
-                        conn.commit()
-                        logger_duel.info(f"偷袭成功: {attacker_name} 偷取 {target_name} {actual_points_exchanged} 分 (原目标分数: {target_score}, 潜在偷取: {potential_points_stolen})")
+                    logger_duel.info(f"偷袭成功: {attacker_name} 偷取 {target_name} {actual_points_exchanged} 分 (原目标分数: {target_score}, 潜在偷取: {potential_points_stolen})")
                         
-                        # 选择并格式化成功消息 (使用 actual_points_exchanged)
-                        message_template = random.choice(SNEAK_ATTACK_SUCCESS_MESSAGES)
-                        result_message = message_template.format(attacker=attacker_name, target=target_name, points=actual_points_exchanged)
+                    # 选择并格式化成功消息 (使用 actual_points_exchanged)
+                    message_template = random.choice(SNEAK_ATTACK_SUCCESS_MESSAGES)
+                    result_message = message_template.format(attacker=attacker_name, target=target_name, points=actual_points_exchanged)
                         
-                        points_exchanged_successfully = True  # 标记成功转移了分数
-                        return result_message  # 只有在成功转移分数时才直接返回
-                    else:
-                        # 如果实际交换分数为0 (例如目标只有1分)
-                        logger_duel.info(f"偷袭概率判定成功但未发生分数转移: {attacker_name} 偷袭 {target_name} (目标分数: {target_score})，转为尝试偷道具...")
-                        # 不设置 points_exchanged_successfully = True
-                        # 不返回，继续执行下面的偷道具逻辑
+                    points_exchanged_successfully = True  # 标记成功转移了分数
+                    return result_message  # 只有在成功转移分数时才直接返回
+                else:
+                    # 如果实际交换分数为0 (例如目标只有1分)
+                    logger_duel.info(f"偷袭概率判定成功但未发生分数转移: {attacker_name} 偷袭 {target_name} (目标分数: {target_score})，转为尝试偷道具...")
+                    # 不设置 points_exchanged_successfully = True
+                    # 不返回，继续执行下面的偷道具逻辑
                 
-                # --- 如果偷袭概率判定失败，或者判定成功但未转移分数，则尝试偷道具 ---
-                if not points_exchanged_successfully:  # 这个条件覆盖了概率判定失败和概率判定成功但未转移分数两种情况
-                    # 根据情况选择日志消息
-                    if not roll_successful:  # 如果是概率判定失败的情况
-                        logger_duel.info(f"偷袭分数失败: {attacker_name} 偷袭 {target_name}. 尝试根据目标道具数量计算偷道具概率...")
+            # --- 如果偷袭概率判定失败，或者判定成功但未转移分数，则尝试偷道具 ---
+            if not points_exchanged_successfully:  # 这个条件覆盖了概率判定失败和概率判定成功但未转移分数两种情况
+                # 根据情况选择日志消息
+                if not roll_successful:  # 如果是概率判定失败的情况
+                    logger_duel.info(f"偷袭分数失败: {attacker_name} 偷袭 {target_name}. 尝试根据目标道具数量计算偷道具概率...")
 
-                    # --- 修改：提前获取目标道具信息以计算概率 ---
-                    cursor.execute("""
-                    SELECT elder_wand, magic_stone, invisibility_cloak
-                    FROM duel_players
-                    WHERE group_id = ? AND player_name = ?
-                    """, (group_id, target_name))
-                    target_items_result = cursor.fetchone() # 使用新变量名避免混淆
+                # --- 修改：提前获取目标道具信息以计算概率 ---
+                cursor.execute("""
+                SELECT elder_wand, magic_stone, invisibility_cloak
+                FROM duel_players
+                WHERE group_id = ? AND player_name = ?
+                """, (group_id, target_name))
+                target_items_result = cursor.fetchone() # 使用新变量名避免混淆
 
-                    item_steal_prob = 0.0 # 初始化概率为 0
-                    total_items_count = 0
+                item_steal_prob = 0.0 # 初始化概率为 0
+                total_items_count = 0
 
-                    if target_items_result:
-                        # 计算总道具数量
-                        total_items_count = (target_items_result["elder_wand"] +
-                                             target_items_result["magic_stone"] +
-                                             target_items_result["invisibility_cloak"])
+                if target_items_result:
+                    # 计算总道具数量
+                    total_items_count = (target_items_result["elder_wand"] +
+                                         target_items_result["magic_stone"] +
+                                         target_items_result["invisibility_cloak"])
 
-                        # 计算动态概率，每件道具增加 1%
-                        item_steal_prob = total_items_count * 0.01
-                        logger_duel.info(f"目标共有 {total_items_count} 件道具，计算出的偷道具概率为: {item_steal_prob*100:.1f}% ")
-                    else:
-                         # 如果查询不到目标道具信息（理论上不应发生，因为前面检查过玩家存在）
-                         logger_duel.warning(f"未能查询到目标 {target_name} 的道具信息，无法计算偷道具概率。")
-                         item_steal_prob = 0.0 # 无法计算则概率为0
+                    # 计算动态概率，每件道具增加 1%
+                    item_steal_prob = total_items_count * SNEAK_ITEM_PROB_PER_ITEM
+                    logger_duel.info(f"目标共有 {total_items_count} 件道具，计算出的偷道具概率为: {item_steal_prob*100:.1f}% ")
+                else:
+                     # 如果查询不到目标道具信息（理论上不应发生，因为前面检查过玩家存在）
+                     logger_duel.warning(f"未能查询到目标 {target_name} 的道具信息，无法计算偷道具概率。")
+                     item_steal_prob = 0.0 # 无法计算则概率为0
 
-                    # --- 使用计算出的 item_steal_prob 进行判断 ---
-                    if total_items_count > 0 and random.random() < item_steal_prob:
-                        # --- 概率判定成功，且目标确实有道具可偷 ---
-                        logger_duel.info(f"偷道具判定成功 (概率 {item_steal_prob*100:.1f}%)，开始选择道具...")
+                # --- 使用计算出的 item_steal_prob 进行判断 ---
+                if total_items_count > 0 and random.random() < item_steal_prob:
+                    # --- 概率判定成功，且目标确实有道具可偷 ---
+                    logger_duel.info(f"偷道具判定成功 (概率 {item_steal_prob*100:.1f}%)，开始选择道具...")
                         
-                        # --- 复用之前获取的 target_items_result 构建列表 ---
-                        available_item_names = []
-                        item_weights = []
+                    # --- 复用之前获取的 target_items_result 构建列表 ---
+                    available_item_names = []
+                    item_weights = []
                             
-                        if target_items_result["elder_wand"] > 0:
-                            available_item_names.append("elder_wand")
-                            item_weights.append(target_items_result["elder_wand"])
+                    if target_items_result["elder_wand"] > 0:
+                        available_item_names.append("elder_wand")
+                        item_weights.append(target_items_result["elder_wand"])
                         
-                        if target_items_result["magic_stone"] > 0:
-                            available_item_names.append("magic_stone")
-                            item_weights.append(target_items_result["magic_stone"])
+                    if target_items_result["magic_stone"] > 0:
+                        available_item_names.append("magic_stone")
+                        item_weights.append(target_items_result["magic_stone"])
                         
-                        if target_items_result["invisibility_cloak"] > 0:
-                            available_item_names.append("invisibility_cloak")
-                            item_weights.append(target_items_result["invisibility_cloak"])
+                    if target_items_result["invisibility_cloak"] > 0:
+                        available_item_names.append("invisibility_cloak")
+                        item_weights.append(target_items_result["invisibility_cloak"])
                         
-                        # 这个检查理论上可以省略，因为前面 total_items_count > 0 已经保证了列表非空
-                        # 但为了代码健壮性可以保留
-                        if available_item_names:
-                            # 根据权重随机选择一件道具
-                            item_stolen = random.choices(available_item_names, weights=item_weights, k=1)[0]
-                            item_name_cn = ITEM_NAME_MAP.get(item_stolen, item_stolen)
+                    # 这个检查理论上可以省略，因为前面 total_items_count > 0 已经保证了列表非空
+                    # 但为了代码健壮性可以保留
+                    if available_item_names:
+                        # 根据权重随机选择一件道具
+                        item_stolen = random.choices(available_item_names, weights=item_weights, k=1)[0]
+                        item_name_cn = ITEM_NAME_MAP.get(item_stolen, item_stolen)
                             
-                            # 更新数据库：目标减道具，攻击者加道具
-                            sql_update_target = f"UPDATE duel_players SET {item_stolen} = MAX(0, {item_stolen} - 1) WHERE group_id = ? AND player_name = ?"
-                            sql_update_attacker = f"UPDATE duel_players SET {item_stolen} = {item_stolen} + 1 WHERE group_id = ? AND player_name = ?"
+                        # 更新数据库：目标减道具，攻击者加道具
+                        sql_update_target = f"UPDATE duel_players SET {item_stolen} = MAX(0, {item_stolen} - 1) WHERE group_id = ? AND player_name = ?"
+                        sql_update_attacker = f"UPDATE duel_players SET {item_stolen} = {item_stolen} + 1 WHERE group_id = ? AND player_name = ?"
                             
-                            cursor.execute(sql_update_target, (group_id, target_name))
-                            cursor.execute(sql_update_attacker, (group_id, attacker_name))
-                            conn.commit() # 偷道具成功，提交事务
+                        cursor.execute(sql_update_target, (group_id, target_name))
+                        cursor.execute(sql_update_attacker, (group_id, attacker_name))
                             
-                            # 选择并格式化偷道具成功消息
-                            message_template = random.choice(SNEAK_ATTACK_ITEM_SUCCESS_MESSAGES)
-                            result_message = message_template.format(attacker=attacker_name, target=target_name, item_name_cn=item_name_cn)
-                            logger_duel.info(f"偷道具成功: {attacker_name} 偷取了 {target_name} 的 {item_stolen}")
-                            # 偷到道具直接返回，不再执行后面的失败逻辑
-                            return result_message
-                        else:
-                             # 如果因为某种原因（例如并发问题），刚才还有道具现在没了
-                             logger_duel.warning(f"尝试偷取 {target_name} 道具时发现其道具列表为空，虽然 total_items_count > 0。")
-                             # 这里会继续执行下面的通用失败逻辑
-
-                    # --- 偷道具判定失败 或 目标没有任何道具 ---
-                    # (包括 total_items_count 为 0 的情况, 以及 random.random() >= item_steal_prob 的情况)
-                    message_template = random.choice(SNEAK_ATTACK_FAILURE_MESSAGES)
-                    result_message = message_template.format(attacker=attacker_name, target=target_name)
-                    if total_items_count == 0:
-                         logger_duel.info(f"偷袭完全失败: {attacker_name} 偷袭 {target_name}，且目标没有任何道具。")
+                        # 选择并格式化偷道具成功消息
+                        message_template = random.choice(SNEAK_ATTACK_ITEM_SUCCESS_MESSAGES)
+                        result_message = message_template.format(attacker=attacker_name, target=target_name, item_name_cn=item_name_cn)
+                        logger_duel.info(f"偷道具成功: {attacker_name} 偷取了 {target_name} 的 {item_stolen}")
+                        # 偷到道具直接返回，不再执行后面的失败逻辑
+                        return result_message
                     else:
-                         logger_duel.info(f"偷袭完全失败: {attacker_name} 偷袭 {target_name}，未达到偷道具概率 {item_steal_prob*100:.1f}%。")
-                    return result_message
+                         # 如果因为某种原因（例如并发问题），刚才还有道具现在没了
+                         logger_duel.warning(f"尝试偷取 {target_name} 道具时发现其道具列表为空，虽然 total_items_count > 0。")
+                         # 这里会继续执行下面的通用失败逻辑
+
+                # --- 偷道具判定失败 或 目标没有任何道具 ---
+                # (包括 total_items_count 为 0 的情况, 以及 random.random() >= item_steal_prob 的情况)
+                message_template = random.choice(SNEAK_ATTACK_FAILURE_MESSAGES)
+                result_message = message_template.format(attacker=attacker_name, target=target_name)
+                if total_items_count == 0:
+                     logger_duel.info(f"偷袭完全失败: {attacker_name} 偷袭 {target_name}，且目标没有任何道具。")
+                else:
+                     logger_duel.info(f"偷袭完全失败: {attacker_name} 偷袭 {target_name}，未达到偷道具概率 {item_steal_prob*100:.1f}%。")
+                return result_message
 
     except sqlite3.Error as e:
         logger_duel.error(f"处理偷袭时发生数据库错误: {e}", exc_info=True)
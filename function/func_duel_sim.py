@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+决斗平衡模拟器（离线，不访问 SQLite / wcf）
+
+复用 HarryPotterDuel 的咒语表和 func_duel 中的规则参数，用 NumPy 把 groups 个互不相干的群并行推进 steps 轮，
+每轮每个群随机发生一次事件（普通决斗 / Boss战 / 偷袭），统计胜率、积分通胀和道具经济的分布。
+
+用法:
+    python -m function.func_duel_sim --groups 20000 --steps 100 --seed 42
+"""
+
+import time
+from argparse import ArgumentParser
+from typing import Dict
+
+import numpy as np
+
+from function.func_duel import (
+    BOSS_LOSS_POINTS, BOSS_WIN_CHANCE, BOSS_WIN_POINTS, CLOAK_WIN_POINTS, DEFENSE_POWER,
+    DEFENSE_SUCCESS_RATE, ELDER_WAND_MULTIPLIER, FIRST_STRIKE_BASE_PROB, FIRST_STRIKE_RANK_BONUS,
+    SNEAK_BASE_PROB, SNEAK_ITEM_PROB_PER_ITEM, SNEAK_MAX_STEAL, SNEAK_MIN_STEAL, SNEAK_RANK_BONUS,
+    SNEAK_STEAL_DIFF_RATIO, HarryPotterDuel,
+)
+
+# 道具在数组最后一维中的下标
+WAND, STONE, CLOAK = 0, 1, 2
+ITEM_NAMES = ("老魔杖", "魔法石", "隐身衣")
+
+# 发起决斗 / 挑战Boss 所需的最低积分（与 handle_duel 中的资格检查一致）
+MIN_DUEL_SCORE = 100
+
+
+class DuelSimulator(object):
+    """向量化的决斗模拟器"""
+
+    def __init__(self, groups: int = 10000, players: int = 30, initial_score: int = 1000,
+                 boss_rate: float = 0.05, sneak_rate: float = 0.2, seed: int = None,
+                 defense_success_rate: float = DEFENSE_SUCCESS_RATE, boss_win_chance: float = BOSS_WIN_CHANCE) -> None:
+        """
+        :param groups: 并行模拟的群数量
+        :param players: 每个群的玩家数
+        :param initial_score: 初始积分
+        :param boss_rate: 每轮事件为Boss战的概率
+        :param sneak_rate: 每轮事件为偷袭的概率（其余为普通决斗）
+        :param seed: 随机种子，相同的种子和参数得到相同的结果
+        :param defense_success_rate: 防御成功率（默认取游戏中的值，可用于调参）
+        :param boss_win_chance: Boss战胜率（默认取游戏中的值，可用于调参）
+        """
+        if players < 2:
+            raise ValueError("每个群至少需要2名玩家")
+        self.groups = groups
+        self.players = players
+        self.initial_score = initial_score
+        self.boss_rate = boss_rate
+        self.sneak_rate = sneak_rate
+        self.defense_success_rate = defense_success_rate
+        self.boss_win_chance = boss_win_chance
+        self.rng = np.random.default_rng(seed)
+
+        # 咒语表与游戏完全一致
+        spells = HarryPotterDuel("甲", "乙", "simulator@chatroom").spells
+        self.spell_names = [spell["name"] for spell in spells]
+        self.spell_powers = np.array([spell["power"] for spell in spells], dtype=np.int64)
+        weights = np.array([spell["weight"] for spell in spells], dtype=np.float64)
+        self.spell_cdf = np.cumsum(weights / weights.sum())
+
+        self.scores = np.full((groups, players), initial_score, dtype=np.int64)
+        self.items = np.zeros((groups, players, 3), dtype=np.int64)
+        self.stats: Dict[str, int] = {}
+        self.spell_counts = np.zeros(len(spells), dtype=np.int64)
+        self.mean_score_history = []
+
+    def _count(self, key: str, value) -> None:
+        self.stats[key] = self.stats.get(key, 0) + int(value)
+
+    def _spells(self, size: int) -> np.ndarray:
+        """按权重抽取 size 个咒语，返回咒语下标"""
+        index = np.searchsorted(self.spell_cdf, self.rng.random(size), side="right")
+        return np.minimum(index, len(self.spell_cdf) - 1)
+
+    def _ranks(self, g: np.ndarray, p: np.ndarray) -> np.ndarray:
+        """排名 = 本群分数比该玩家高的人数 + 1（与 DuelLeaderboard.rank_of 一致）"""
+        return (self.scores[g] > self.scores[g, p][:, None]).sum(axis=1) + 1
+
+    def run(self, steps: int) -> Dict:
+        """推进 steps 轮并返回统计结果"""
+        all_groups = np.arange(self.groups)
+        started = time.perf_counter()
+        for _ in range(steps):
+            roll = self.rng.random(self.groups)
+            a = self.rng.integers(0, self.players, self.groups)
+            b = (a + self.rng.integers(1, self.players, self.groups)) % self.players  # 与 a 不同的玩家
+
+            boss = roll < self.boss_rate
+            sneak = (roll >= self.boss_rate) & (roll < self.boss_rate + self.sneak_rate)
+            duel = ~boss & ~sneak
+
+            self._boss(all_groups[boss], a[boss])
+            self._sneak(all_groups[sneak], a[sneak], b[sneak])
+            self._duel(all_groups[duel], a[duel], b[duel])
+            self.mean_score_history.append(float(self.scores.mean()))
+        elapsed = time.perf_counter() - started
+        return self.report(steps, elapsed)
+
+    def _boss(self, g: np.ndarray, p: np.ndarray) -> None:
+        eligible = self.scores[g, p] >= MIN_DUEL_SCORE
+        self._count("boss_blocked", (~eligible).sum())
+        g, p = g[eligible], p[eligible]
+        win = self.rng.random(len(g)) < self.boss_win_chance
+        self._count("boss_fights", len(g))
+        self._count("boss_wins", win.sum())
+
+        self.scores[g[win], p[win]] += BOSS_WIN_POINTS
+        self.items[g[win], p[win]] += 1  # 三件死亡圣器各一件
+        self._count("minted_items", 3 * win.sum())
+        lose_g, lose_p = g[~win], p[~win]
+        self.scores[lose_g, lose_p] = np.maximum(1, self.scores[lose_g, lose_p] - BOSS_LOSS_POINTS)
+
+    def _duel(self, g: np.ndarray, a: np.ndarray, b: np.ndarray) -> None:
+        eligible = (self.scores[g, a] >= MIN_DUEL_SCORE) & (self.scores[g, b] >= MIN_DUEL_SCORE)
+        self._count("duels_blocked", (~eligible).sum())
+        g, a, b = g[eligible], a[eligible], b[eligible]
+        n = len(g)
+        self._count("duels", n)
+        if n == 0:
+            return
+
+        # 开局隐身衣：只有一方有时直接获胜
+        cloak_a = self.items[g, a, CLOAK] > 0
+        cloak_b = self.items[g, b, CLOAK] > 0
+        direct = cloak_a ^ cloak_b
+
+        # 先手：挑战者 a 排名越靠后，先手概率越高
+        first_prob = FIRST_STRIKE_BASE_PROB + self._ranks(g, a) / self.players * FIRST_STRIKE_RANK_BONUS
+        a_first = self.rng.random(n) < first_prob
+
+        spell = self._spells(n)
+        counter = self._spells(n)
+        defended = self.rng.random(n) < self.defense_success_rate
+        np.add.at(self.spell_counts, spell[~direct], 1)
+        np.add.at(self.spell_counts, counter[~direct & defended], 1)
+        magic_power = self.spell_powers[spell] + np.where(defended, DEFENSE_POWER + self.spell_powers[counter], 0)
+
+        # 防御成功则防守方反制获胜，否则先手方获胜
+        a_wins = np.where(direct, cloak_a, a_first ^ defended)
+        winner = np.where(a_wins, a, b)
+        loser = np.where(a_wins, b, a)
+
+        winner_points = np.where(direct, CLOAK_WIN_POINTS, magic_power)
+        loser_points = winner_points.copy()
+
+        # 道具：隐身衣直接获胜时只消耗隐身衣；否则失败者魔法石免扣分、胜利者老魔杖积分翻倍
+        stone = ~direct & (self.items[g, loser, STONE] > 0)
+        wand = ~direct & (self.items[g, winner, WAND] > 0)
+        loser_points[stone] = 0
+        winner_points[wand] *= ELDER_WAND_MULTIPLIER
+        self.items[g[direct], winner[direct], CLOAK] -= 1
+        self.items[g[stone], loser[stone], STONE] -= 1
+        self.items[g[wand], winner[wand], WAND] -= 1
+
+        # 同一轮每个群只有一场决斗，下标不会重复，可以直接花式索引赋值
+        self.scores[g, winner] += winner_points
+        before = self.scores[g, loser]
+        after = np.maximum(1, before - loser_points)
+        self.scores[g, loser] = after
+
+        self._count("challenger_wins", a_wins.sum())
+        self._count("first_strikes", a_first[~direct].sum())
+        self._count("defenses", defended[~direct].sum())
+        self._count("cloak_wins", direct.sum())
+        self._count("wand_used", wand.sum())
+        self._count("stone_used", stone.sum())
+        self._count("cloak_used", direct.sum())
+        self._count("points_won", winner_points.sum())
+        self._count("points_lost", (before - after).sum())
+
+    def _sneak(self, g: np.ndarray, a: np.ndarray, b: np.ndarray) -> None:
+        n = len(g)
+        self._count("sneaks", n)
+        if n == 0:
+            return
+        rank_a, rank_b = self._ranks(g, a), self._ranks(g, b)
+        bonus = np.minimum((rank_a - rank_b) / self.players * SNEAK_RANK_BONUS, SNEAK_RANK_BONUS)
+        prob = np.clip(SNEAK_BASE_PROB + np.where(rank_a > rank_b, bonus, 0.0), 0, 1)
+        success = self.rng.random(n) < prob
+
+        score_a, score_b = self.scores[g, a], self.scores[g, b]
+        potential = np.maximum(self.rng.integers(SNEAK_MIN_STEAL, SNEAK_MAX_STEAL + 1, n),
+                               (np.abs(score_a - score_b) * SNEAK_STEAL_DIFF_RATIO).astype(np.int64))
+        stolen = np.minimum(potential, np.maximum(0, score_b - 1))
+        exchanged = success & (stolen > 0)
+        self.scores[g[exchanged], a[exchanged]] += stolen[exchanged]
+        self.scores[g[exchanged], b[exchanged]] -= stolen[exchanged]
+        self._count("sneak_point_wins", exchanged.sum())
+        self._count("sneak_points", stolen[exchanged].sum())
+
+        # 没偷到分时尝试偷道具：目标每件道具增加 1% 概率，按数量加权选择道具
+        target_items = self.items[g, b]
+        total_items = target_items.sum(axis=1)
+        try_item = ~exchanged & (total_items > 0)
+        item_success = try_item & (self.rng.random(n) < total_items * SNEAK_ITEM_PROB_PER_ITEM)
+        u = self.rng.random(n) * total_items
+        cumulative = np.cumsum(target_items, axis=1)
+        item = (u[:, None] >= cumulative).sum(axis=1)
+        idx = np.flatnonzero(item_success)
+        self.items[g[idx], b[idx], item[idx]] -= 1
+        self.items[g[idx], a[idx], item[idx]] += 1
+        self._count("sneak_item_wins", len(idx))
+
+    def report(self, steps: int, elapsed: float) -> Dict:
+        """汇总统计结果"""
+        s = self.stats
+        duels = max(1, s.get("duels", 0))
+        magic_duels = max(1, duels - s.get("cloak_wins", 0))
+        final = self.scores.ravel()
+        sorted_scores = np.sort(final)
+        cum = np.cumsum(sorted_scores, dtype=np.float64)
+        gini = float((len(final) + 1 - 2 * (cum / cum[-1]).sum()) / len(final)) if cum[-1] > 0 else 0.0
+        held = self.items.reshape(-1, 3)
+        events = s.get("duels", 0) + s.get("boss_fights", 0) + s.get("sneaks", 0)
+        spell_total = max(1, int(self.spell_counts.sum()))
+
+        return {
+            "events": events,
+            "events_per_sec": events / elapsed if elapsed > 0 else 0.0,
+            "win_rate": {
+                "challenger": s.get("challenger_wins", 0) / duels,
+                "first_strike": s.get("first_strikes", 0) / magic_duels,
+                "defense": s.get("defenses", 0) / magic_duels,
+                "cloak_direct_win": s.get("cloak_wins", 0) / duels,
+                "boss": s.get("boss_wins", 0) / max(1, s.get("boss_fights", 0)),
+                "sneak_points": s.get("sneak_point_wins", 0) / max(1, s.get("sneaks", 0)),
+                "sneak_item": s.get("sneak_item_wins", 0) / max(1, s.get("sneaks", 0)),
+            },
+            "score": {
+                "initial": self.initial_score,
+                "mean_final": float(final.mean()),
+                "inflation_per_step": (self.mean_score_history[-1] - self.initial_score) / steps if steps else 0.0,
+                "net_points_per_duel": (s.get("points_won", 0) - s.get("points_lost", 0)) / duels,
+                "percentiles": {q: float(np.percentile(final, q)) for q in (1, 10, 50, 90, 99)},
+                "gini": gini,
+                "blocked_below_min": (s.get("duels_blocked", 0) + s.get("boss_blocked", 0)) / max(1, events + s.get("duels_blocked", 0) + s.get("boss_blocked", 0)),
+            },
+            "items": {
+                "minted_per_type": s.get("boss_wins", 0),
+                "consumed": {
+                    ITEM_NAMES[WAND]: s.get("wand_used", 0),
+                    ITEM_NAMES[STONE]: s.get("stone_used", 0),
+                    ITEM_NAMES[CLOAK]: s.get("cloak_used", 0),
+                },
+                "mean_held": {ITEM_NAMES[i]: float(held[:, i].mean()) for i in range(3)},
+                "holders": {ITEM_NAMES[i]: float((held[:, i] > 0).mean()) for i in range(3)},
+                "max_held": int(held.sum(axis=1).max()),
+            },
+            "spells": {name: int(count) / spell_total for name, count in zip(self.spell_names, self.spell_counts)},
+        }
+
+
+def format_report(result: Dict) -> str:
+    """把统计结果格式化为文本"""
+    win, score, items = result["win_rate"], result["score"], result["items"]
+    lines = [
+        f"事件数: {result['events']:,}  ({result['events_per_sec']:,.0f} 次/秒)",
+        "",
+        "【胜率】",
+        f"  挑战者胜率: {win['challenger']:.2%}    先手率: {win['first_strike']:.2%}    防御成功率: {win['defense']:.2%}",
+        f"  隐身衣直接获胜: {win['cloak_direct_win']:.2%}    Boss战胜率: {win['boss']:.2%}",
+        f"  偷袭偷分成功: {win['sneak_points']:.2%}    偷道具成功: {win['sneak_item']:.2%}",
+        "",
+        "【积分】",
+        f"  初始: {score['initial']}    最终平均: {score['mean_final']:.1f}    每轮通胀: {score['inflation_per_step']:+.2f}",
+        f"  每场决斗净增积分: {score['net_points_per_duel']:+.2f}    基尼系数: {score['gini']:.3f}",
+        "  分位数: " + "  ".join(f"P{q}={v:.0f}" for q, v in score["percentiles"].items()),
+        f"  因积分不足100被拦下的比例: {score['blocked_below_min']:.2%}",
+        "",
+        "【道具】",
+        f"  每种道具产出: {items['minted_per_type']:,}",
+        "  消耗: " + "  ".join(f"{k}={v:,}" for k, v in items["consumed"].items()),
+        "  人均持有: " + "  ".join(f"{k}={v:.3f}" for k, v in items["mean_held"].items()),
+        "  持有者比例: " + "  ".join(f"{k}={v:.2%}" for k, v in items["holders"].items()),
+        f"  单人最多持有: {items['max_held']}",
+        "",
+        "【咒语出现频率】",
+        "  " + "  ".join(f"{k}={v:.2%}" for k, v in result["spells"].items()),
+    ]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = ArgumentParser(description="决斗平衡蒙特卡洛模拟器")
+    parser.add_argument("--groups", type=int, default=20000, help="并行模拟的群数量")
+    parser.add_argument("--players", type=int, default=30, help="每个群的玩家数")
+    parser.add_argument("--steps", type=int, default=100, help="每个群模拟的事件轮数")
+    parser.add_argument("--initial-score", type=int, default=1000, help="初始积分")
+    parser.add_argument("--boss-rate", type=float, default=0.05, help="事件为Boss战的概率")
+    parser.add_argument("--sneak-rate", type=float, default=0.2, help="事件为偷袭的概率")
+    parser.add_argument("--defense-rate", type=float, default=DEFENSE_SUCCESS_RATE, help="防御成功率")
+    parser.add_argument("--boss-win", type=float, default=BOSS_WIN_CHANCE, help="Boss战胜率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（用于复现结果）")
+    args = parser.parse_args()
+
+    simulator = DuelSimulator(args.groups, args.players, args.initial_score, args.boss_rate, args.sneak_rate,
+                              args.seed, args.defense_rate, args.boss_win)
+    print(format_report(simulator.run(args.steps)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import random
 from typing import TYPE_CHECKING, Callable, Any
 from wcferry import WxMsg
-from function.func_duel import DuelRankSystem
+from function.func_duel import add_score
 
 if TYPE_CHECKING:
     from logging import Logger
@@ -59,9 +59,6 @@ class GoblinGiftManager:
                 if not player_name:
                     player_name = msg.sender  # 如果获取不到昵称，用wxid代替
 
-                # 初始化对应群聊的积分系统
-                rank_system = DuelRankSystem(group_id=msg.roomid)
-
                 # 获取配置的积分范围，默认10-100
                 min_points = self.config.GOBLIN_GIFT.get('min_points', 10)
                 max_points = self.config.GOBLIN_GIFT.get('max_points', 100)
@@ -69,12 +66,10 @@ class GoblinGiftManager:
                 # 随机增加积分
                 points_added = random.randint(min_points, max_points)
 
-                # 更新玩家数据
-                player_data = rank_system.get_player_data(player_name)
-                player_data['score'] += points_added
-
-                # 保存数据
-                rank_system._save_ranks()
+                # 原子加分（单条 upsert 语句，玩家不存在时自动创建）
+                if add_score(msg.roomid, player_name, points_added) is None:
+                    self.LOG.error(f"古灵阁馈赠积分写入失败: 群 {msg.roomid}, 用户 {player_name}")
+                    return
 
                 # 准备随机馈赠消息
                 gift_sources = [
@@ -2,45 +2,94 @@
 
 import sqlite3
 import uuid
-import time
-import schedule
+import heapq
 from datetime import datetime, timedelta
 import logging
 import threading
-from typing import Optional, Dict, Tuple  # 添加类型提示导入
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, List, Tuple  # 添加类型提示导入
+
+from db_manager import get_db
 
 # 获取 Logger 实例
 logger = logging.getLogger("ReminderManager")
 
+# next_fire_at 的存储格式（精确到秒，字符串比较即时间比较）
+FIRE_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 投递重试参数
+DELIVERY_MAX_ATTEMPTS = 5       # 最多尝试发送次数，超过后放弃
+DELIVERY_RETRY_BASE = 10        # 第 n 次失败后等待 DELIVERY_RETRY_BASE * 2^(n-1) 秒再重试
+DELIVERY_SEND_TIMEOUT = 60      # 等待发送队列实际发出的最长时间（秒），超时按发送失败处理
+
+
+def compute_next_fire(reminder_type: str, time_str: str, weekday: Optional[int], after: datetime) -> Optional[datetime]:
+    """
+    计算提醒在 after 之后的下一次触发时间。
+    :param reminder_type: once / daily / weekly
+    :param time_str: once 为 'YYYY-MM-DD HH:MM'，daily/weekly 为 'HH:MM'
+    :param weekday: weekly 提醒的星期几 (0-6)
+    :param after: 基准时间，返回严格晚于它的触发时间（once 除外，once 直接返回设定时间）
+    :return: 下一次触发时间，无法计算时返回 None
+    """
+    try:
+        if reminder_type == "once":
+            return datetime.strptime(time_str, "%Y-%m-%d %H:%M")
+        hm = datetime.strptime(time_str, "%H:%M").time()
+    except (TypeError, ValueError):
+        return None
+    candidate = after.replace(hour=hm.hour, minute=hm.minute, second=0, microsecond=0)
+    if reminder_type == "daily":
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        return candidate
+    if reminder_type == "weekly" and weekday is not None:
+        candidate += timedelta(days=(weekday - candidate.weekday()) % 7)
+        if candidate <= after:
+            candidate += timedelta(days=7)
+        return candidate
+    return None
+
 class ReminderManager:
-    # 使用线程锁确保数据库操作的线程安全
-    _db_lock = threading.Lock()
+    """
+    提醒管理器。
+    每条提醒在创建和触发时预先算好 next_fire_at（带索引），内存中维护 (触发时间, 提醒ID) 小顶堆，
+    调度线程睡到堆顶的触发时间，醒来后用一次索引范围查询取出所有到期提醒，精确到秒。
+    堆中的条目可能已过期（提醒被删除），范围查询以数据库为准，过期条目只会导致一次空查询；
+    此外每 check_interval_minutes 兜底查询一次，覆盖其他进程写入的提醒。
+
+    触发分两步：调度线程在一个短事务里"认领"到期提醒——推进 next_fire_at（或删除一次性提醒），
+    同时把这一次要发的消息写入 reminder_deliveries 投递表；投递线程再逐条发送，确认发出后才删除投递记录，
+    失败按指数退避重试。发送期间不持有任何数据库锁。进程在认领后、发送前崩溃时，重启后投递表里的记录会继续发送，
+    不会丢失；同一次触发在投递表中只有一条记录 (reminder_id, fire_at)，不会被重复认领。
+    只有"已经发出但还没来得及删除投递记录"这一条 SQL 的窗口内崩溃才可能重发一次。
+    """
 
     def __init__(self, robot, db_path: str, check_interval_minutes=1):
         """
         初始化 ReminderManager。
         :param robot: Robot 实例，用于发送消息。
         :param db_path: SQLite 数据库文件路径。
-        :param check_interval_minutes: 检查提醒任务的频率（分钟）。
+        :param check_interval_minutes: 兜底检查间隔（分钟），即使堆中没有到期提醒也按此间隔做一次范围查询。
         """
         self.robot = robot
         self.db_path = db_path
+        self.db = get_db(db_path)  # 共享的线程本地连接池（WAL 模式）
+        self.check_interval = check_interval_minutes * 60
+        self._heap: List[Tuple[datetime, str]] = []  # (触发时间, 提醒ID)
+        self._cond = threading.Condition()
+        self._delivery_cond = threading.Condition()
+        self._stopping = False
+        self._delivered = set()  # 已发出但投递记录还没删掉的 id（删除失败时不再重发）
         self._create_table() # 初始化时确保表存在
+        self._load_heap()
 
-        # 注册周期性检查任务
-        schedule.every(check_interval_minutes).minutes.do(self.check_and_trigger_reminders)
-        logger.info(f"提醒管理器已初始化，连接到数据库 '{db_path}'，每 {check_interval_minutes} 分钟检查一次。")
-
-    def _get_db_conn(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        try:
-            # connect_timeout 增加等待时间，check_same_thread=False 允许其他线程使用 (配合锁)
-            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
-            conn.row_factory = sqlite3.Row # 让查询结果可以像字典一样访问列
-            return conn
-        except sqlite3.Error as e:
-            logger.error(f"无法连接到 SQLite 数据库 '{self.db_path}': {e}", exc_info=True)
-            raise # 连接失败是严重问题，直接抛出异常
+        # 投递线程先启动，处理上次退出时留下的未投递提醒
+        self._delivery = threading.Thread(target=self._deliver_loop, name="ReminderDelivery", daemon=True)
+        self._delivery.start()
+        self._scheduler = threading.Thread(target=self._run, name="ReminderScheduler", daemon=True)
+        self._scheduler.start()
+        logger.info(f"提醒管理器已初始化，连接到数据库 '{db_path}'，已加载 {len(self._heap)} 条待触发提醒。")
 
     def _create_table(self):
         """创建 reminders 表（如果不存在）"""
@@ -54,49 +103,167 @@ class ReminderManager:
             created_at TEXT NOT NULL,
             last_triggered_at TEXT,
             weekday INTEGER,
-            roomid TEXT
+            roomid TEXT,
+            next_fire_at TEXT
         );
         """
         # 创建索引的 SQL
         index_sql_wxid = "CREATE INDEX IF NOT EXISTS idx_reminders_wxid ON reminders (wxid);"
         index_sql_type = "CREATE INDEX IF NOT EXISTS idx_reminders_type ON reminders (type);"
         index_sql_roomid = "CREATE INDEX IF NOT EXISTS idx_reminders_roomid ON reminders (roomid);"
+        index_sql_next_fire = "CREATE INDEX IF NOT EXISTS idx_reminders_next_fire_at ON reminders (next_fire_at);"
+        # 投递表：已认领、待发送的提醒消息（发送成功后删除）
+        sql_deliveries = """
+        CREATE TABLE IF NOT EXISTS reminder_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reminder_id TEXT NOT NULL,
+            fire_at TEXT NOT NULL,
+            wxid TEXT NOT NULL,
+            roomid TEXT,
+            content TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            UNIQUE (reminder_id, fire_at)
+        );
+        """
+        index_sql_deliveries = "CREATE INDEX IF NOT EXISTS idx_reminder_deliveries_next_attempt ON reminder_deliveries (next_attempt_at);"
 
         try:
-            with self._db_lock: # 加锁保护数据库连接和操作
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    # 1. 先确保表存在
-                    cursor.execute(sql)
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                # 1. 先确保表存在
+                cursor.execute(sql)
                     
-                    # 2. 尝试添加新列（如果表已存在且没有该列）
-                    try:
-                        # 检查列是否存在
-                        cursor.execute("PRAGMA table_info(reminders);")
-                        columns = [col['name'] for col in cursor.fetchall()]
+                # 2. 尝试添加新列（如果表已存在且没有该列）
+                try:
+                    # 检查列是否存在
+                    cursor.execute("PRAGMA table_info(reminders);")
+                    columns = [col['name'] for col in cursor.fetchall()]
                         
-                        # 添加 weekday 列（如果不存在）
-                        if 'weekday' not in columns:
-                            cursor.execute("ALTER TABLE reminders ADD COLUMN weekday INTEGER;")
-                            logger.info("成功添加 'weekday' 列到 'reminders' 表。")
+                    # 添加 weekday 列（如果不存在）
+                    if 'weekday' not in columns:
+                        cursor.execute("ALTER TABLE reminders ADD COLUMN weekday INTEGER;")
+                        logger.info("成功添加 'weekday' 列到 'reminders' 表。")
                             
-                        # 添加 roomid 列（如果不存在）
-                        if 'roomid' not in columns:
-                            cursor.execute("ALTER TABLE reminders ADD COLUMN roomid TEXT;")
-                            logger.info("成功添加 'roomid' 列到 'reminders' 表。")
-                    except sqlite3.OperationalError as e:
-                        # 如果列已存在，会报错误，可以忽略
-                        logger.warning(f"尝试添加列时发生错误: {e}")
+                    # 添加 roomid 列（如果不存在）
+                    if 'roomid' not in columns:
+                        cursor.execute("ALTER TABLE reminders ADD COLUMN roomid TEXT;")
+                        logger.info("成功添加 'roomid' 列到 'reminders' 表。")
+
+                    # 添加 next_fire_at 列（如果不存在）
+                    if 'next_fire_at' not in columns:
+                        cursor.execute("ALTER TABLE reminders ADD COLUMN next_fire_at TEXT;")
+                        logger.info("成功添加 'next_fire_at' 列到 'reminders' 表。")
+                except sqlite3.OperationalError as e:
+                    # 如果列已存在，会报错误，可以忽略
+                    logger.warning(f"尝试添加列时发生错误: {e}")
                     
-                    # 3. 创建索引
-                    cursor.execute(index_sql_wxid)
-                    cursor.execute(index_sql_type)
-                    cursor.execute(index_sql_roomid)
-                    conn.commit()
+                # 3. 创建索引
+                cursor.execute(index_sql_wxid)
+                cursor.execute(index_sql_type)
+                cursor.execute(index_sql_roomid)
+                cursor.execute(index_sql_next_fire)
+                cursor.execute(sql_deliveries)
+                cursor.execute(index_sql_deliveries)
+
+                # 4. 为旧数据补算 next_fire_at
+                self._backfill_next_fire(cursor)
             logger.info("数据库表 'reminders' 检查/创建 完成。")
         except sqlite3.Error as e:
             logger.error(f"创建/检查数据库表 'reminders' 失败: {e}", exc_info=True)
 
+    def _backfill_next_fire(self, cursor: sqlite3.Cursor):
+        """为 next_fire_at 为空的旧提醒补算触发时间（从上次触发或创建时间往后算，错过的提醒会立即补发一次）"""
+        cursor.execute("""
+        SELECT id, type, time_str, weekday, created_at, last_triggered_at FROM reminders
+        WHERE next_fire_at IS NULL
+        """)
+        updates = []
+        for reminder in cursor.fetchall():
+            base = datetime.now()
+            for value in (reminder["last_triggered_at"], reminder["created_at"]):
+                if value:
+                    try:
+                        base = datetime.fromisoformat(value)
+                        break
+                    except ValueError:
+                        logger.warning(f"无法解析提醒 {reminder['id']} 的时间: {value}")
+            next_fire = compute_next_fire(reminder["type"], reminder["time_str"], reminder["weekday"], base)
+            if next_fire is None:
+                logger.warning(f"无法计算提醒 {reminder['id']} 的触发时间 (time_str={reminder['time_str']})")
+                continue
+            updates.append((next_fire.strftime(FIRE_AT_FORMAT), reminder["id"]))
+        if updates:
+            cursor.executemany("UPDATE reminders SET next_fire_at = ? WHERE id = ?", updates)
+            logger.info(f"为 {len(updates)} 条提醒补算了 next_fire_at。")
+
+    # --- 调度 ---
+    def _load_heap(self):
+        """从数据库加载所有待触发提醒到内存堆"""
+        try:
+            with self.db.read() as conn:
+                rows = conn.execute(
+                    "SELECT id, next_fire_at FROM reminders WHERE next_fire_at IS NOT NULL"
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"加载提醒调度堆失败: {e}", exc_info=True)
+            return
+        heap = []
+        for row in rows:
+            try:
+                heap.append((datetime.strptime(row["next_fire_at"], FIRE_AT_FORMAT), row["id"]))
+            except ValueError:
+                logger.warning(f"无法解析提醒 {row['id']} 的 next_fire_at: {row['next_fire_at']}")
+        heapq.heapify(heap)
+        with self._cond:
+            self._heap = heap
+            self._cond.notify()
+
+    def _push(self, fire_at: datetime, reminder_id: str):
+        """加入一个触发时间，并在它早于当前堆顶时唤醒调度线程"""
+        with self._cond:
+            heapq.heappush(self._heap, (fire_at, reminder_id))
+            if self._heap[0][1] == reminder_id:
+                self._cond.notify()
+
+    def _run(self):
+        """调度线程：睡到堆顶的触发时间，到期后触发所有到期提醒"""
+        last_sync = datetime.now()
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = datetime.now()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    idle = (now - last_sync).total_seconds()
+                    if idle >= self.check_interval:
+                        break
+                    timeout = self.check_interval - idle
+                    if self._heap:
+                        timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                    self._cond.wait(max(timeout, 0.05))
+                if self._stopping:
+                    return
+                now = datetime.now()
+                while self._heap and self._heap[0][0] <= now:
+                    heapq.heappop(self._heap)
+            try:
+                self.check_and_trigger_reminders()
+            except Exception as e:
+                logger.error(f"提醒调度线程出错: {e}", exc_info=True)
+            last_sync = datetime.now()
+
+    def stop(self, timeout: float = 5):
+        """停止调度线程和投递线程（程序退出时调用，未投递的提醒留在投递表中，下次启动继续发送）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        with self._delivery_cond:
+            self._delivery_cond.notify_all()
+        for thread in (self._scheduler, self._delivery):
+            if thread.is_alive():
+                thread.join(timeout)
+
     # --- 对外接口 ---
     def add_reminder(self, wxid: str, data: dict, roomid: Optional[str] = None) -> Tuple[bool, str]:
         """
@@ -107,7 +274,8 @@ class ReminderManager:
         :return: (是否成功, 提醒 ID 或 错误信息)
         """
         reminder_id = str(uuid.uuid4())
-        created_at_iso = datetime.now().isoformat()
+        created_at = datetime.now()
+        created_at_iso = created_at.isoformat()
 
         # 校验数据 (基本)
         required_keys = {"type", "time", "content"}
@@ -134,10 +302,13 @@ class ReminderManager:
         except ValueError as e:
              return False, f"时间格式错误 ({data['time']})，需要 'YYYY-MM-DD HH:MM' (once) 或 'HH:MM' (daily/weekly): {e}"
 
+        # 预先计算第一次触发时间
+        next_fire = compute_next_fire(data["type"], data["time"], weekday_val, created_at)
+
         # 准备插入数据库
         sql = """
-        INSERT INTO reminders (id, wxid, type, time_str, content, created_at, last_triggered_at, weekday, roomid)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO reminders (id, wxid, type, time_str, content, created_at, last_triggered_at, weekday, roomid, next_fire_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         params = (
             reminder_id,
@@ -148,15 +319,15 @@ class ReminderManager:
             created_at_iso,
             None, # last_triggered_at 初始为 NULL
             weekday_val, # weekday 字段
-            roomid  # 新增：roomid 参数
+            roomid,  # 新增：roomid 参数
+            next_fire.strftime(FIRE_AT_FORMAT)
         )
 
         try:
-            with self._db_lock: # 加锁
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(sql, params)
-                    conn.commit()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+            self._push(next_fire, reminder_id)
             # 记录日志时包含群聊信息
             log_target = f"用户 {wxid}" + (f" 在群聊 {roomid}" if roomid else "")
             logger.info(f"成功添加提醒 {reminder_id} for {log_target} 到数据库。")
@@ -170,155 +341,220 @@ class ReminderManager:
 
     # --- 核心检查逻辑 ---
     def check_and_trigger_reminders(self):
-        """由 schedule 定期调用。检查数据库，触发到期的提醒。"""
+        """由调度线程在堆顶到期时调用。在一个短事务中认领所有到期提醒并写入投递表，由投递线程发送。"""
         now = datetime.now()
         now_iso = now.isoformat()
-        current_weekday = now.weekday() # 获取今天是周几 (0-6)
-        current_hm = now.strftime("%H:%M") # 当前时分
-        
+        now_str = now.strftime(FIRE_AT_FORMAT)
+
         reminders_to_delete = [] # 存储需要删除的 once 提醒 ID
-        reminders_to_update = [] # 存储需要更新 last_triggered_at 的 daily/weekly 提醒 ID
+        reminders_to_update = [] # 存储需要更新下次触发时间的 daily/weekly 提醒 (next_fire_at, id)
 
         try:
-            with self._db_lock: # 加锁
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-
-                    # 1. 查询到期的一次性提醒
-                    sql_once = """
-                    SELECT id, wxid, content, roomid FROM reminders
-                    WHERE type = 'once' AND time_str <= ?
-                    """
-                    cursor.execute(sql_once, (now.strftime("%Y-%m-%d %H:%M"),))
-                    due_once_reminders = cursor.fetchall()
-
-                    for reminder in due_once_reminders:
-                        self._send_reminder(reminder["wxid"], reminder["content"], reminder["id"], reminder["roomid"])
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+
+                # 1. 一次索引范围查询取出所有到期提醒
+                sql_due = """
+                SELECT id, wxid, type, content, time_str, weekday, roomid, next_fire_at FROM reminders
+                WHERE next_fire_at <= ?
+                ORDER BY next_fire_at
+                """
+                cursor.execute(sql_due, (now_str,))
+                due_reminders = cursor.fetchall()
+                if not due_reminders:
+                    return
+
+                # 2. 写入投递表（同一次触发只会写入一条）
+                sql_claim = """
+                INSERT OR IGNORE INTO reminder_deliveries
+                (reminder_id, fire_at, wxid, roomid, content, attempts, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, 0, ?)
+                """
+                cursor.executemany(sql_claim, [
+                    (r["id"], r["next_fire_at"], r["wxid"], r["roomid"], r["content"], now_str)
+                    for r in due_reminders
+                ])
+
+                # 3. 一次性提醒删除，每日/每周提醒算出下一次触发时间
+                for reminder in due_reminders:
+                    if reminder["type"] == "once":
+                        reminders_to_delete.append(reminder["id"])
+                        continue
+                    next_fire = compute_next_fire(reminder["type"], reminder["time_str"], reminder["weekday"], now)
+                    if next_fire is None:
+                        logger.warning(f"无法计算提醒 {reminder['id']} 的下次触发时间，已删除")
                         reminders_to_delete.append(reminder["id"])
-                        logger.info(f"一次性提醒 {reminder['id']} 已触发并标记删除。")
-
-                    # 2. 查询到期的每日提醒
-                    # a. 获取当前时间 HH:MM
-                    # b. 查询所有 daily 提醒
-                    sql_daily_all = "SELECT id, wxid, content, time_str, last_triggered_at, roomid FROM reminders WHERE type = 'daily'"
-                    cursor.execute(sql_daily_all)
-                    all_daily_reminders = cursor.fetchall()
-
-                    for reminder in all_daily_reminders:
-                        # 检查时间是否到达或超过 daily 设置的 HH:MM
-                        if current_hm >= reminder["time_str"]:
-                            last_triggered_dt = None
-                            if reminder["last_triggered_at"]:
-                                try:
-                                    last_triggered_dt = datetime.fromisoformat(reminder["last_triggered_at"])
-                                except ValueError:
-                                    logger.warning(f"无法解析 daily 提醒 {reminder['id']} 的 last_triggered_at: {reminder['last_triggered_at']}")
-
-                            # 计算今天应该触发的时间点 (用于比较)
-                            trigger_hm_dt = datetime.strptime(reminder["time_str"], "%H:%M").time()
-                            today_trigger_dt = now.replace(hour=trigger_hm_dt.hour, minute=trigger_hm_dt.minute, second=0, microsecond=0)
-
-                            # 如果从未触发过，或者上次触发是在今天的触发时间点之前，则应该触发
-                            if last_triggered_dt is None or last_triggered_dt < today_trigger_dt:
-                                self._send_reminder(reminder["wxid"], reminder["content"], reminder["id"], reminder["roomid"])
-                                reminders_to_update.append(reminder["id"])
-                                logger.info(f"每日提醒 {reminder['id']} 已触发并标记更新触发时间。")
-                                
-                    # 3. 查询并处理到期的 'weekly' 提醒
-                    sql_weekly = """
-                    SELECT id, wxid, content, time_str, last_triggered_at, roomid FROM reminders
-                    WHERE type = 'weekly' AND weekday = ? AND time_str <= ?
-                    """
-                    cursor.execute(sql_weekly, (current_weekday, current_hm))
-                    due_weekly_reminders = cursor.fetchall()
-
-                    for reminder in due_weekly_reminders:
-                        last_triggered_dt = None
-                        if reminder["last_triggered_at"]:
-                            try:
-                                last_triggered_dt = datetime.fromisoformat(reminder["last_triggered_at"])
-                            except ValueError:
-                                logger.warning(f"无法解析 weekly 提醒 {reminder['id']} 的 last_triggered_at")
-
-                        # 计算今天应该触发的时间点 (用于比较)
-                        trigger_hm_dt = datetime.strptime(reminder["time_str"], "%H:%M").time()
-                        today_trigger_dt = now.replace(hour=trigger_hm_dt.hour, minute=trigger_hm_dt.minute, second=0, microsecond=0)
-
-                        # 如果今天是设定的星期几，时间已到，且今天还未触发过
-                        if last_triggered_dt is None or last_triggered_dt < today_trigger_dt:
-                            self._send_reminder(reminder["wxid"], reminder["content"], reminder["id"], reminder["roomid"])
-                            reminders_to_update.append(reminder["id"]) # 每周提醒也需要更新触发时间
-                            logger.info(f"每周提醒 {reminder['id']} (周{current_weekday+1}) 已触发并标记更新触发时间。")
-
-                    # 4. 在事务中执行删除和更新
-                    if reminders_to_delete:
-                        # 使用 executemany 提高效率
-                        sql_delete = "DELETE FROM reminders WHERE id = ?"
-                        cursor.executemany(sql_delete, [(rid,) for rid in reminders_to_delete])
-                        logger.info(f"从数据库删除了 {len(reminders_to_delete)} 条一次性提醒。")
-
-                    if reminders_to_update:
-                        sql_update = "UPDATE reminders SET last_triggered_at = ? WHERE id = ?"
-                        cursor.executemany(sql_update, [(now_iso, rid) for rid in reminders_to_update])
-                        logger.info(f"更新了 {len(reminders_to_update)} 条提醒的最后触发时间。")
-
-                    # 提交事务
-                    if reminders_to_delete or reminders_to_update:
-                        conn.commit()
+                    else:
+                        reminders_to_update.append((next_fire, reminder["id"]))
+
+                # 4. 在事务中执行删除和更新
+                if reminders_to_delete:
+                    # 使用 executemany 提高效率
+                    sql_delete = "DELETE FROM reminders WHERE id = ?"
+                    cursor.executemany(sql_delete, [(rid,) for rid in reminders_to_delete])
+                    logger.info(f"从数据库删除了 {len(reminders_to_delete)} 条提醒。")
+
+                if reminders_to_update:
+                    sql_update = "UPDATE reminders SET last_triggered_at = ?, next_fire_at = ? WHERE id = ?"
+                    cursor.executemany(sql_update, [
+                        (now_iso, next_fire.strftime(FIRE_AT_FORMAT), rid) for next_fire, rid in reminders_to_update
+                    ])
+                    logger.info(f"更新了 {len(reminders_to_update)} 条提醒的下次触发时间。")
 
         except sqlite3.Error as e:
             logger.error(f"检查并触发提醒时数据库出错: {e}", exc_info=True)
+            return
         except Exception as e: # 捕获其他潜在错误
             logger.error(f"检查并触发提醒时发生意外错误: {e}", exc_info=True)
+            return
+
+        logger.info(f"认领了 {len(due_reminders)} 条到期提醒，交给投递线程发送。")
+        # 5. 重复提醒放回调度堆，唤醒投递线程
+        for next_fire, rid in reminders_to_update:
+            self._push(next_fire, rid)
+        with self._delivery_cond:
+            self._delivery_cond.notify()
+
+    # --- 投递 ---
+    def _deliver_loop(self):
+        """投递线程：发送投递表中到期的提醒，成功后删除记录，失败按指数退避重试"""
+        while True:
+            with self._delivery_cond:
+                if self._stopping:
+                    return
+            try:
+                with self.db.read() as conn:
+                    pending = conn.execute("""
+                    SELECT id, reminder_id, wxid, roomid, content, attempts FROM reminder_deliveries
+                    WHERE next_attempt_at <= ?
+                    ORDER BY next_attempt_at, id
+                    LIMIT 50
+                    """, (datetime.now().strftime(FIRE_AT_FORMAT),)).fetchall()
+                    next_row = None
+                    if not pending:
+                        next_row = conn.execute("SELECT MIN(next_attempt_at) FROM reminder_deliveries").fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"读取提醒投递表出错: {e}", exc_info=True)
+                pending, next_row = [], None
+
+            db_ok = True
+            for delivery in pending:
+                if self._stopping:
+                    return
+                if not self._deliver(delivery):
+                    db_ok = False
+                    break
+
+            if pending and db_ok:
+                continue
+            # 没有到期的投递：睡到最早的重试时间，或被新的认领唤醒；更新投递表失败时退避一段时间再试
+            timeout = self.check_interval if db_ok else DELIVERY_RETRY_BASE
+            if next_row and next_row[0]:
+                try:
+                    wait = (datetime.strptime(next_row[0], FIRE_AT_FORMAT) - datetime.now()).total_seconds()
+                    timeout = min(timeout, max(wait, 0.05))
+                except ValueError:
+                    pass
+            with self._delivery_cond:
+                if not self._stopping:
+                    self._delivery_cond.wait(timeout)
+
+    def _deliver(self, delivery: sqlite3.Row) -> bool:
+        """发送一条投递记录并更新投递表
+        :return: 投递表是否更新成功；失败时调用方应退避，已发出的记录只会再尝试删除，不会重发
+        """
+        delivery_id = delivery["id"]
+        if delivery_id in self._delivered:
+            sent = True
+        else:
+            sent = self._send_reminder(delivery["wxid"], delivery["content"], delivery["reminder_id"], delivery["roomid"])
+            if sent:
+                self._delivered.add(delivery_id)
+        try:
+            with self.db.transaction() as conn:
+                if sent:
+                    conn.execute("DELETE FROM reminder_deliveries WHERE id = ?", (delivery_id,))
+                else:
+                    attempts = delivery["attempts"] + 1
+                    if attempts >= DELIVERY_MAX_ATTEMPTS:
+                        conn.execute("DELETE FROM reminder_deliveries WHERE id = ?", (delivery_id,))
+                        logger.error(f"提醒 {delivery['reminder_id']} 已重试 {attempts} 次仍发送失败，放弃投递。")
+                    else:
+                        retry_at = datetime.now() + timedelta(seconds=DELIVERY_RETRY_BASE * 2 ** (attempts - 1))
+                        conn.execute(
+                            "UPDATE reminder_deliveries SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                            (attempts, retry_at.strftime(FIRE_AT_FORMAT), delivery_id)
+                        )
+                        logger.warning(f"提醒 {delivery['reminder_id']} 第 {attempts} 次发送失败，将于 {retry_at:%H:%M:%S} 重试。")
+        except sqlite3.Error as e:
+            logger.error(f"更新提醒投递记录 {delivery_id} 时数据库出错: {e}", exc_info=True)
+            return False
+        self._delivered.discard(delivery_id)
+        return True
 
-
-    def _send_reminder(self, wxid: str, content: str, reminder_id: str, roomid: Optional[str] = None):
+    def _send_reminder(self, wxid: str, content: str, reminder_id: str, roomid: Optional[str] = None) -> bool:
         """
-        安全地发送提醒消息。
+        安全地发送提醒消息，等待发送队列实际发出。
         根据roomid是否存在决定发送方式：
         - 如果roomid存在，则发送到群聊并@用户
         - 如果roomid不存在，则发送私聊消息
+        :return: 是否发送成功
         """
         try:
             message = f"⏰ 提醒：{content}"
             
             if roomid:
                 # 群聊提醒: 发送到群聊并@设置提醒的用户
-                self.robot.sendTextMsg(message, roomid, wxid)
-                logger.info(f"已尝试发送群聊提醒 {reminder_id} 到群 {roomid} @ 用户 {wxid}")
+                result = self.robot.sendTextMsg(message, roomid, wxid)
             else:
                 # 私聊提醒: 直接发送给用户
-                self.robot.sendTextMsg(message, wxid)
-                logger.info(f"已尝试发送私聊提醒 {reminder_id} 给用户 {wxid}")
+                result = self.robot.sendTextMsg(message, wxid)
+            if isinstance(result, Future):
+                # 等待发送队列实际发出；超时先撤回队列中的消息，撤回成功才保留投递记录稍后重试
+                future = result
+                try:
+                    result = future.result(timeout=DELIVERY_SEND_TIMEOUT)
+                except FutureTimeoutError:
+                    if future.cancel():
+                        logger.warning(f"提醒 {reminder_id} 等待发送超过 {DELIVERY_SEND_TIMEOUT} 秒，已撤回，稍后重试。")
+                        return False
+                    # 撤回失败说明发送线程已经开始发送，等待本次结果，不再重新入队以免重复发送
+                    result = future.result()
+            sent = result is not False
+            if roomid:
+                logger.info(f"发送群聊提醒 {reminder_id} 到群 {roomid} @ 用户 {wxid}: {'成功' if sent else '失败'}")
+            else:
+                logger.info(f"发送私聊提醒 {reminder_id} 给用户 {wxid}: {'成功' if sent else '失败'}")
+            return sent
         except Exception as e:
             target = f"群 {roomid} @ 用户 {wxid}" if roomid else f"用户 {wxid}"
             logger.error(f"发送提醒 {reminder_id} 给 {target} 失败: {e}", exc_info=True)
+            return False
 
     # --- 查看和删除提醒功能 ---
     def list_reminders(self, wxid: str) -> list:
         """列出用户的所有提醒（包括私聊和群聊中设置的），按类型和时间排序"""
         reminders = []
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    # 按类型(once->daily->weekly)，再按时间排序
-                    sql = """
-                    SELECT id, type, time_str, content, created_at, last_triggered_at, weekday, roomid
-                    FROM reminders
-                    WHERE wxid = ?
-                    ORDER BY
-                        CASE type
-                            WHEN 'once' THEN 1
-                            WHEN 'daily' THEN 2
-                            WHEN 'weekly' THEN 3
-                            ELSE 4 END ASC,
-                        time_str ASC
-                    """
-                    cursor.execute(sql, (wxid,))
-                    results = cursor.fetchall()
-                    # 将 sqlite3.Row 对象转换为普通字典列表
-                    reminders = [dict(row) for row in results]
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                # 按类型(once->daily->weekly)，再按时间排序
+                sql = """
+                SELECT id, type, time_str, content, created_at, last_triggered_at, weekday, roomid
+                FROM reminders
+                WHERE wxid = ?
+                ORDER BY
+                    CASE type
+                        WHEN 'once' THEN 1
+                        WHEN 'daily' THEN 2
+                        WHEN 'weekly' THEN 3
+                        ELSE 4 END ASC,
+                    time_str ASC
+                """
+                cursor.execute(sql, (wxid,))
+                results = cursor.fetchall()
+                # 将 sqlite3.Row 对象转换为普通字典列表
+                reminders = [dict(row) for row in results]
             logger.info(f"为用户 {wxid} 查询到 {len(reminders)} 条提醒。")
             return reminders
         except sqlite3.Error as e:
@@ -332,29 +568,33 @@ class ReminderManager:
         :return: (是否成功, 消息)
         """
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
-                    # 确保用户只能删除自己的提醒
-                    sql_check = "SELECT COUNT(*), roomid FROM reminders WHERE id = ? AND wxid = ? GROUP BY roomid"
-                    cursor.execute(sql_check, (reminder_id, wxid))
-                    result = cursor.fetchone()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                # 确保用户只能删除自己的提醒
+                sql_check = "SELECT COUNT(*), roomid FROM reminders WHERE id = ? AND wxid = ? GROUP BY roomid"
+                cursor.execute(sql_check, (reminder_id, wxid))
+                result = cursor.fetchone()
+
+                # 同一事务中删除尚未发出的投递记录（一次性提醒认领后只剩投递记录，删除它即取消这次发送）
+                cursor.execute("DELETE FROM reminder_deliveries WHERE reminder_id = ? AND wxid = ?", (reminder_id, wxid))
+                if cursor.rowcount and (not result or result[0] == 0):
+                    logger.info(f"用户 {wxid} 取消了提醒 {reminder_id} 待发送的投递")
+                    return True, f"已成功删除提醒 (ID: {reminder_id[:6]}...)"
                     
-                    if not result or result[0] == 0:
-                        logger.warning(f"用户 {wxid} 尝试删除不存在或不属于自己的提醒 {reminder_id}")
-                        return False, f"未找到 ID 为 {reminder_id[:6]}... 的提醒，或该提醒不属于您。"
+                if not result or result[0] == 0:
+                    logger.warning(f"用户 {wxid} 尝试删除不存在或不属于自己的提醒 {reminder_id}")
+                    return False, f"未找到 ID 为 {reminder_id[:6]}... 的提醒，或该提醒不属于您。"
                     
-                    # 获取roomid用于日志记录
-                    roomid = result[1] if len(result) > 1 else None
+                # 获取roomid用于日志记录
+                roomid = result[1] if len(result) > 1 else None
 
-                    sql_delete = "DELETE FROM reminders WHERE id = ? AND wxid = ?"
-                    cursor.execute(sql_delete, (reminder_id, wxid))
-                    conn.commit()
+                sql_delete = "DELETE FROM reminders WHERE id = ? AND wxid = ?"
+                cursor.execute(sql_delete, (reminder_id, wxid))
                     
-                    # 在日志中记录位置信息
-                    location_info = f"在群聊 {roomid}" if roomid else "在私聊"
-                    logger.info(f"用户 {wxid} 成功删除了{location_info}设置的提醒 {reminder_id}")
-                    return True, f"已成功删除提醒 (ID: {reminder_id[:6]}...)"
+                # 在日志中记录位置信息
+                location_info = f"在群聊 {roomid}" if roomid else "在私聊"
+                logger.info(f"用户 {wxid} 成功删除了{location_info}设置的提醒 {reminder_id}")
+                return True, f"已成功删除提醒 (ID: {reminder_id[:6]}...)"
 
         except sqlite3.Error as e:
             logger.error(f"用户 {wxid} 删除提醒 {reminder_id} 时数据库出错: {e}", exc_info=True)
@@ -370,25 +610,26 @@ class ReminderManager:
         :return: (是否成功, 消息, 删除的提醒数量)
         """
         try:
-            with self._db_lock:
-                with self._get_db_conn() as conn:
-                    cursor = conn.cursor()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+
+                # 同一事务中删除该用户尚未发出的投递记录
+                cursor.execute("DELETE FROM reminder_deliveries WHERE wxid = ?", (wxid,))
                     
-                    # 先查询用户有多少条提醒
-                    count_sql = "SELECT COUNT(*) FROM reminders WHERE wxid = ?"
-                    cursor.execute(count_sql, (wxid,))
-                    count = cursor.fetchone()[0]
+                # 先查询用户有多少条提醒
+                count_sql = "SELECT COUNT(*) FROM reminders WHERE wxid = ?"
+                cursor.execute(count_sql, (wxid,))
+                count = cursor.fetchone()[0]
                     
-                    if count == 0:
-                        return False, "您当前没有任何提醒。", 0
+                if count == 0:
+                    return False, "您当前没有任何提醒。", 0
                     
-                    # 删除用户的所有提醒
-                    delete_sql = "DELETE FROM reminders WHERE wxid = ?"
-                    cursor.execute(delete_sql, (wxid,))
-                    conn.commit()
+                # 删除用户的所有提醒
+                delete_sql = "DELETE FROM reminders WHERE wxid = ?"
+                cursor.execute(delete_sql, (wxid,))
                     
-                    logger.info(f"用户 {wxid} 删除了其所有 {count} 条提醒")
-                    return True, f"已成功删除您的所有提醒（共 {count} 条）。", count
+                logger.info(f"用户 {wxid} 删除了其所有 {count} 条提醒")
+                return True, f"已成功删除您的所有提醒（共 {count} 条）。", count
                     
         except sqlite3.Error as e:
             logger.error(f"用户 {wxid} 删除所有提醒时数据库出错: {e}", exc_info=True)
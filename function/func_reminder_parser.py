@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+提醒时间的规则解析器（不调用 AI）
+
+把常见的中文提醒说法直接解析成与 AI 解析相同的 {type, time, content, weekday, extra} 字典，
+支持：今天/明天/后天/大后天、下周X/本周X/周X、X月X日、每天、每周X、
+凌晨/早上/上午/中午/下午/傍晚/晚上、X点/X点半/X点一刻/X点X分/HH:MM、X分钟后/X小时后/半小时后。
+无法确定时返回 None，由调用方退回 AI 解析。
+
+用法（语料回归，输出命中率、准确率和耗时）:
+    python -m function.func_reminder_parser
+"""
+
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_NUM = r"[0-9零〇一二两三四五六七八九十]+"
+_WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6, "七": 6}
+_WEEK = r"(?:周|星期|礼拜)"
+
+# 相对时间：X分钟后 / X小时后 / 半小时后 / X个半小时后
+_RE_RELATIVE = re.compile(
+    rf"(?:(?P<num>{_NUM})个?(?P<half>半)?(?P<unit>分钟|小时|钟头)|(?P<half_hour>半个?(?:小时|钟头)))(?:之后|以后|后)"
+)
+# 重复：每天 / 每日 / 每晚 / 每周X
+_RE_DAILY = re.compile(r"每天|每日|天天|每晚|每早")
+_RE_WEEKLY = re.compile(rf"每个?{_WEEK}(?P<wd>[一二三四五六日天七])")
+# 日期：今天/明天/后天/大后天、今晚/明早/明晚、下周X/本周X/这周X/周X、X月X日
+_RE_DAY = re.compile(r"大后天|后天|明天|今天|明早|明晚|今早|今晚")
+_RE_WEEK_DAY = re.compile(rf"(?P<prefix>下下个?|下个?|本|这个?)?{_WEEK}(?P<wd>[一二三四五六日天七])")
+_RE_DATE = re.compile(rf"(?:(?P<month>{_NUM})月)(?P<day>{_NUM})[日号]")
+# 时段
+_RE_PERIOD = re.compile(r"凌晨|清晨|早上|早晨|上午|中午|下午|傍晚|晚上|夜里|夜晚|半夜")
+# 钟点：HH:MM / X点(半|一刻|三刻|X分) / X时X分
+_RE_CLOCK = re.compile(
+    rf"(?P<h>[0-9]{{1,2}})[:：](?P<m>[0-9]{{2}})"
+    rf"|(?P<h2>{_NUM})[点时](?:钟|整)?(?:(?P<half>半)|(?P<quarter>[一三])刻|(?P<m2>{_NUM})分?)?"
+)
+# 内容前后的填充词
+_RE_FILLER_HEAD = re.compile(r"^(?:请|帮我|麻烦)?(?:提醒|叫|通知)(?:我|一下|下)?(?:一下)?(?:要|去|该|记得)?")
+_RE_FILLER_ANY = re.compile(r"(?:的时候|时候|准时|记得)?(?:提醒|叫|通知)(?:我|一下)(?:一下)?(?:要|去|该|记得)?")
+_STRIP_CHARS = " ，,。.！!：:、在到~～"
+
+_MORNING = ("凌晨", "清晨", "早上", "早晨", "上午", "今早", "明早", "每早")
+_EVENING = ("下午", "傍晚", "晚上", "夜里", "夜晚", "今晚", "明晚", "每晚")
+
+
+def cn_to_int(text: str) -> Optional[int]:
+    """把阿拉伯数字或不超过 99 的中文数字转换为整数，无法转换时返回 None"""
+    if text.isdigit():
+        return int(text)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        tens_val = _CN_DIGITS.get(tens, None) if tens else 1
+        ones_val = _CN_DIGITS.get(ones, None) if ones else 0
+        if tens_val is None or ones_val is None:
+            return None
+        return tens_val * 10 + ones_val
+    if len(text) == 1:
+        return _CN_DIGITS.get(text)
+    return None
+
+
+def _apply_period(hour: int, period: Optional[str]) -> Optional[int]:
+    """根据时段修正小时（下午3点 -> 15），不合理的组合返回 None"""
+    if period in ("中午",):
+        return hour + 12 if 1 <= hour <= 2 else (hour if hour in (11, 12) else None)
+    if period in ("半夜",):
+        return 0 if hour == 12 else (hour if hour <= 4 else None)
+    if period in _EVENING:
+        if hour == 12:
+            return None  # 晚上12点跨天，交给 AI
+        return hour + 12 if hour < 12 else hour
+    if period in _MORNING:
+        return hour if hour <= 12 else None
+    return hour
+
+
+def parse_reminder(text: str, now: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    解析一条提醒文本。
+    :param text: 用户输入（可以包含"提醒"等字样），例如 "提醒我明天早上8点开会"
+    :param now: 当前时间，默认 datetime.now()
+    :return: 与 AI 解析结果相同格式的字典；无法确定时间或内容时返回 None
+    """
+    now = now or datetime.now()
+    text = text.strip()
+    spans: List[Tuple[int, int]] = []
+
+    def take(match) -> None:
+        spans.append(match.span())
+
+    result: Dict = {"extra": {}}
+
+    relative = _RE_RELATIVE.search(text)
+    if relative:
+        take(relative)
+        if relative.group("half_hour"):
+            delta = timedelta(minutes=30)
+        else:
+            num = cn_to_int(relative.group("num"))
+            if num is None or num <= 0:
+                return None
+            if relative.group("unit") == "分钟":
+                delta = timedelta(minutes=num)
+            else:
+                delta = timedelta(hours=num, minutes=30 if relative.group("half") else 0)
+        fire_at = now + delta
+        result.update(type="once", time=fire_at.strftime("%Y-%m-%d %H:%M"))
+    else:
+        # 钟点（相对时间之外必须有且只有一个，"9点到12点之间"这类区间交给 AI）
+        clocks = list(_RE_CLOCK.finditer(text))
+        if len(clocks) != 1:
+            return None
+        clock = clocks[0]
+        take(clock)
+        if clock.group("h") is not None:
+            hour, minute = int(clock.group("h")), int(clock.group("m"))
+        else:
+            hour = cn_to_int(clock.group("h2"))
+            if clock.group("half"):
+                minute = 30
+            elif clock.group("quarter"):
+                minute = 15 if clock.group("quarter") == "一" else 45
+            elif clock.group("m2"):
+                minute = cn_to_int(clock.group("m2"))
+            else:
+                minute = 0
+        if hour is None or minute is None or not (0 <= hour <= 24 and 0 <= minute <= 59):
+            return None
+
+        period_match = _RE_PERIOD.search(text)
+        period = None
+        if period_match:
+            take(period_match)
+            period = period_match.group(0)
+
+        daily = _RE_DAILY.search(text)
+        weekly = _RE_WEEKLY.search(text)
+        day = _RE_DAY.search(text)
+        if period is None:
+            for match in (daily, day):
+                if match and match.group(0) in _MORNING + _EVENING:
+                    period = match.group(0)
+        explicit_period = period is not None
+        hour = _apply_period(hour, period)
+        if hour is None or hour == 24:
+            return None
+
+        if weekly:
+            take(weekly)
+            result.update(type="weekly", time=f"{hour:02d}:{minute:02d}", weekday=_WEEKDAYS[weekly.group("wd")])
+        elif daily:
+            take(daily)
+            result.update(type="daily", time=f"{hour:02d}:{minute:02d}")
+        else:
+            target = None
+            week_day = _RE_WEEK_DAY.search(text)
+            date_match = _RE_DATE.search(text)
+            if day:
+                take(day)
+                word = day.group(0)
+                offset = {"今天": 0, "今早": 0, "今晚": 0, "明天": 1, "明早": 1, "明晚": 1,
+                          "后天": 2, "大后天": 3}[word]
+                target = now.date() + timedelta(days=offset)
+            elif week_day:
+                take(week_day)
+                weekday = _WEEKDAYS[week_day.group("wd")]
+                prefix = week_day.group("prefix") or ""
+                monday = now.date() - timedelta(days=now.weekday())
+                if prefix.startswith("下下"):
+                    target = monday + timedelta(days=14 + weekday)
+                elif prefix.startswith("下"):
+                    target = monday + timedelta(days=7 + weekday)
+                elif prefix:
+                    target = monday + timedelta(days=weekday)
+                else:
+                    # 只说"周X"：取最近的一个（今天的时间已过则顺延一周）
+                    target = now.date() + timedelta(days=(weekday - now.weekday()) % 7)
+                    if datetime.combine(target, datetime.min.time()).replace(hour=hour, minute=minute) <= now:
+                        target += timedelta(days=7)
+            elif date_match:
+                take(date_match)
+                month, mday = cn_to_int(date_match.group("month")), cn_to_int(date_match.group("day"))
+                if month is None or mday is None:
+                    return None
+                try:
+                    target = now.date().replace(month=month, day=mday)
+                    if target < now.date():
+                        target = target.replace(year=target.year + 1)
+                except ValueError:
+                    return None
+
+            fire_at = None
+            if target is not None:
+                fire_at = datetime.combine(target, datetime.min.time()).replace(hour=hour, minute=minute)
+                if fire_at <= now:
+                    return None  # 指定的日期时间已经过去（如"今天早上8点"），交给 AI
+            else:
+                # 只有钟点：取今天/明天最近的一个，没说上午下午时 1-11 点也考虑下午
+                candidates = [now.replace(hour=hour, minute=minute, second=0, microsecond=0)]
+                if not explicit_period and 1 <= hour <= 11:
+                    candidates.append(candidates[0].replace(hour=hour + 12))
+                candidates += [c + timedelta(days=1) for c in candidates]
+                fire_at = min(c for c in candidates if c > now)
+            result.update(type="once", time=fire_at.strftime("%Y-%m-%d %H:%M"))
+
+    # 去掉时间相关片段，剩下的就是提醒内容
+    content = text
+    for start, end in sorted(spans, reverse=True):
+        content = content[:start] + " " + content[end:]
+    content = _RE_FILLER_HEAD.sub("", content.strip(_STRIP_CHARS))
+    content = _RE_FILLER_ANY.sub(" ", content)
+    content = re.sub(r"\s+", " ", content).strip(_STRIP_CHARS)
+    content = _RE_FILLER_HEAD.sub("", content).strip(_STRIP_CHARS)
+    if content.startswith("的"):
+        content = content[1:].strip(_STRIP_CHARS)  # "十点的会议" -> "会议"
+    if len(content) < 2:
+        return None
+    result["content"] = content
+    return result
+
+
+# --- 语料回归 ---
+# 基准时间：2026-10-17 (周六) 10:00；期望为 None 表示应当退回 AI 解析
+_CORPUS_NOW = datetime(2026, 10, 17, 10, 0)
+_CORPUS: List[Tuple[str, Optional[Dict]]] = [
+    ("提醒我明天早上8点开会", {"type": "once", "time": "2026-10-18 08:00", "content": "开会"}),
+    ("提醒 明天下午3点 开会", {"type": "once", "time": "2026-10-18 15:00", "content": "开会"}),
+    ("明天下午三点半提醒我交报告", {"type": "once", "time": "2026-10-18 15:30", "content": "交报告"}),
+    ("提醒我后天晚上7点去健身房", {"type": "once", "time": "2026-10-19 19:00", "content": "去健身房"}),
+    ("提醒我大后天上午十点一刻面试", {"type": "once", "time": "2026-10-20 10:15", "content": "面试"}),
+    ("提醒我早上七点起床", {"type": "once", "time": "2026-10-18 07:00", "content": "起床"}),
+    ("提醒我下午2点取快递", {"type": "once", "time": "2026-10-17 14:00", "content": "取快递"}),
+    ("提醒我3点半开会", {"type": "once", "time": "2026-10-17 15:30", "content": "开会"}),
+    ("提醒我11:30吃饭", {"type": "once", "time": "2026-10-17 11:30", "content": "吃饭"}),
+    ("提醒我晚上6点整下班", {"type": "once", "time": "2026-10-17 18:00", "content": "下班"}),
+    ("提醒我明天九点钟带伞", {"type": "once", "time": "2026-10-18 09:00", "content": "带伞"}),
+    ("提醒我明天8点05分坐车", {"type": "once", "time": "2026-10-18 08:05", "content": "坐车"}),
+    ("提醒我今晚九点看球赛", {"type": "once", "time": "2026-10-17 21:00", "content": "看球赛"}),
+    ("提醒我明晚8点给妈妈打电话", {"type": "once", "time": "2026-10-18 20:00", "content": "给妈妈打电话"}),
+    ("提醒我中午12点点外卖", {"type": "once", "time": "2026-10-17 12:00", "content": "点外卖"}),
+    ("提醒我下周一上午9点半交周报", {"type": "once", "time": "2026-10-19 09:30", "content": "交周报"}),
+    ("下星期三下午4点提醒我复诊", {"type": "once", "time": "2026-10-21 16:00", "content": "复诊"}),
+    ("提醒我周日晚上8点写周报", {"type": "once", "time": "2026-10-18 20:00", "content": "写周报"}),
+    ("提醒我11月3日上午10点交房租", {"type": "once", "time": "2026-11-03 10:00", "content": "交房租"}),
+    ("提醒我10分钟后关火", {"type": "once", "time": "2026-10-17 10:10", "content": "关火"}),
+    ("提醒我二十分钟后出门", {"type": "once", "time": "2026-10-17 10:20", "content": "出门"}),
+    ("半小时后提醒我收衣服", {"type": "once", "time": "2026-10-17 10:30", "content": "收衣服"}),
+    ("提醒我2个小时后喝水", {"type": "once", "time": "2026-10-17 12:00", "content": "喝水"}),
+    ("提醒我一个半小时后拿药", {"type": "once", "time": "2026-10-17 11:30", "content": "拿药"}),
+    ("提醒我每天早上7点半起床", {"type": "daily", "time": "07:30", "content": "起床"}),
+    ("每天晚上10点提醒我吃药", {"type": "daily", "time": "22:00", "content": "吃药"}),
+    ("提醒我每天22:30睡觉", {"type": "daily", "time": "22:30", "content": "睡觉"}),
+    ("提醒我每晚11点关电脑", {"type": "daily", "time": "23:00", "content": "关电脑"}),
+    ("提醒我每周一上午9点开例会", {"type": "weekly", "time": "09:00", "weekday": 0, "content": "开例会"}),
+    ("每周五下午5点提醒我写周报", {"type": "weekly", "time": "17:00", "weekday": 4, "content": "写周报"}),
+    ("提醒我每个星期天晚上8点倒垃圾", {"type": "weekly", "time": "20:00", "weekday": 6, "content": "倒垃圾"}),
+    ("提醒我每礼拜三中午12点半团建", {"type": "weekly", "time": "12:30", "weekday": 2, "content": "团建"}),
+    ("提醒我十点的会议", {"type": "once", "time": "2026-10-17 22:00", "content": "会议"}),
+    # 以下应退回 AI
+    ("提醒我过几天去体检", None),
+    ("提醒我月底交房租", None),
+    ("提醒我明天开会", None),
+    ("提醒我晚上12点睡觉", None),
+    ("提醒我下班前打卡", None),
+    ("提醒我9点到12点之间开会", None),
+    ("提醒我今天早上8点开会", None),
+]
+
+
+def run_corpus(repeat: int = 200) -> Dict:
+    """在语料上运行解析器，返回命中率、准确率和耗时统计"""
+    hits = correct = 0
+    failures = []
+    for text, expected in _CORPUS:
+        got = parse_reminder(text, _CORPUS_NOW)
+        if got is not None:
+            hits += 1
+        got_cmp = {k: v for k, v in got.items() if k != "extra"} if got else None
+        if got_cmp == expected:
+            correct += 1
+        else:
+            failures.append((text, expected, got_cmp))
+
+    latencies = []
+    for _ in range(repeat):
+        for text, _expected in _CORPUS:
+            start = time.perf_counter()
+            parse_reminder(text, _CORPUS_NOW)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = len(_CORPUS)
+    expected_hits = sum(1 for _text, expected in _CORPUS if expected is not None)
+    return {
+        "total": total,
+        "hits": hits,
+        "hit_rate": hits / total,
+        "expected_hits": expected_hits,
+        "correct": correct,
+        "accuracy": correct / total,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "failures": failures,
+    }
+
+
+def main() -> None:
+    report = run_corpus()
+    print(f"语料 {report['total']} 条，规则命中 {report['hits']} 条 ({report['hit_rate']:.1%})，"
+          f"可命中 {report['expected_hits']} 条；结果正确 {report['correct']} 条 ({report['accuracy']:.1%})")
+    print(f"单条解析耗时 p50 {report['p50_us']:.1f}µs, p99 {report['p99_us']:.1f}µs")
+    for text, expected, got in report["failures"]:
+        print(f"  ✗ {text}\n    期望: {expected}\n    实际: {got}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,68 +3,75 @@
 import logging
 import time
 import re
-from collections import deque
-# from threading import Lock  # 不再需要锁，使用SQLite的事务机制
+from collections import OrderedDict, deque
+from threading import Condition, Lock, RLock, Thread
 import sqlite3  # 添加sqlite3模块
-import os  # 用于处理文件路径
+from db_manager import get_db
 from function.func_xml_process import XmlProcessor  # 导入XmlProcessor
 
+# 批量写入连续失败多少次后丢弃该批消息（避免数据库长期不可用时缓冲区无限增长）
+FLUSH_MAX_RETRIES = 5
+
 class MessageSummary:
     """消息总结功能类 (使用SQLite持久化)
     用于记录、管理和生成聊天历史消息的总结
+    
+    写入采用 write-behind 方式：record_message 只把消息放入内存缓冲区，
+    由后台写线程每隔 flush_interval_ms 毫秒或攒够 flush_batch_size 条时在一个事务中批量提交。
+    
+    每个聊天的历史是一个长度为 max_history 的环形缓冲区：第 seq 条消息写入槽位 seq % max_history，
+    用 UPSERT 覆盖最旧的一条，每次写入只触及一行，不需要再排序删除。
+    
+    读取走内存热窗口：每个活跃聊天在内存中保留一个最新 max_history 条的 deque，
+    首次访问时从数据库加载，之后的总结不再读盘；总内存超出 hot_cache_mb 时按 LRU 淘汰不活跃的聊天。
     """
     
-    def __init__(self, max_history=300, db_path="data/message_history.db"):
+    def __init__(self, max_history=300, db_path="data/message_history.db", contact_cache=None,
+                 flush_interval_ms=500, flush_batch_size=100, hot_cache_mb=16):
         """初始化消息总结功能
         
         Args:
             max_history: 每个聊天保存的最大消息数量
             db_path: SQLite数据库文件路径
+            contact_cache: 可选的群昵称缓存(ContactCache)，为空时直接调用 wcf
+            flush_interval_ms: 缓冲区最长多久写入一次数据库（毫秒）
+            flush_batch_size: 缓冲区攒够多少条立即写入数据库
+            hot_cache_mb: 内存热窗口的总内存预算（MB，按字符串长度估算）
         """
         self.LOG = logging.getLogger("MessageSummary")
         self.max_history = max_history
         self.db_path = db_path
+        self.contact_cache = contact_cache
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_batch_size = flush_batch_size
         
         # 实例化XML处理器用于提取引用消息
         self.xml_processor = XmlProcessor(self.LOG)
         
-        # 移除旧的内存存储相关代码
-        # self._msg_history = {}  # 使用字典，以群ID或用户ID为键
-        # self._msg_history_lock = Lock()  # 添加锁以保证线程安全
+        # 批量写入、序号分配、热窗口加载与清除需要串行（可重入：持锁时仍可调用 flush）；读取走各线程自己的连接
+        self._flush_lock = RLock()
+        
+        # 待写入的消息缓冲区: [(chat_id, sender, content, timestamp_float, timestamp_str)]
+        self._pending = []
+        self._pending_cond = Condition()
+        self._flush_failures = 0  # 当前批次连续写入失败的次数
+        # 每个聊天下一条消息的序号（懒加载）
+        self._next_seq = {}
+        
+        # 内存热窗口: chat_id -> deque(最新 max_history 条消息)，按最近访问排序
+        self.hot_cache_bytes = int(hot_cache_mb * 1024 * 1024)
+        self._hot = OrderedDict()
+        self._hot_sizes = {}  # chat_id -> 估算占用字节数
+        self._hot_total = 0
+        self._hot_lock = Lock()
+        self._closed = False
         
         try:
-            # 确保数据库文件所在的目录存在
-            db_dir = os.path.dirname(self.db_path)
-            if db_dir and not os.path.exists(db_dir):
-                os.makedirs(db_dir)
-                self.LOG.info(f"创建数据库目录: {db_dir}")
-                
-            # 连接到数据库 (如果文件不存在会自动创建)
-            # check_same_thread=False 允许在不同线程中使用此连接
-            # 这在多线程机器人应用中是必要的，但要注意事务管理
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.cursor = self.conn.cursor()
+            # 与提醒、决斗排位共用连接管理器：每个线程一个 WAL 连接，读不会被写阻塞
+            self.db = get_db(self.db_path)
+            with self.db.transaction() as conn:
+                self._init_schema(conn.cursor())
             self.LOG.info(f"已连接到 SQLite 数据库: {self.db_path}")
-            
-            # 创建消息表 (如果不存在)
-            # 使用 INTEGER PRIMARY KEY AUTOINCREMENT 作为 rowid 的别名，方便管理
-            # timestamp_float 用于排序和限制数量
-            # timestamp_str 用于显示
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id TEXT NOT NULL,
-                    sender TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp_float REAL NOT NULL,
-                    timestamp_str TEXT NOT NULL
-                )
-            """)
-            # 为 chat_id 和 timestamp_float 创建索引，提高查询效率
-            self.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_chat_time ON messages (chat_id, timestamp_float)
-            """)
-            self.conn.commit() # 提交更改
             self.LOG.info("消息表已准备就绪")
             
         except sqlite3.Error as e:
@@ -74,19 +81,95 @@ class MessageSummary:
         except OSError as e:
             self.LOG.error(f"创建数据库目录失败: {e}")
             raise OSError(f"无法创建数据库目录: {e}") from e
+        
+        # 启动后台写线程
+        self._writer_thread = Thread(target=self._writer_loop, name="MessageSummaryWriter", daemon=True)
+        self._writer_thread.start()
+    
+    def _init_schema(self, cursor):
+        """创建环形缓冲区消息表；如存在旧版（自增id + 删除裁剪）消息表或环大小发生变化，则迁移数据"""
+        # 元数据表，记录环形缓冲区大小
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS message_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = [row[1] for row in cursor.fetchall()]
+        
+        cursor.execute("SELECT value FROM message_meta WHERE key = 'ring_size'")
+        row = cursor.fetchone()
+        stored_ring_size = int(row[0]) if row else None
+        
+        legacy_table = None
+        if columns and "slot" not in columns:
+            # 旧版表结构
+            legacy_table = "messages_legacy"
+        elif columns and stored_ring_size != self.max_history:
+            # max_history 变化后槽位映射失效，需要重新编号
+            legacy_table = "messages_resize"
+        
+        if legacy_table:
+            cursor.execute(f"DROP TABLE IF EXISTS {legacy_table}")
+            cursor.execute(f"ALTER TABLE messages RENAME TO {legacy_table}")
+            cursor.execute("DROP INDEX IF EXISTS idx_chat_time")
+            cursor.execute("DROP INDEX IF EXISTS idx_chat_seq")
+        
+        # slot = seq % max_history，(chat_id, slot) 唯一，写入时 UPSERT 覆盖最旧消息
+        # seq 为聊天内递增序号，用于排序
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                chat_id TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                sender TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp_float REAL NOT NULL,
+                timestamp_str TEXT NOT NULL,
+                PRIMARY KEY (chat_id, slot)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_seq ON messages (chat_id, seq)
+        """)
+        
+        if legacy_table:
+            # 每个聊天只保留最新的 max_history 条，按时间重新编号
+            order_by = "timestamp_float, id" if legacy_table == "messages_legacy" else "seq"
+            cursor.execute(f"""
+                INSERT INTO messages (chat_id, slot, seq, sender, content, timestamp_float, timestamp_str)
+                SELECT chat_id, (rn - 1) % ?, rn - 1, sender, content, timestamp_float, timestamp_str
+                FROM (
+                    SELECT *,
+                           ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY {order_by}) AS rn,
+                           COUNT(*) OVER (PARTITION BY chat_id) AS total
+                    FROM {legacy_table}
+                )
+                WHERE rn > total - ?
+            """, (self.max_history, self.max_history))
+            migrated = cursor.rowcount
+            cursor.execute(f"DROP TABLE {legacy_table}")
+            self.LOG.info(f"已将 {migrated} 条历史消息迁移到环形缓冲区消息表 (环大小 {self.max_history})")
+        
+        cursor.execute("""
+            INSERT INTO message_meta (key, value) VALUES ('ring_size', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (str(self.max_history),))
     
     def close_db(self):
-        """关闭数据库连接"""
-        if hasattr(self, 'conn') and self.conn:
-            try:
-                self.conn.commit() # 确保所有更改都已保存
-                self.conn.close()
-                self.LOG.info("数据库连接已关闭")
-            except sqlite3.Error as e:
-                self.LOG.error(f"关闭数据库连接时出错: {e}")
+        """停止后台写线程并写入缓冲区中剩余的消息（连接由 db_manager.close_all_dbs 统一关闭）"""
+        with self._pending_cond:
+            self._closed = True
+            self._pending_cond.notify()
+        if hasattr(self, '_writer_thread') and self._writer_thread.is_alive():
+            self._writer_thread.join(5)
+        self.flush()
+        self.LOG.info("消息历史已全部写入数据库")
         
     def record_message(self, chat_id, sender_name, content, timestamp=None):
-        """记录单条消息到数据库
+        """记录单条消息（放入写缓冲区，由后台线程批量写入数据库）
         
         Args:
             chat_id: 聊天ID（群ID或用户ID）
@@ -94,44 +177,127 @@ class MessageSummary:
             content: 消息内容
             timestamp: 时间戳，默认为当前时间
         """
-        try:
-            # 生成浮点数时间戳用于排序
-            current_time_float = time.time()
-            
-            # 生成或使用传入的时间字符串
-            if not timestamp:
-                timestamp_str = time.strftime("%H:%M", time.localtime(current_time_float))
-            else:
-                timestamp_str = timestamp
-                
-            # 插入新消息
-            self.cursor.execute("""
-                INSERT INTO messages (chat_id, sender, content, timestamp_float, timestamp_str)
-                VALUES (?, ?, ?, ?, ?)
-            """, (chat_id, sender_name, content, current_time_float, timestamp_str))
-            
-            # 删除超出 max_history 的旧消息
-            # 使用子查询找到要保留的最新 N 条消息的 id，然后删除不在这个列表中的该 chat_id 的其他消息
-            self.cursor.execute("""
-                DELETE FROM messages
-                WHERE chat_id = ? AND id NOT IN (
-                    SELECT id
-                    FROM messages
-                    WHERE chat_id = ?
-                    ORDER BY timestamp_float DESC
-                    LIMIT ?
-                )
-            """, (chat_id, chat_id, self.max_history))
+        # 生成浮点数时间戳用于排序
+        current_time_float = time.time()
+        
+        # 生成或使用传入的时间字符串
+        if not timestamp:
+            timestamp_str = time.strftime("%H:%M", time.localtime(current_time_float))
+        else:
+            timestamp_str = timestamp
+        
+        with self._hot_lock:
+            # 已加载到内存的聊天直接追加到热窗口；未加载的等首次读取时再从数据库加载
+            window = self._hot.get(chat_id)
+            if window is not None:
+                self._hot_append(chat_id, window, {"sender": sender_name, "content": content, "time": timestamp_str})
             
-            self.conn.commit() # 提交事务
+            with self._pending_cond:
+                self._pending.append((chat_id, sender_name, content, current_time_float, timestamp_str))
+                if len(self._pending) >= self.flush_batch_size:
+                    self._pending_cond.notify()
+    
+    @staticmethod
+    def _estimate_size(message):
+        """粗略估算一条消息在内存中的字节数"""
+        return 200 + 2 * (len(message["sender"]) + len(message["content"]) + len(message["time"]))
+    
+    def _hot_append(self, chat_id, window, message):
+        """向热窗口追加消息并维护内存统计，超出内存预算时淘汰其他聊天（调用方需持有 _hot_lock）"""
+        delta = self._estimate_size(message)
+        if len(window) >= self.max_history:
+            delta -= self._estimate_size(window.popleft())
+        window.append(message)
+        self._hot_sizes[chat_id] += delta
+        self._hot_total += delta
+        self._hot.move_to_end(chat_id)
+        self._hot_evict()
+    
+    def _hot_put(self, chat_id, messages):
+        """把从数据库加载的消息放入热窗口，并按 LRU 淘汰超出内存预算的聊天（调用方需持有 _hot_lock）"""
+        window = deque(messages, maxlen=self.max_history)
+        size = sum(self._estimate_size(m) for m in window)
+        self._hot[chat_id] = window
+        self._hot_sizes[chat_id] = size
+        self._hot_total += size
+        self._hot_evict()
+        return window
+    
+    def _hot_evict(self):
+        """按 LRU 淘汰聊天直到总内存不超过预算，最近访问的聊天始终保留（调用方需持有 _hot_lock）"""
+        while self._hot_total > self.hot_cache_bytes and len(self._hot) > 1:
+            evicted_id, _ = self._hot.popitem(last=False)
+            self._hot_total -= self._hot_sizes.pop(evicted_id)
+            self.LOG.debug(f"热窗口超出内存预算，淘汰聊天 {evicted_id}")
+    
+    def _hot_drop(self, chat_id):
+        """从热窗口移除聊天（调用方需持有 _hot_lock）"""
+        if self._hot.pop(chat_id, None) is not None:
+            self._hot_total -= self._hot_sizes.pop(chat_id)
+    
+    def _writer_loop(self):
+        """后台写线程：每隔 flush_interval 或缓冲区满时批量写入"""
+        while True:
+            with self._pending_cond:
+                # 上次写入失败时也等满一个间隔再重试，不在数据库出错期间空转
+                if not self._closed and (len(self._pending) < self.flush_batch_size or self._flush_failures):
+                    self._pending_cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+    
+    def flush(self):
+        """把缓冲区中的消息在一个事务中写入数据库"""
+        with self._flush_lock:
+            with self._pending_cond:
+                batch = self._pending
+                self._pending = []
+            if not batch:
+                return
             
-        except sqlite3.Error as e:
-            self.LOG.error(f"记录消息到数据库时出错: {e}")
-            # 可以考虑回滚事务
             try:
-                self.conn.rollback()
-            except:
-                pass
+                with self.db.transaction() as conn: # 一个批次只提交一次，出错自动回滚
+                    rows = []
+                    for chat_id, sender, content, ts_float, ts_str in batch:
+                        seq = self._allocate_seq(conn, chat_id)
+                        rows.append((chat_id, seq % self.max_history, seq, sender, content, ts_float, ts_str))
+                    
+                    # 环形缓冲区写入：槽位已被占用时覆盖最旧的消息，每条消息只触及一行
+                    conn.executemany("""
+                        INSERT INTO messages (chat_id, slot, seq, sender, content, timestamp_float, timestamp_str)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(chat_id, slot) DO UPDATE SET
+                            seq = excluded.seq,
+                            sender = excluded.sender,
+                            content = excluded.content,
+                            timestamp_float = excluded.timestamp_float,
+                            timestamp_str = excluded.timestamp_str
+                    """, rows)
+                
+            except sqlite3.Error as e:
+                # 回滚后序号缓存可能与数据库不一致，清空后重新加载
+                self._next_seq.clear()
+                self._flush_failures += 1
+                if self._flush_failures >= FLUSH_MAX_RETRIES:
+                    self.LOG.error(f"批量写入 {len(batch)} 条消息连续失败 {self._flush_failures} 次，丢弃该批消息: {e}")
+                    self._flush_failures = 0
+                    return
+                self.LOG.error(f"批量写入 {len(batch)} 条消息到数据库时出错（第 {self._flush_failures} 次），稍后重试: {e}")
+                # 放回缓冲区最前面，保持消息顺序，由下一次写入重试
+                with self._pending_cond:
+                    self._pending = batch + self._pending
+                return
+            self._flush_failures = 0
+    
+    def _allocate_seq(self, conn, chat_id):
+        """分配聊天内的下一个消息序号（调用方需持有 _flush_lock）"""
+        seq = self._next_seq.get(chat_id)
+        if seq is None:
+            row = conn.execute("SELECT MAX(seq) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
+            seq = row[0] + 1 if row and row[0] is not None else 0
+        self._next_seq[chat_id] = seq + 1
+        return seq
     
     def clear_message_history(self, chat_id):
         """清除指定聊天的消息历史记录
@@ -142,17 +308,22 @@ class MessageSummary:
         Returns:
             bool: 是否成功清除
         """
-        try:
-            # 删除指定chat_id的所有消息
-            self.cursor.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
-            rows_deleted = self.cursor.rowcount # 获取删除的行数
-            self.conn.commit()
-            self.LOG.info(f"为 chat_id={chat_id} 清除了 {rows_deleted} 条历史消息")
-            return True # 删除0条也视为成功完成操作
+        with self._flush_lock:
+            self.flush()
+            try:
+                # 删除指定chat_id的所有消息
+                with self.db.transaction() as conn:
+                    rows_deleted = conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,)).rowcount
+                self._next_seq.pop(chat_id, None)
+                # 删除提交后再移除热窗口；持有 _flush_lock 期间 get_messages 无法从数据库重新加载旧消息
+                with self._hot_lock:
+                    self._hot_drop(chat_id)
+                self.LOG.info(f"为 chat_id={chat_id} 清除了 {rows_deleted} 条历史消息")
+                return True # 删除0条也视为成功完成操作
             
-        except sqlite3.Error as e:
-            self.LOG.error(f"清除消息历史时出错 (chat_id={chat_id}): {e}")
-            return False
+            except sqlite3.Error as e:
+                self.LOG.error(f"清除消息历史时出错 (chat_id={chat_id}): {e}")
+                return False
     
     def get_message_count(self, chat_id):
         """获取指定聊天的消息数量
@@ -163,18 +334,23 @@ class MessageSummary:
         Returns:
             int: 消息数量
         """
+        with self._hot_lock:
+            window = self._hot.get(chat_id)
+            if window is not None:
+                return len(window)
+        self.flush()
         try:
             # 使用COUNT查询获取消息数量
-            self.cursor.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,))
-            result = self.cursor.fetchone() # fetchone() 返回一个元组，例如 (5,)
+            result = self.db.connection().execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
             return result[0] if result else 0
-            
+        
         except sqlite3.Error as e:
             self.LOG.error(f"获取消息数量时出错 (chat_id={chat_id}): {e}")
             return 0
     
     def get_messages(self, chat_id):
-        """获取指定聊天的所有消息 (按时间升序)
+        """获取指定聊天最近 max_history 条消息 (按时间升序)
+        优先从内存热窗口读取，首次访问时从数据库加载
         
         Args:
             chat_id: 聊天ID（群ID或用户ID）
@@ -182,18 +358,43 @@ class MessageSummary:
         Returns:
             list: 消息列表，格式为 [{"sender": ..., "content": ..., "time": ...}]
         """
+        with self._hot_lock:
+            window = self._hot.get(chat_id)
+            if window is not None:
+                self._hot.move_to_end(chat_id)
+                return list(window)
+        
+        # 冷聊天：写盘和读盘只持有 _flush_lock，不阻塞 record_message
+        with self._flush_lock:
+            # 先写入缓冲区中的消息，保证能读到刚记录的内容
+            self.flush()
+            messages = self._load_messages(chat_id)
+            if messages is None:
+                return []
+            with self._hot_lock:
+                window = self._hot.get(chat_id)
+                if window is None:
+                    # 加载期间新记录的消息只在缓冲区中（持有 _flush_lock 时不会被写盘），补到窗口末尾
+                    with self._pending_cond:
+                        messages.extend({"sender": sender, "content": content, "time": ts_str}
+                                        for cid, sender, content, _, ts_str in self._pending if cid == chat_id)
+                    window = self._hot_put(chat_id, messages)
+                else:
+                    # 加载期间窗口已由其他线程建立，丢弃本次加载结果
+                    self._hot.move_to_end(chat_id)
+                return list(window)
+    
+    def _load_messages(self, chat_id):
+        """从数据库读取指定聊天的消息，出错时返回 None"""
         messages = []
         try:
-            # 查询需要的字段，按浮点时间戳升序排序，限制数量
-            self.cursor.execute("""
+            # 环形缓冲区中最多 max_history 条，按序号升序返回；读操作不加锁，WAL 下不会被写入阻塞
+            rows = self.db.connection().execute("""
                 SELECT sender, content, timestamp_str
                 FROM messages
                 WHERE chat_id = ?
-                ORDER BY timestamp_float ASC
-                LIMIT ?
-            """, (chat_id, self.max_history))
-            
-            rows = self.cursor.fetchall() # fetchall() 返回包含元组的列表
+                ORDER BY seq ASC
+            """, (chat_id,)).fetchall()
             
             # 将数据库行转换为期望的字典列表格式
             for row in rows:
@@ -202,10 +403,10 @@ class MessageSummary:
                     "content": row[1],
                     "time": row[2] # 使用存储的 timestamp_str
                 })
-                
+            
         except sqlite3.Error as e:
             self.LOG.error(f"获取消息列表时出错 (chat_id={chat_id}): {e}")
-            # 出错时返回空列表，保持与原逻辑一致
+            return None
             
         return messages
     
@@ -299,7 +500,13 @@ class MessageSummary:
         else:
             return self._basic_summarize(messages)
     
-    def process_message_from_wxmsg(self, msg, wcf, all_contacts, bot_wxid=None):
+    def _get_alias(self, wcf, wxid, roomid):
+        """获取群昵称，优先走缓存"""
+        if self.contact_cache:
+            return self.contact_cache.get_alias(wxid, roomid)
+        return wcf.get_alias_in_chatroom(wxid, roomid)
+
+    def process_message_from_wxmsg(self, msg, wcf, all_contacts, bot_wxid=None, msg_data=None):
         """从微信消息对象中处理并记录与总结相关的文本消息
         使用 XmlProcessor 提取用户实际输入的新内容或卡片标题。
 
@@ -308,6 +515,7 @@ class MessageSummary:
             wcf: 微信接口对象
             all_contacts: 所有联系人字典
             bot_wxid: 机器人自己的wxid，用于检测@机器人的消息
+            msg_data: 已解析好的消息数据 (XmlProcessor.parse_message)，为空时自行解析
         """
         # 1. 基本筛选：只记录群聊中的、非自己发送的文本消息或App消息
         if not msg.from_group():
@@ -323,7 +531,7 @@ class MessageSummary:
         original_content = msg.content  # 获取原始content用于检测@和后续处理
         if bot_wxid:
             # 获取机器人在群里的昵称
-            bot_name_in_group = wcf.get_alias_in_chatroom(bot_wxid, chat_id)
+            bot_name_in_group = self._get_alias(wcf, bot_wxid, chat_id)
             if not bot_name_in_group:
                 # 如果获取不到群昵称，使用通讯录中的名称或默认名称
                 bot_name_in_group = all_contacts.get(bot_wxid, "泡泡")  # 默认使用"泡泡"
@@ -342,7 +550,7 @@ class MessageSummary:
 
         # 3. 使用 XmlProcessor 提取消息详情
         try:
-            extracted_data = self.xml_processor.extract_quoted_message(msg)
+            extracted_data = msg_data if msg_data is not None else self.xml_processor.extract_quoted_message(msg)
         except Exception as e:
             self.LOG.error(f"使用XmlProcessor提取消息内容时出错 (msg.id={msg.id}): {e}")
             return  # 出错时，保守起见，不记录
@@ -449,7 +657,7 @@ class MessageSummary:
             return
 
         # 6. 获取发送者昵称
-        sender_name = wcf.get_alias_in_chatroom(msg.sender, msg.roomid)
+        sender_name = self._get_alias(wcf, msg.sender, msg.roomid)
         if not sender_name:  # 如果没有群昵称，尝试获取微信昵称
             sender_data = all_contacts.get(msg.sender)
             sender_name = sender_data if sender_data else msg.sender  # 最后使用wxid
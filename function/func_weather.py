@@ -1,11 +1,29 @@
 import requests, json
 import logging
 import re  # 导入正则表达式模块，用于提取数字
+from typing import Optional
+
+from function.func_city import resolve_city
 
 class Weather:
     def __init__(self, city_code: str) -> None:
-        self.city_code = city_code
+        """
+        :param city_code: 城市代码；也可以直接传城市名，由城市解析器转换为代码
+        """
         self.LOG = logging.getLogger("Weather")
+        self.city_code = str(city_code).strip()
+        if self.city_code and not self.city_code.isdigit():
+            resolved = resolve_city(self.city_code)
+            if resolved:
+                self.city_code = resolved[1]
+            else:
+                self.LOG.warning(f"无法解析城市: {self.city_code}")
+
+    @classmethod
+    def from_city(cls, city_name: str) -> Optional["Weather"]:
+        """按城市名创建，找不到城市时返回 None"""
+        resolved = resolve_city(city_name)
+        return cls(resolved[1]) if resolved else None
         
     def _extract_temp(self, temp_str: str) -> str:
         """从高温/低温字符串中提取温度数值"""
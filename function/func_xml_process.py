@@ -5,16 +5,45 @@ import time
 import xml.etree.ElementTree as ET
 from wcferry import WxMsg
 
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml 不可用时只使用正则解析
+    lxml_etree = None
+
+# lxml 增量解析时每次喂入的字节数
+_FAST_PARSE_CHUNK = 8192
+
 class XmlProcessor:
     """处理微信消息XML解析的工具类"""
     
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, fast_parser=True):
         """初始化XML处理器
         
         Args:
             logger: 日志对象，如果不提供则创建一个新的
+            fast_parser: 是否优先使用 lxml 增量解析（单次遍历），XML 格式异常时自动回退到正则解析
         """
         self.logger = logger or logging.getLogger("XmlProcessor")
+        self.fast_parser = fast_parser and lxml_etree is not None
+    
+    def parse_message(self, msg: WxMsg, is_group: bool = None) -> dict:
+        """解析一条消息的XML，得到供各处共享的消息解析结果
+        
+        每条消息只应在 Robot.processMsg 中解析一次，结果挂在 MessageContext.msg_data 上，
+        消息历史、预处理和各命令处理函数直接读取，不再重复解析。
+        
+        Args:
+            msg: 微信消息对象
+            is_group: 是否群聊消息，默认根据 msg.from_group() 判断
+            
+        Returns:
+            dict: 与 extract_quoted_message / extract_private_quoted_message 相同结构的字典
+        """
+        if is_group is None:
+            is_group = msg.from_group()
+        if is_group:
+            return self.extract_quoted_message(msg)
+        return self.extract_private_quoted_message(msg)
     
     def extract_quoted_message(self, msg: WxMsg) -> dict:
         """从微信消息中提取引用内容
@@ -345,6 +374,11 @@ class XmlProcessor:
                 "raw_content": "" # 解码后的原始XML内容，用于后续解析
             }
         """
+        if self.fast_parser:
+            fast_result = self._fast_extract_refermsg(content)
+            if fast_result is not None:
+                return fast_result
+        
         result = {"sender": "", "content": "", "raw_content": ""}
         
         try:
@@ -397,6 +431,11 @@ class XmlProcessor:
                 "raw_content": "" # 解码后的原始XML内容，用于后续解析
             }
         """
+        if self.fast_parser:
+            fast_result = self._fast_extract_refermsg(content)
+            if fast_result is not None:
+                return fast_result
+        
         result = {"sender": "", "content": "", "raw_content": ""}
         
         try:
@@ -580,6 +619,11 @@ class XmlProcessor:
         Returns:
             dict: 包含卡片详情的字典
         """
+        if self.fast_parser:
+            fast_result = self._fast_extract_card_details(content)
+            if fast_result is not None:
+                return fast_result
+
         result = {
             "is_card": False,
             "card_type": "",
@@ -722,6 +766,130 @@ class XmlProcessor:
 
         return result
     
+    def _iter_xml_events(self, content: str):
+        """使用 lxml 增量解析器逐块解析 XML，产出 (事件, 元素)
+        调用方找到所需节点后即可停止迭代，后面的内容不再解析
+        """
+        parser = lxml_etree.XMLPullParser(events=("start", "end"), resolve_entities=False,
+                                          no_network=True, huge_tree=True)
+        data = content.encode("utf-8")
+        for i in range(0, len(data), _FAST_PARSE_CHUNK):
+            parser.feed(data[i:i + _FAST_PARSE_CHUNK])
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    def _find_first_element(self, content: str, tag: str):
+        """单次遍历找到第一个指定标签的完整元素
+        
+        Returns:
+            lxml 元素；文档中没有该标签时返回 False；XML 格式异常时返回 None
+        """
+        target = None
+        try:
+            for event, element in self._iter_xml_events(content):
+                if event == "start" and target is None and element.tag == tag:
+                    target = element
+                elif event == "end" and element is target:
+                    return target
+            return False
+        except (lxml_etree.XMLSyntaxError, ValueError) as e:
+            self.logger.debug(f"lxml 解析 <{tag}> 失败，回退到正则解析: {e}")
+            return None
+
+    def _fast_extract_refermsg(self, content: str):
+        """extract_refermsg 的 lxml 快速路径，返回结构相同；XML 异常或结构特殊时返回 None 以回退正则"""
+        if "<refermsg>" not in content:
+            return {"sender": "", "content": "", "raw_content": ""}
+        refermsg = self._find_first_element(content, "refermsg")
+        if refermsg is None or refermsg is False:
+            return None
+
+        result = {"sender": "", "content": "", "raw_content": ""}
+        displayname = refermsg.find(".//displayname")
+        if displayname is not None:
+            result["sender"] = (displayname.text or "").strip()
+
+        content_node = refermsg.find(".//content")
+        if content_node is not None:
+            if len(content_node):
+                # <content> 中有未转义的子节点，交给正则路径按原样处理
+                return None
+            # 解析器已做过一次实体解码，相当于正则路径中的 html.unescape
+            decoded_content = content_node.text or ""
+            result["raw_content"] = decoded_content
+            result["content"] = re.sub(r'\s+', ' ', decoded_content).strip()
+        return result
+
+    def _fast_extract_card_details(self, content: str):
+        """extract_card_details 的 lxml 快速路径，返回结构相同；XML 异常时返回 None 以回退正则"""
+        result = {
+            "is_card": False,
+            "card_type": "",
+            "card_title": "",
+            "card_description": "",
+            "card_url": "",
+            "card_appname": "",
+            "card_sourcedisplayname": ""
+        }
+        if "<appmsg" not in content:
+            return result
+        appmsg_root = self._find_first_element(content, "appmsg")
+        if appmsg_root is None:
+            return None
+        if appmsg_root is False:
+            return result
+
+        result["is_card"] = True
+
+        # 一次遍历 <appmsg> 的直接子节点，取每种标签的第一个（与 find('./tag') 语义一致）
+        children = {}
+        for child in appmsg_root:
+            if child.tag not in children:
+                children[child.tag] = child
+
+        def child_text(tag):
+            node = children.get(tag)
+            return (node.text or "").strip() if node is not None else ""
+
+        card_type_num = appmsg_root.get('type', '')
+        if card_type_num:
+            result["card_type"] = self.get_card_type_name(card_type_num)
+        else:
+            type_node = children.get('type')
+            if type_node is not None and type_node.text:
+                result["card_type"] = self.get_card_type_name(type_node.text.strip())
+
+        title = child_text('title')
+        if title:
+            result["card_title"] = html.unescape(title)
+
+        description = child_text('des')
+        if description:
+            if "<" in description:
+                description = re.sub(r'<.*?>', '', description)
+            result["card_description"] = html.unescape(description)
+
+        url = child_text('url')
+        if url:
+            result["card_url"] = html.unescape(url)
+
+        appinfo_node = children.get('appinfo')
+        appname_node = appinfo_node.find('appname') if appinfo_node is not None else None
+        if appname_node is not None and appname_node.text:
+            result["card_appname"] = html.unescape(appname_node.text.strip())
+        sourcedisplayname = children.get('sourcedisplayname')
+        if sourcedisplayname is not None and sourcedisplayname.text:
+            result["card_sourcedisplayname"] = html.unescape(sourcedisplayname.text.strip())
+            if not result["card_appname"]:
+                result["card_appname"] = result["card_sourcedisplayname"]
+        if not result["card_appname"]:
+            appname_direct = child_text('appname')
+            if appname_direct:
+                result["card_appname"] = html.unescape(appname_direct)
+
+        return result
+
     def get_card_type_name(self, type_num: str) -> str:
         """根据卡片类型编号获取类型名称
         
@@ -853,4 +1021,72 @@ class XmlProcessor:
         if not result:
             result.append(f"[{current_time}] {sender_name} 发送了消息")
         
-        return "\n\n".join(result) 
\ No newline at end of file
+        return "\n\n".join(result) 
+
+
+if __name__ == "__main__":
+    # 基准测试：对比每条消息解析三次（消息历史 + 预处理 + 闲聊）与只解析一次的CPU耗时
+    # 用法: python -m function.func_xml_process [每条样本重复次数]
+    import sys
+
+    class _BenchMsg:
+        """模拟 WxMsg，只包含解析所需的字段"""
+        def __init__(self, content, msg_type=49, roomid="12345@chatroom"):
+            self.type = msg_type
+            self.content = content
+            self.sender = "wxid_bench"
+            self.roomid = roomid
+            self.id = 0
+
+        def from_group(self):
+            return bool(self.roomid)
+
+    def _card_xml(title, des, url, app_type="5"):
+        return (
+            '<?xml version="1.0"?><msg><appmsg appid="" sdkver="0">'
+            f'<title>{title}</title><des>{des}</des><type>{app_type}</type>'
+            f'<url>{url}</url><appattach><totallen>0</totallen></appattach>'
+            '<sourcedisplayname>公众号示例</sourcedisplayname></appmsg>'
+            '<fromusername>wxid_bench</fromusername><appinfo><version>1</version><appname>公众号示例</appname></appinfo></msg>'
+        )
+
+    def _quote_xml(new_text, quoted_inner, quoted_type="1"):
+        return (
+            '<?xml version="1.0"?><msg><appmsg appid="" sdkver="0">'
+            f'<title>{new_text}</title><des></des><type>57</type>'
+            '<refermsg>'
+            f'<type>{quoted_type}</type><svrid>1234567890</svrid><fromusr>12345@chatroom</fromusr>'
+            '<chatusr>wxid_other</chatusr><displayname>张三</displayname>'
+            f'<content>{html.escape(quoted_inner)}</content>'
+            '</refermsg></appmsg><fromusername>wxid_bench</fromusername></msg>'
+        )
+
+    long_des = "这是一段很长的文章摘要，" * 40
+    corpus = [
+        _BenchMsg(_card_xml("一篇转发的文章", long_des, "https://mp.weixin.qq.com/s/" + "x" * 200)),
+        _BenchMsg(_card_xml("B站视频分享", "视频简介", "https://b23.tv/abcdef", app_type="4")),
+        _BenchMsg(_quote_xml("这个说得对", "原来的一句话")),
+        _BenchMsg(_quote_xml("看看这篇", _card_xml("被引用的文章", long_des, "https://example.com/a"), quoted_type="49")),
+        _BenchMsg(_quote_xml("私聊引用", "原话"), roomid=""),
+    ]
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logging.basicConfig(level=logging.WARNING)
+    def _run(processor, parses_per_msg):
+        start = time.process_time()
+        for _ in range(repeat):
+            for m in corpus:
+                for _ in range(parses_per_msg):
+                    processor.parse_message(m)
+        return (time.process_time() - start) / (repeat * len(corpus))
+
+    print(f"样本数: {len(corpus)} x {repeat}")
+    for label, fast in (("正则解析", False), ("lxml快速解析", True)):
+        processor = XmlProcessor(logging.getLogger("XmlBenchmark"), fast_parser=fast)
+        if fast and not processor.fast_parser:
+            print(f"[{label}] lxml 不可用，跳过")
+            continue
+        before = _run(processor, 3)
+        after = _run(processor, 1)
+        print(f"[{label}] 每条消息解析三次: {before * 1e6:.1f} us, 解析一次: {after * 1e6:.1f} us, "
+              f"节省: {(before - after) * 1e6:.1f} us ({(1 - after / before) * 100:.0f}%)")
@@ -1,75 +1,275 @@
 # -*- coding: utf-8 -*-
 
 import time
+import heapq
+import itertools
 import logging
-from typing import Any, Callable
-
-import schedule
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 # 获取模块级 logger
 logger = logging.getLogger(__name__)
 
 
+class ScheduledJob(object):
+    """一个定时任务及其执行统计"""
+
+    def __init__(self, task: Callable[..., Any], args: tuple, kwargs: dict, interval: Optional[float] = None,
+                 at: Optional[Tuple[int, int, int]] = None, timeout: Optional[float] = None,
+                 allow_overlap: bool = False) -> None:
+        """
+        :param task: 定时执行的方法
+        :param interval: 固定间隔（秒），与 at 二选一
+        :param at: 每天执行的时间 (时, 分, 秒)
+        :param timeout: 超时时间（秒），超时只告警并计数，任务本身无法被强制终止
+        :param allow_overlap: 上一次还没执行完时是否允许再次执行
+        """
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.interval = interval
+        self.at = at
+        self.timeout = timeout
+        self.allow_overlap = allow_overlap
+        self.name = getattr(task, "__qualname__", repr(task))
+        if at:
+            self.name += f"@{at[0]:02d}:{at[1]:02d}:{at[2]:02d}"
+        self.next_run = 0.0
+        # 运行状态与统计
+        self.running = 0
+        self.run_id = 0
+        self.started_at = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+
+    def schedule_next(self, now: float) -> float:
+        """计算 now 之后的下一次执行时间"""
+        if self.at:
+            hour, minute, second = self.at
+            current = datetime.fromtimestamp(now)
+            candidate = current.replace(hour=hour, minute=minute, second=second, microsecond=0)
+            if candidate <= current:
+                candidate += timedelta(days=1)
+            self.next_run = candidate.timestamp()
+        else:
+            # 按计划时间顺延，调度落后时不补跑，从当前时间重新计
+            self.next_run = self.next_run + self.interval if self.next_run else now + self.interval
+            if self.next_run <= now:
+                self.next_run = now + self.interval
+        return self.next_run
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "running": self.running,
+            "avg_time": self.total_time / self.runs if self.runs else 0.0,
+            "max_time": self.max_time,
+            "last_time": self.last_time,
+            "next_run": datetime.fromtimestamp(self.next_run).strftime("%Y-%m-%d %H:%M:%S") if self.next_run else None,
+        }
+
+
 class Job(object):
-    def __init__(self) -> None:
-        pass
+    """定时任务调度
+    所有任务按 (下次执行时间, 序号) 放入小顶堆，调度线程睡到堆顶到期才醒来，不再每秒轮询；
+    到期的任务交给有界线程池执行，慢任务（如抓新闻、查天气）不会拖住其他任务和调度本身。
+    默认同一任务上一次没执行完时跳过本次，超时只告警计数，并记录每个任务的执行耗时。
+    """
 
-    def onEverySeconds(self, seconds: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    # 堆中条目的类型：执行任务 / 检查超时
+    _RUN, _TIMEOUT_CHECK = 0, 1
+
+    def __init__(self, max_workers: int = 4) -> None:
+        """
+        :param max_workers: 执行定时任务的最大线程数
+        """
+        self._max_workers = max(1, max_workers)
+        self._jobs: List[ScheduledJob] = []
+        self._heap: List[Tuple[float, int, int, ScheduledJob, int]] = []  # (到期时间, 序号, 类型, 任务, run_id)
+        self._heap_seq = itertools.count()
+        self._job_cond = Condition()
+        self._job_stopping = False
+        self._job_thread: Optional[Thread] = None
+        self._job_pool: Optional[ThreadPoolExecutor] = None
+
+    def _addJob(self, job: ScheduledJob) -> ScheduledJob:
+        with self._job_cond:
+            names = {j.name for j in self._jobs}
+            if job.name in names:
+                # 同一方法注册多次时用序号区分，避免统计互相覆盖
+                job.name = next(f"{job.name}#{i}" for i in itertools.count(2) if f"{job.name}#{i}" not in names)
+            self._jobs.append(job)
+            self._pushJob(job.schedule_next(time.time()), self._RUN, job)
+            self._job_cond.notify()
+        self.startJobs()
+        return job
+
+    def _pushJob(self, due: float, kind: int, job: ScheduledJob, run_id: int = 0) -> None:
+        heapq.heappush(self._heap, (due, next(self._heap_seq), kind, job, run_id))
+
+    def onEverySeconds(self, seconds: int, task: Callable[..., Any], *args, timeout: Optional[float] = None,
+                       allow_overlap: bool = False, **kwargs) -> ScheduledJob:
         """
         每 seconds 秒执行
         :param seconds: 间隔，秒
         :param task: 定时执行的方法
-        :return: None
+        :param timeout: 超时告警时间（秒），为 None 时不检查
+        :param allow_overlap: 上一次还没执行完时是否仍然执行
+        :return: ScheduledJob
         """
-        schedule.every(seconds).seconds.do(task, *args, **kwargs)
+        return self._addJob(ScheduledJob(task, args, kwargs, interval=seconds,
+                                         timeout=timeout, allow_overlap=allow_overlap))
 
-    def onEveryMinutes(self, minutes: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryMinutes(self, minutes: int, task: Callable[..., Any], *args, timeout: Optional[float] = None,
+                       allow_overlap: bool = False, **kwargs) -> ScheduledJob:
         """
         每 minutes 分钟执行
         :param minutes: 间隔，分钟
         :param task: 定时执行的方法
-        :return: None
+        :return: ScheduledJob
         """
-        schedule.every(minutes).minutes.do(task, *args, **kwargs)
+        return self.onEverySeconds(minutes * 60, task, *args, timeout=timeout, allow_overlap=allow_overlap, **kwargs)
 
-    def onEveryHours(self, hours: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryHours(self, hours: int, task: Callable[..., Any], *args, timeout: Optional[float] = None,
+                     allow_overlap: bool = False, **kwargs) -> ScheduledJob:
         """
         每 hours 小时执行
         :param hours: 间隔，小时
         :param task: 定时执行的方法
-        :return: None
+        :return: ScheduledJob
         """
-        schedule.every(hours).hours.do(task, *args, **kwargs)
+        return self.onEverySeconds(hours * 3600, task, *args, timeout=timeout, allow_overlap=allow_overlap, **kwargs)
 
-    def onEveryDays(self, days: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryDays(self, days: int, task: Callable[..., Any], *args, timeout: Optional[float] = None,
+                    allow_overlap: bool = False, **kwargs) -> ScheduledJob:
         """
         每 days 天执行
         :param days: 间隔，天
         :param task: 定时执行的方法
-        :return: None
+        :return: ScheduledJob
         """
-        schedule.every(days).days.do(task, *args, **kwargs)
+        return self.onEverySeconds(days * 86400, task, *args, timeout=timeout, allow_overlap=allow_overlap, **kwargs)
 
-    def onEveryTime(self, times: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryTime(self, times: int, task: Callable[..., Any], *args, timeout: Optional[float] = None,
+                    allow_overlap: bool = False, **kwargs) -> List[ScheduledJob]:
         """
         每天定时执行
-        :param times: 时间字符串列表，格式:
-            - For daily jobs -> HH:MM:SS or HH:MM
-            - For hourly jobs -> MM:SS or :MM
-            - For minute jobs -> :SS
+        :param times: 时间字符串或列表，格式 HH:MM:SS 或 HH:MM
         :param task: 定时执行的方法
-        :return: None
+        :param timeout: 超时告警时间（秒），为 None 时不检查
+        :param allow_overlap: 上一次还没执行完时是否仍然执行
+        :return: 每个时间点对应的 ScheduledJob
 
         例子: times=["10:30", "10:45", "11:00"]
         """
         if not isinstance(times, list):
             times = [times]
 
+        jobs = []
         for t in times:
-            schedule.every(1).days.at(t).do(task, *args, **kwargs)
+            parts = [int(p) for p in t.split(":")]
+            if len(parts) == 2:
+                parts.append(0)
+            if len(parts) != 3 or not (0 <= parts[0] < 24 and 0 <= parts[1] < 60 and 0 <= parts[2] < 60):
+                raise ValueError(f"无效的时间格式: {t}，需要 HH:MM 或 HH:MM:SS")
+            jobs.append(self._addJob(ScheduledJob(task, args, kwargs, at=tuple(parts),
+                                                  timeout=timeout, allow_overlap=allow_overlap)))
+        return jobs
+
+    def startJobs(self) -> None:
+        """启动调度线程和任务线程池（重复调用无副作用）"""
+        with self._job_cond:
+            if self._job_stopping or (self._job_thread and self._job_thread.is_alive()):
+                return
+            self._job_pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="Job")
+            self._job_thread = Thread(target=self._jobLoop, name="JobScheduler", daemon=True)
+            self._job_thread.start()
 
     def runPendingJobs(self) -> None:
-        schedule.run_pending()
+        """兼容旧调用：任务由调度线程自动执行，这里只确保调度线程已启动"""
+        self.startJobs()
+
+    def _jobLoop(self) -> None:
+        """调度线程：睡到堆顶到期，执行到期任务或检查超时"""
+        while True:
+            with self._job_cond:
+                while not self._job_stopping:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._job_cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._job_stopping:
+                    return
+                _, _, kind, job, run_id = heapq.heappop(self._heap)
+                if kind == self._TIMEOUT_CHECK:
+                    if job.running and job.run_id == run_id:
+                        job.timeouts += 1
+                        logger.warning(f"定时任务 {job.name} 已运行 {time.time() - job.started_at:.1f} 秒，超过 {job.timeout} 秒")
+                    continue
+                self._pushJob(job.schedule_next(time.time()), self._RUN, job)
+                if job.running and not job.allow_overlap:
+                    job.skipped += 1
+                    logger.warning(f"定时任务 {job.name} 上一次还未执行完，跳过本次")
+                    continue
+                job.running += 1
+                job.run_id += 1
+                job.started_at = time.time()
+                if job.timeout:
+                    self._pushJob(job.started_at + job.timeout, self._TIMEOUT_CHECK, job, job.run_id)
+                pool = self._job_pool
+            try:
+                pool.submit(self._runJob, job)
+            except RuntimeError:
+                # 线程池已关闭（正在退出）
+                with self._job_cond:
+                    job.running -= 1
+                return
+
+    def _runJob(self, job: ScheduledJob) -> None:
+        """在线程池中执行任务并记录耗时"""
+        start = time.time()
+        failed = False
+        try:
+            job.task(*job.args, **job.kwargs)
+        except Exception as e:
+            failed = True
+            logger.error(f"定时任务 {job.name} 执行出错: {e}", exc_info=True)
+        finally:
+            elapsed = time.time() - start
+            with self._job_cond:
+                job.running -= 1
+                job.runs += 1
+                job.failures += failed
+                job.total_time += elapsed
+                job.last_time = elapsed
+                job.max_time = max(job.max_time, elapsed)
+            logger.info(f"定时任务 {job.name} 执行{'失败' if failed else '完成'}，耗时 {elapsed:.2f} 秒")
+
+    def getJobStats(self) -> Dict[str, Dict[str, Any]]:
+        """获取每个定时任务的执行统计"""
+        with self._job_cond:
+            return {job.name: job.stats() for job in self._jobs}
+
+    def stopJobs(self, wait: bool = True) -> None:
+        """停止调度线程，wait 为 True 时等待正在执行的任务结束"""
+        with self._job_cond:
+            self._job_stopping = True
+            self._job_cond.notify_all()
+            pool, thread = self._job_pool, self._job_thread
+        if thread and thread.is_alive():
+            thread.join()
+        if pool:
+            pool.shutdown(wait=wait)
 
 
 if __name__ == "__main__":
@@ -78,7 +278,7 @@ if __name__ == "__main__":
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(name)s - %(message)s'
     )
-    
+
     def printStr(s):
         logger.info(s)
 
@@ -90,5 +290,4 @@ if __name__ == "__main__":
     job.onEveryTime("23:59", printStr, "onEveryTime 23:59")
 
     while True:
-        job.runPendingJobs()
-        time.sleep(1)
+        time.sleep(3600)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import zlib
+from queue import Queue
+from threading import Thread
+from typing import Any, Callable, Dict, List
+
+# 获取模块级 logger
+logger = logging.getLogger(__name__)
+
+
+class MessageDispatcher(object):
+    """消息分片调度器
+    按会话（群聊用 roomid，私聊用 sender）把消息哈希到固定的工作线程上：
+    不同会话之间并行处理，同一会话内的消息严格按到达顺序处理。
+    """
+
+    def __init__(self, handler: Callable[[Any], None], num_workers: int = 4, name: str = "MsgWorker") -> None:
+        """
+        :param handler: 处理单条消息的函数（如 Robot.processMsg）
+        :param num_workers: 工作线程（分片）数量
+        :param name: 工作线程名前缀
+        """
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers or 1))
+        self.name = name
+        self._queues: List[Queue] = [Queue() for _ in range(self.num_workers)]
+        self._workers: List[Thread] = []
+
+    def start(self) -> None:
+        """启动所有工作线程"""
+        if self._workers:
+            return
+        for i, q in enumerate(self._queues):
+            worker = Thread(target=self._worker_loop, name=f"{self.name}-{i}", args=(q,), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"消息调度器已启动，共 {self.num_workers} 个工作线程")
+
+    def stop(self, timeout: float = 5) -> None:
+        """停止所有工作线程（处理完已入队的消息后退出）"""
+        for q in self._queues:
+            q.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    @staticmethod
+    def conversation_key(msg: Any) -> str:
+        """获取消息所属会话的标识：群聊为 roomid，私聊为 sender"""
+        return msg.roomid if msg.from_group() else msg.sender
+
+    def shard_of(self, key: str) -> int:
+        """计算会话标识对应的分片编号（使用稳定哈希，不受 PYTHONHASHSEED 影响）"""
+        return zlib.crc32(key.encode("utf-8")) % self.num_workers
+
+    def submit(self, msg: Any) -> int:
+        """
+        将消息投递到其会话对应的分片队列
+        :param msg: 微信消息对象
+        :return: 分片编号
+        """
+        shard = self.shard_of(self.conversation_key(msg) or "")
+        self._queues[shard].put(msg)
+        return shard
+
+    def get_queue_depths(self) -> Dict[int, int]:
+        """获取各分片当前排队的消息数，便于监控
+        :return: {分片编号: 队列深度}
+        """
+        return {i: q.qsize() for i, q in enumerate(self._queues)}
+
+    def _worker_loop(self, q: Queue) -> None:
+        while True:
+            msg = q.get()
+            try:
+                if msg is None:
+                    return
+                self.handler(msg)
+            except Exception as e:
+                logger.error(f"工作线程处理消息出错: {e}", exc_info=True)
+            finally:
+                q.task_done()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from rate_limiter import SendRateLimiter
+
+# 获取模块级 logger
+logger = logging.getLogger(__name__)
+
+
+class OutboundMessage(object):
+    """待发送的一条消息"""
+
+    __slots__ = ("receiver", "send_func", "paced", "use_global_limit", "future", "callback")
+
+    def __init__(self, receiver: str, send_func: Callable[[], Any], paced: bool, use_global_limit: bool,
+                 callback: Optional[Callable[[Future], None]] = None) -> None:
+        self.receiver = receiver
+        self.send_func = send_func
+        self.paced = paced
+        self.use_global_limit = use_global_limit
+        self.future = Future()
+        self.callback = callback
+
+
+class OutboundSender(object):
+    """发送队列
+    调用方只负责入队并立即返回，由单独的发送线程负责发送。
+    模拟真人的随机延迟计入该接收者的"可发送时间"，发送线程不会为此睡眠，其他接收者的消息照常发送。
+
+    每个接收者一个 FIFO 队列，保证同一接收者的消息顺序；各接收者按"可发送时间"放入小顶堆轮转，
+    某个群超出限流时只推迟该群的队列，不会饿死其他安静的群。
+    """
+
+    def __init__(self, rate_limiter: Optional[SendRateLimiter] = None, min_delay: float = 0.3,
+                 max_delay: float = 1.3, name: str = "MsgSender") -> None:
+        """
+        :param rate_limiter: 发送限流器，为 None 时不限流
+        :param min_delay: 需要节奏控制的消息发送前的最小随机延迟（秒）
+        :param max_delay: 需要节奏控制的消息发送前的最大随机延迟（秒）
+        :param name: 发送线程名
+        """
+        self.rate_limiter = rate_limiter
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.name = name
+        self._queues: Dict[str, Deque[OutboundMessage]] = {}
+        self._ready: List[Tuple[float, int, str]] = []  # (可发送时间, 序号, 接收者)
+        self._seq = itertools.count()
+        self._pending = 0
+        self._cond = Condition()
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        """启动发送线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = Thread(target=self._send_loop, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("消息发送队列已启动")
+
+    def stop(self, timeout: float = 10) -> None:
+        """停止发送线程，会先尽量发完已入队的消息"""
+        if not self._thread:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"发送线程在 {timeout} 秒内未结束，剩余 {self.pending_count()} 条消息未发送")
+        self._thread = None
+
+    def submit(self, receiver: str, send_func: Callable[[], Any], paced: bool = True, use_global_limit: bool = True,
+               callback: Optional[Callable[[Future], None]] = None) -> Future:
+        """
+        将一次发送操作加入队列
+        :param receiver: 接收人wxid或者群id
+        :param send_func: 实际执行发送的函数，其返回值作为 Future 的结果
+        :param paced: 是否在发送前加入随机延迟
+        :param use_global_limit: 是否计入全局限流（接收者自身的限流总是生效）
+        :param callback: 发送完成（成功或失败）后的回调，参数为对应的 Future
+        :return: Future，可用于获取发送结果
+        """
+        item = OutboundMessage(receiver, send_func, paced, use_global_limit, callback)
+        if callback:
+            item.future.add_done_callback(callback)
+        with self._cond:
+            q = self._queues.get(receiver)
+            if q is None:
+                q = self._queues[receiver] = deque()
+                heapq.heappush(self._ready, (time.monotonic() + self._jitter(item), next(self._seq), receiver))
+            q.append(item)
+            self._pending += 1
+            self._cond.notify()
+        return item.future
+
+    def _jitter(self, item: OutboundMessage) -> float:
+        """需要节奏控制的消息发送前的随机延迟（秒）"""
+        return random.uniform(self.min_delay, self.max_delay) if item.paced else 0.0
+
+    def pending_count(self) -> int:
+        """获取当前排队等待发送的消息数"""
+        with self._cond:
+            return self._pending
+
+    def _next_message(self) -> Optional[OutboundMessage]:
+        """取出下一条可以发送的消息；队列为空且正在停止时返回 None"""
+        with self._cond:
+            while True:
+                if not self._ready:
+                    if self._stopping:
+                        return None
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                ready_at, _, receiver = self._ready[0]
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+
+                heapq.heappop(self._ready)
+                q = self._queues[receiver]
+                item = q[0]
+                wait = self.rate_limiter.try_acquire(receiver, item.use_global_limit) if self.rate_limiter else 0
+                if wait > 0:
+                    # 超出限流，整条队列推迟，不丢弃消息
+                    logger.debug(f"发往 {receiver} 的消息超出限流，推迟 {wait:.1f} 秒")
+                    heapq.heappush(self._ready, (now + wait, next(self._seq), receiver))
+                    continue
+
+                q.popleft()
+                self._pending -= 1
+                if q:
+                    # 排到其他已就绪接收者之后轮转发送，下一条消息的随机延迟只推迟本接收者
+                    heapq.heappush(self._ready, (now + self._jitter(q[0]), next(self._seq), receiver))
+                else:
+                    del self._queues[receiver]
+                return item
+
+    def _send_loop(self) -> None:
+        while True:
+            item = self._next_message()
+            if item is None:
+                return
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            try:
+                item.future.set_result(item.send_func())
+            except Exception as e:
+                logger.error(f"发送消息到 {item.receiver} 失败: {e}", exc_info=True)
+                item.future.set_exception(e)
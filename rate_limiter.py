@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Lock
+from typing import Dict, Optional
+
+
+class TokenBucket(object):
+    """令牌桶
+    每次取令牌时按流逝时间惰性补充，取令牌和计算等待时间都是 O(1)。
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "last")
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None) -> None:
+        """
+        :param per_minute: 每分钟补充的令牌数
+        :param capacity: 桶容量（允许的突发量），默认等于 per_minute
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.last:
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+    def wait_time(self, now: float) -> float:
+        """距离桶里有一个可用令牌还需等待的秒数（不消耗令牌）"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        """消耗一个令牌（调用前应确认 wait_time 为 0）"""
+        self._refill(now)
+        self.tokens -= 1
+
+
+class SendRateLimiter(object):
+    """发送限流器
+    同时维护全局、每个群、每个私聊用户三类令牌桶（单位：条/分钟，0 表示不限制）。
+    超限时不丢弃消息，而是返回需要推迟的秒数，由发送队列延后发送。
+    """
+
+    def __init__(self, global_per_minute: float = 0, group_per_minute: float = 0, user_per_minute: float = 0) -> None:
+        """
+        :param global_per_minute: 全局每分钟最多发送条数
+        :param group_per_minute: 每个群每分钟最多发送条数
+        :param user_per_minute: 每个私聊用户每分钟最多发送条数
+        """
+        self.group_per_minute = group_per_minute
+        self.user_per_minute = user_per_minute
+        self._global = TokenBucket(global_per_minute) if global_per_minute > 0 else None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def is_group(receiver: str) -> bool:
+        return receiver.endswith("@chatroom")
+
+    def _receiver_bucket(self, receiver: str) -> Optional[TokenBucket]:
+        bucket = self._buckets.get(receiver)
+        if bucket is None:
+            per_minute = self.group_per_minute if self.is_group(receiver) else self.user_per_minute
+            if per_minute <= 0:
+                return None
+            bucket = TokenBucket(per_minute)
+            self._buckets[receiver] = bucket
+        return bucket
+
+    def try_acquire(self, receiver: str, use_global: bool = True) -> float:
+        """
+        尝试为一条发往 receiver 的消息获取发送配额
+        :param receiver: 接收人wxid或者群id
+        :param use_global: 是否计入全局限额
+        :return: 0 表示已获取配额可立即发送；否则为需要推迟的秒数（此时不消耗任何配额）
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = [self._receiver_bucket(receiver)]
+            if use_global:
+                buckets.append(self._global)
+            buckets = [b for b in buckets if b is not None]
+
+            wait = max([b.wait_time(now) for b in buckets] or [0.0])
+            if wait > 0:
+                return wait
+            for b in buckets:
+                b.consume(now)
+            return 0.0
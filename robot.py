@@ -4,6 +4,7 @@ import logging
 import re
 import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import Future
 from queue import Empty
 from threading import Thread
 import os
@@ -23,6 +24,7 @@ from ai_providers.ai_deepseek import DeepSeek
 from ai_providers.ai_perplexity import Perplexity
 from function.func_chengyu import cy
 from function.func_weather import Weather
+from function.func_city import get_city_resolver
 from function.func_news import News
 from ai_providers.ai_tigerbot import TigerBot
 from ai_providers.ai_xinghuo_web import XinghuoWeb
@@ -32,6 +34,11 @@ from function.func_reminder import ReminderManager  # 导入ReminderManager类
 from configuration import Config
 from constants import ChatType
 from job_mgmt import Job
+from msg_dispatcher import MessageDispatcher
+from msg_sender import OutboundSender
+from rate_limiter import SendRateLimiter
+from contact_cache import ContactCache
+from db_manager import close_all_dbs
 from function.func_xml_process import XmlProcessor
 from function.func_goblin_gift import GoblinGiftManager
 
@@ -40,6 +47,7 @@ from commands.context import MessageContext
 from commands.router import CommandRouter
 from commands.registry import COMMANDS, get_commands_info
 from commands.handlers import handle_chitchat  # 导入闲聊处理函数
+from commands.triage import triage_message, ACTION_SKIP, ACTION_FRIEND_REQUEST, ACTION_SYSTEM
 
 __version__ = "39.2.4.0"
 
@@ -49,20 +57,29 @@ class Robot(Job):
     """
 
     def __init__(self, config: Config, wcf: Wcf, chat_type: int) -> None:
-        # 调用父类构造函数
-        super().__init__()
+        # 调用父类构造函数（定时任务线程池）
+        super().__init__(config.JOB_WORKERS)
         
         self.wcf = wcf
         self.config = config
         self.LOG = logging.getLogger("Robot")
         self.wxid = self.wcf.get_self_wxid()
         self.allContacts = self.getAllContacts()
-        self._msg_timestamps = []
+        # 群昵称 / 群成员缓存，在消息历史、预处理、发送@等环节共享
+        self.contact_cache = ContactCache(self.wcf)
+        # 发送限流：全局 / 每个群 / 每个私聊用户的令牌桶，超限的消息延后发送而不是丢弃
+        self.rate_limiter = SendRateLimiter(self.config.SEND_RATE_LIMIT,
+                                            self.config.SEND_RATE_LIMIT_PER_GROUP,
+                                            self.config.SEND_RATE_LIMIT_PER_USER)
+        # 发送队列：调用方入队后立即返回，由发送线程负责随机延迟、限流和实际发送
+        self.msg_sender = OutboundSender(self.rate_limiter)
+        self.msg_sender.start()
         # 创建决斗管理器
-        self.duel_manager = DuelManager(self.sendDuelMsg)
+        self.duel_manager = DuelManager(self.sendDuelMsg, self.config.DUEL_MAX_CONCURRENT, self.config.DUEL_QUEUE_SIZE)
         
         # 初始化消息总结功能
-        self.message_summary = MessageSummary(max_history=200)
+        self.message_summary = MessageSummary(max_history=200, contact_cache=self.contact_cache,
+                                              hot_cache_mb=self.config.MESSAGE_CACHE_MB)
         
         # 初始化XML处理器
         self.xml_processor = XmlProcessor(self.LOG)
@@ -180,6 +197,12 @@ class Robot(Job):
         self.command_router = CommandRouter(COMMANDS, robot_instance=self)
         self.LOG.info(f"命令路由系统初始化完成，共加载 {len(COMMANDS)} 条命令")
         
+        # 初始化消息调度器：按会话分片到多个工作线程，会话间并行、会话内有序
+        self.msg_dispatcher = MessageDispatcher(self.processMsg, self.config.MESSAGE_WORKERS)
+        
+        # 启动时构建城市索引，天气命令和定时天气预报共用
+        get_city_resolver()
+        
         # 初始化提醒管理器
         try:
             # 使用与MessageSummary相同的数据库路径
@@ -204,47 +227,45 @@ class Robot(Job):
         :param msg: 微信消息对象
         """
         try:
-            # 1. 使用MessageSummary记录消息(保持不变)
-            self.message_summary.process_message_from_wxmsg(msg, self.wcf, self.allContacts, self.wxid)
+            # 0. 消息分流：图片、语音、表情、未启用的群等无关消息直接跳过，不产生任何 wcf 调用
+            triage = triage_message(msg, self.config.GROUPS)
+            if triage.action == ACTION_SKIP:
+                self.LOG.debug(f"跳过消息 {msg.id}: {triage.reason}")
+                return
+                
+            # 0.1 好友请求自动处理
+            if triage.action == ACTION_FRIEND_REQUEST:
+                self.autoAcceptFriendRequest(msg)
+                return
+                
+            # 0.2 系统消息处理
+            if triage.action == ACTION_SYSTEM:
+                self.processSystemMsg(msg)
+                return
+            
+            # 1. 解析消息XML（引用、卡片等），每条消息只解析一次，后续环节共享结果
+            msg_data = self.xml_processor.parse_message(msg)
+            
+            # 1.1 使用MessageSummary记录消息
+            if triage.record_history:
+                self.message_summary.process_message_from_wxmsg(msg, self.wcf, self.allContacts, self.wxid, msg_data=msg_data)
             
             # 2. 根据消息来源选择使用的AI模型
-            self._select_model_for_message(msg)
+            # 多个工作线程并发处理消息，选定的模型只挂在本条消息的上下文上，不修改共享的 self.chat
+            chat_model = self._select_model_for_message(msg)
             
             # 3. 预处理消息，生成MessageContext
-            ctx = self.preprocess(msg)
+            ctx = self.preprocess(msg, msg_data)
             # 确保context能访问到当前选定的chat模型
-            setattr(ctx, 'chat', self.chat)
+            setattr(ctx, 'chat', chat_model)
             
             # 4. 使用命令路由器分发处理消息
             handled = self.command_router.dispatch(ctx)
             
-            # 5. 如果没有命令处理器处理，则进行特殊逻辑处理
+            # 5. 如果没有命令处理器处理，则进行闲聊
             if not handled:
-                # 5.1 好友请求自动处理
-                if msg.type == 37:  # 好友请求
-                    self.autoAcceptFriendRequest(msg)
-                    return
-                    
-                # 5.2 系统消息处理
-                elif msg.type == 10000:
-                    # 5.2.1 处理新成员入群
-                    if "加入了群聊" in msg.content and msg.from_group():
-                        new_member_match = re.search(r'"(.+?)"邀请"(.+?)"加入了群聊', msg.content)
-                        if new_member_match:
-                            inviter = new_member_match.group(1)  # 邀请人
-                            new_member = new_member_match.group(2)  # 新成员
-                            # 使用配置文件中的欢迎语，支持变量替换
-                            welcome_msg = self.config.WELCOME_MSG.format(new_member=new_member, inviter=inviter)
-                            self.sendTextMsg(welcome_msg, msg.roomid)
-                            self.LOG.info(f"已发送欢迎消息给新成员 {new_member} 在群 {msg.roomid}")
-                        return
-                    # 5.2.2 处理新好友添加
-                    elif "你已添加了" in msg.content:
-                        self.sayHiToNewFriend(msg)
-                        return
-                
-                # 5.3 群聊消息，且配置了响应该群
-                if msg.from_group() and msg.roomid in self.config.GROUPS:
+                # 5.1 群聊消息（分流阶段已确认该群已启用）
+                if msg.from_group():
                     # 如果在群里被@了，但命令路由器没有处理，则进行闲聊
                     if msg.is_at(self.wxid):
                         # 调用handle_chitchat函数处理闲聊
@@ -254,8 +275,8 @@ class Robot(Job):
                         # 成语功能已经通过命令路由器处理，这里不需要再处理
                         pass
                         
-                # 5.4 私聊消息，未被命令处理，进行闲聊
-                elif not msg.from_group() and not msg.from_self():
+                # 5.2 私聊消息，未被命令处理，进行闲聊
+                elif not msg.from_self():
                     # 检查是否是文本消息(type 1)或者是包含用户输入的类型49消息
                     if msg.type == 1 or (msg.type == 49 and ctx.text):
                         self.LOG.info(f"准备回复私聊消息: 类型={msg.type}, 文本内容='{ctx.text}'")
@@ -265,7 +286,29 @@ class Robot(Job):
         except Exception as e:
             self.LOG.error(f"处理消息时发生错误: {str(e)}", exc_info=True)
 
+    def processSystemMsg(self, msg: WxMsg) -> None:
+        """
+        处理系统消息（新成员入群、新好友添加）
+        :param msg: 微信消息对象
+        """
+        # 处理新成员入群
+        if "加入了群聊" in msg.content and msg.from_group():
+            # 群成员有变化（邀请、扫码等任何入群方式），清除该群的昵称缓存
+            self.contact_cache.invalidate_room(msg.roomid)
+            new_member_match = re.search(r'"(.+?)"邀请"(.+?)"加入了群聊', msg.content)
+            if new_member_match:
+                inviter = new_member_match.group(1)  # 邀请人
+                new_member = new_member_match.group(2)  # 新成员
+                # 使用配置文件中的欢迎语，支持变量替换
+                welcome_msg = self.config.WELCOME_MSG.format(new_member=new_member, inviter=inviter)
+                self.sendTextMsg(welcome_msg, msg.roomid)
+                self.LOG.info(f"已发送欢迎消息给新成员 {new_member} 在群 {msg.roomid}")
+        # 处理新好友添加
+        elif "你已添加了" in msg.content:
+            self.sayHiToNewFriend(msg)
+
     def enableRecvMsg(self) -> None:
+        self.msg_dispatcher.start()
         self.wcf.enable_recv_msg(self.onMsg)
 
     def enableReceivingMsg(self) -> None:
@@ -274,32 +317,31 @@ class Robot(Job):
                 try:
                     msg = wcf.get_msg()
                     self.LOG.info(msg)
-                    self.processMsg(msg)
+                    # 按会话分发到工作线程，避免一个慢请求阻塞所有群
+                    self.msg_dispatcher.submit(msg)
                 except Empty:
                     continue  # Empty message
                 except Exception as e:
                     self.LOG.error(f"Receiving message error: {e}")
 
         self.wcf.enable_receiving_msg()
+        self.msg_dispatcher.start()
         Thread(target=innerProcessMsg, name="GetMessage", args=(self.wcf,), daemon=True).start()
 
-    def sendTextMsg(self, msg: str, receiver: str, at_list: str = "") -> None:
-        """ 发送消息
+    def sendTextMsg(self, msg: str, receiver: str, at_list: str = "", callback=None) -> Future:
+        """ 发送消息（入队后立即返回，由发送线程按顺序发送）
         :param msg: 消息字符串
         :param receiver: 接收人wxid或者群id
         :param at_list: 要@的wxid, @所有人的wxid为：notify@all
+        :param callback: 可选，发送完成后的回调，参数为对应的 Future
+        :return: Future，结果为是否实际发送成功
         """
-        # 随机延迟0.3-1.3秒，并且一分钟内发送限制
-        time.sleep(float(str(time.time()).split('.')[-1][-2:]) / 100.0 + 0.3)
-        now = time.time()
-        if self.config.SEND_RATE_LIMIT > 0:
-            # 清除超过1分钟的记录
-            self._msg_timestamps = [t for t in self._msg_timestamps if now - t < 60]
-            if len(self._msg_timestamps) >= self.config.SEND_RATE_LIMIT:
-                self.LOG.warning(f"发送消息过快，已达到每分钟{self.config.SEND_RATE_LIMIT}条上限。")
-                return
-            self._msg_timestamps.append(now)
+        return self.msg_sender.submit(receiver, lambda: self._deliverTextMsg(msg, receiver, at_list), callback=callback)
 
+    def _deliverTextMsg(self, msg: str, receiver: str, at_list: str = "") -> bool:
+        """ 实际发送消息，在发送线程中执行（随机延迟和限流已由发送队列完成）
+        :return: 是否发送成功
+        """
         # msg 中需要有 @ 名单中一样数量的 @
         ats = ""
         if at_list:
@@ -309,15 +351,18 @@ class Robot(Job):
                 wxids = at_list.split(",")
                 for wxid in wxids:
                     # 根据 wxid 查找群昵称
-                    ats += f" @{self.wcf.get_alias_in_chatroom(wxid, receiver)}"
+                    ats += f" @{self.contact_cache.get_alias(wxid, receiver)}"
 
         # {msg}{ats} 表示要发送的消息内容后面紧跟@，例如 北京天气情况为：xxx @张三
         if ats == "":
             self.LOG.info(f"To {receiver}: {msg}")
-            self.wcf.send_text(f"{msg}", receiver, at_list)
+            status = self.wcf.send_text(f"{msg}", receiver, at_list)
         else:
             self.LOG.info(f"To {receiver}:\n{ats}\n{msg}")
-            self.wcf.send_text(f"{ats}\n\n{msg}", receiver, at_list)
+            status = self.wcf.send_text(f"{ats}\n\n{msg}", receiver, at_list)
+        if status != 0:
+            self.LOG.warning(f"发送消息到 {receiver} 失败，返回码: {status}")
+        return status == 0
 
     def getAllContacts(self) -> dict:
         """
@@ -331,9 +376,10 @@ class Robot(Job):
         """
         保持机器人运行，不让进程退出
         """
+        # 定时任务由调度线程按到期时间执行，主线程只负责保持进程
+        self.startJobs()
         while True:
-            self.runPendingJobs()
-            time.sleep(1)
+            time.sleep(3600)
 
     def autoAcceptFriendRequest(self, msg: WxMsg) -> None:
         try:
@@ -389,15 +435,23 @@ class Robot(Job):
         for r in receivers:
             self.sendTextMsg(report, r)
 
-    def sendDuelMsg(self, msg: str, receiver: str) -> None:
-        """发送决斗消息，不受消息频率限制，不记入历史记录
+    def sendDuelMsg(self, msg: str, receiver: str) -> Future:
+        """发送决斗消息，不计入全局频率限制，不记入历史记录
+        与普通消息共用发送队列以保证顺序，不加随机延迟（决斗本身有节奏控制），
+        但仍受该群自身的限流约束，避免刷屏
         :param msg: 消息字符串
         :param receiver: 接收人wxid或者群id
         """
-        try:
-            self.wcf.send_text(f"{msg}", receiver, "")
-        except Exception as e:
-            self.LOG.error(f"发送决斗消息失败: {e}")
+        def _send():
+            try:
+                status = self.wcf.send_text(f"{msg}", receiver, "")
+                if status != 0:
+                    self.LOG.warning(f"发送决斗消息到 {receiver} 失败，返回码: {status}")
+                return status == 0
+            except Exception as e:
+                self.LOG.error(f"发送决斗消息失败: {e}")
+                return False
+        return self.msg_sender.submit(receiver, _send, paced=False, use_global_limit=False)
 
     def cleanup_perplexity_threads(self):
         """清理所有Perplexity线程"""
@@ -408,7 +462,7 @@ class Robot(Job):
         
         # 检查并等待决斗线程结束
         if hasattr(self, 'duel_manager') and self.duel_manager.is_duel_running():
-            self.LOG.info("等待决斗线程结束...")
+            self.LOG.info("等待进行中的决斗结束...")
             # 最多等待5秒
             for i in range(5):
                 if not self.duel_manager.is_duel_running():
@@ -416,22 +470,46 @@ class Robot(Job):
                 time.sleep(1)
                 
             if self.duel_manager.is_duel_running():
-                self.LOG.warning("决斗线程在退出时仍在运行")
+                self.LOG.warning("退出时仍有决斗在进行")
             else:
-                self.LOG.info("决斗线程已结束")
+                self.LOG.info("决斗已全部结束")
                 
     def cleanup(self):
         """清理所有资源，在程序退出前调用"""
         self.LOG.info("开始清理机器人资源...")
         
+        # 停止消息调度器，处理完已入队的消息
+        if hasattr(self, 'msg_dispatcher') and self.msg_dispatcher:
+            self.LOG.info("正在停止消息调度器...")
+            self.msg_dispatcher.stop()
+        
         # 清理Perplexity线程
         self.cleanup_perplexity_threads()
         
+        # 停止定时任务调度，不等待正在执行的任务
+        self.stopJobs(wait=False)
+        
+        # 停止提醒调度线程
+        if hasattr(self, 'reminder_manager') and self.reminder_manager:
+            self.reminder_manager.stop()
+        
+        # 停止决斗解说线程
+        if hasattr(self, 'duel_manager') and self.duel_manager:
+            self.duel_manager.stop()
+        
+        # 发完队列中剩余的消息
+        if hasattr(self, 'msg_sender') and self.msg_sender:
+            self.LOG.info("正在发送队列中剩余的消息...")
+            self.msg_sender.stop()
+        
         # 关闭消息历史数据库连接
         if hasattr(self, 'message_summary') and self.message_summary:
             self.LOG.info("正在关闭消息历史数据库...")
             self.message_summary.close_db()
         
+        # 关闭所有线程的数据库连接（消息历史、提醒、决斗排位共用）
+        close_all_dbs()
+        
         self.LOG.info("机器人资源清理完成")
                 
     def get_perplexity_instance(self):
@@ -471,12 +549,15 @@ class Robot(Job):
         # 调用管理器的触发方法
         self.goblin_gift_manager.try_trigger(msg)
 
-    def _select_model_for_message(self, msg: WxMsg) -> None:
+    def _select_model_for_message(self, msg: WxMsg):
         """根据消息来源选择对应的AI模型
         :param msg: 接收到的消息
+        :return: 选定的AI模型实例，没有可用模型时返回 self.chat
         """
         if not hasattr(self, 'chat_models') or not self.chat_models:
-            return  # 没有可用模型，无需切换
+            return self.chat  # 没有可用模型，无需切换
+            
+        default_model = self.chat_models.get(self.default_model_id, self.chat)
             
         # 获取消息来源ID
         source_id = msg.roomid if msg.from_group() else msg.sender
@@ -484,9 +565,7 @@ class Robot(Job):
         # 检查配置
         if not hasattr(self.config, 'GROUP_MODELS'):
             # 没有配置，使用默认模型
-            if self.default_model_id in self.chat_models:
-                self.chat = self.chat_models[self.default_model_id]
-            return
+            return default_model
             
         # 群聊消息处理
         if msg.from_group():
@@ -495,15 +574,11 @@ class Robot(Job):
                 if mapping.get('room_id') == source_id:
                     model_id = mapping.get('model')
                     if model_id in self.chat_models:
-                        # 切换到指定模型
-                        if self.chat != self.chat_models[model_id]:
-                            self.chat = self.chat_models[model_id]
-                            self.LOG.info(f"已为群 {source_id} 切换到模型: {self.chat.__class__.__name__}")
-                    else:
-                        self.LOG.warning(f"群 {source_id} 配置的模型ID {model_id} 不可用，使用默认模型")
-                        if self.default_model_id in self.chat_models:
-                            self.chat = self.chat_models[self.default_model_id]
-                    return
+                        # 使用指定模型
+                        self.LOG.debug(f"群 {source_id} 使用模型: {self.chat_models[model_id].__class__.__name__}")
+                        return self.chat_models[model_id]
+                    self.LOG.warning(f"群 {source_id} 配置的模型ID {model_id} 不可用，使用默认模型")
+                    return default_model
         # 私聊消息处理
         else:
             private_mappings = self.config.GROUP_MODELS.get('private_mapping', [])
@@ -511,33 +586,30 @@ class Robot(Job):
                 if mapping.get('wxid') == source_id:
                     model_id = mapping.get('model')
                     if model_id in self.chat_models:
-                        # 切换到指定模型
-                        if self.chat != self.chat_models[model_id]:
-                            self.chat = self.chat_models[model_id]
-                            self.LOG.info(f"已为私聊用户 {source_id} 切换到模型: {self.chat.__class__.__name__}")
-                    else:
-                        self.LOG.warning(f"私聊用户 {source_id} 配置的模型ID {model_id} 不可用，使用默认模型")
-                        if self.default_model_id in self.chat_models:
-                            self.chat = self.chat_models[self.default_model_id]
-                    return
+                        # 使用指定模型
+                        self.LOG.debug(f"私聊用户 {source_id} 使用模型: {self.chat_models[model_id].__class__.__name__}")
+                        return self.chat_models[model_id]
+                    self.LOG.warning(f"私聊用户 {source_id} 配置的模型ID {model_id} 不可用，使用默认模型")
+                    return default_model
         
         # 如果没有找到对应配置，使用默认模型
-        if self.default_model_id in self.chat_models:
-            self.chat = self.chat_models[self.default_model_id]
+        return default_model
 
     def onMsg(self, msg: WxMsg) -> int:
         try:
             self.LOG.info(msg)
-            self.processMsg(msg)
+            # 与 enableReceivingMsg 一样交给调度器，按会话分片串行处理，不阻塞 wcf 回调线程
+            self.msg_dispatcher.submit(msg)
         except Exception as e:
             self.LOG.error(e)
 
         return 0
 
-    def preprocess(self, msg: WxMsg) -> MessageContext:
+    def preprocess(self, msg: WxMsg, msg_data: dict = None) -> MessageContext:
         """
         预处理消息，生成MessageContext对象
         :param msg: 微信消息对象
+        :param msg_data: XmlProcessor.parse_message 的解析结果，为空时按需解析
         :return: MessageContext对象
         """
         is_group = msg.from_group()
@@ -547,10 +619,8 @@ class Robot(Job):
         # 处理引用消息等特殊情况
         if msg.type == 49 and ("<title>" in msg.content or "<appmsg" in msg.content):
             # 尝试提取引用消息中的文本
-            if is_group:
-                msg_data = self.xml_processor.extract_quoted_message(msg)
-            else:
-                msg_data = self.xml_processor.extract_private_quoted_message(msg)
+            if msg_data is None:
+                msg_data = self.xml_processor.parse_message(msg, is_group)
                 
             if msg_data and msg_data.get("new_content"):
                 pure_text = msg_data["new_content"]
@@ -587,6 +657,8 @@ class Robot(Job):
             robot_wxid=self.wxid,
             robot=self,  # 传入Robot实例本身，便于handlers访问其方法
             logger=self.LOG,
+            contact_cache=self.contact_cache,
+            msg_data=msg_data,
             text=pure_text,
             is_group=is_group,
             is_at_bot=is_at_bot or (is_group and msg.is_at(self.wxid)),  # 确保is_at_bot正确